@@ -1,8 +1,13 @@
+import hashlib
+import json
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
 
+from services.model_router import model_router
+from services.multi_image import attribute_findings
+
 @dataclass
 class AgentResult:
     """Standard result format for all agents"""
@@ -13,6 +18,7 @@ class AgentResult:
     hazard_level: str
     metadata: Dict[str, Any]
     reasoning: str
+    raw_text: Optional[str] = None  # model output the result was scored from; kept out of to_dict
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert AgentResult to dictionary for JSON serialization"""
@@ -25,10 +31,25 @@ class AgentResult:
             'metadata': self.metadata,
             'reasoning': self.reasoning
         }
+        
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'AgentResult':
+        """Rebuild an AgentResult from its dictionary form (plus raw_text, if present)"""
+        return cls(**{field: data.get(field) for field in cls.__dataclass_fields__})
 
 class BaseAgent(ABC):
     """Base class for all ChemBio analysis agents"""
     
+    # Bump when result extraction or scoring code changes so cached results are not reused
+    LOGIC_VERSION = 1
+    
+    SESSION_CONTEXT_PROMPT = """
+        This frame continues a sequence from the same site. Already established in this session:
+        {summary}
+        Describe everything visible in this frame, and say explicitly which items are new or changed
+        compared with what is already established. Do not repeat established items that are not visible here.
+        """
+    
     def __init__(self, name: str):
         self.name = name
         self.logger = logging.getLogger(f"agent.{name}")
@@ -38,11 +59,60 @@ class BaseAgent(ABC):
         """Analyze scene data and return structured results"""
         pass
         
+    @abstractmethod
+    def score(self, analysis_text: str, scene_data: Dict[str, Any],
+              model: Optional[str] = None) -> AgentResult:
+        """Score raw model text into a result without calling the model"""
+        pass
+        
+    @property
+    def version(self) -> str:
+        """Hash of the logic version, indicator lists and prompt this agent's results depend on"""
+        version_data = json.dumps(
+            {'logic': self.LOGIC_VERSION, **self.version_inputs()}, sort_keys=True, default=str
+        )
+        return hashlib.sha256(version_data.encode()).hexdigest()[:16]
+        
+    def version_inputs(self) -> Dict[str, Any]:
+        """Indicator lists and prompts that shape this agent's results"""
+        return {'prompt': getattr(self, 'analysis_prompt', None)}
+        
+    def cache_inputs(self, scene_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Scene inputs besides the images that this agent's scoring reads; part of its cache key"""
+        return {}
+        
     def validate_input(self, scene_data: Dict[str, Any]) -> bool:
         """Validate input data before analysis"""
         required_fields = ['image_data', 'metadata']
         return all(field in scene_data for field in required_fields)
         
+    def analyze_scene_images(self, scene_data: Dict[str, Any], prompt: str, model: str) -> str:
+        """Send the scene's image, or every photo of a multi-image scene in one request"""
+        # Frames of an incrementally analyzed session are framed against what is already established
+        if scene_data.get('session_summary'):
+            prompt = prompt + self.SESSION_CONTEXT_PROMPT.format(summary=scene_data['session_summary'])
+            
+        images = scene_data.get('images') or []
+        if len(images) > 1:
+            return self.gemini_service.analyze_images_with_prompt(images, prompt, model)
+        return self.gemini_service.analyze_image_with_prompt(scene_data['image_data'], prompt, model)
+        
+    def image_attribution(self, analysis_text: str, findings: List[str]) -> Dict[str, Any]:
+        """Metadata attributing findings to the photos of a multi-image scene; empty otherwise"""
+        attribution = attribute_findings(analysis_text, findings)
+        return {'image_attribution': attribution} if attribution else {}
+        
+    def select_model(self, scene_data: Dict[str, Any]) -> str:
+        """Select the Gemini model for this agent's call on the given scene"""
+        if scene_data.get('model_override'):
+            return scene_data['model_override']
+            
+        return model_router.select_model(
+            self.name,
+            latency_budget=scene_data.get('latency_budget'),
+            complexity=scene_data.get('image_complexity')
+        )
+        
     def calculate_confidence(self, indicators: List[Dict[str, Any]]) -> float:
         """Calculate confidence score based on indicators"""
         if not indicators:
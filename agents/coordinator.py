@@ -1,33 +1,54 @@
+import hashlib
+import json
 import logging
-from typing import Dict, Any, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import wait, FIRST_COMPLETED
 import time
 
-from agents.hazard_agent import HazardDetectionAgent
-from agents.synthesis_agent import SynthesisAnalysisAgent
-from agents.mopp_agent import MOPPRecommendationAgent
-from agents.sampling_agent import SamplingStrategyAgent
 from agents.base_agent import AgentResult
+from agents.registry import agent_registry
+from services.model_router import model_router, PRO_MODEL
+from services.priority import Priority, agent_executor
+from services.agent_cache import agent_cache
+from services.quota_scheduler import get_request_context
+from services.session_context import frame_changed
+from services.speculation import speculative_runner
 
 class AgentCoordinator:
     """Coordinates multiple agents for comprehensive scene analysis"""
     
-    def __init__(self):
+    def __init__(self, registry=agent_registry):
         self.logger = logging.getLogger("coordinator")
-        self.agents = {
-            'hazard_detector': HazardDetectionAgent(),
-            'synthesis_analyzer': SynthesisAnalysisAgent(),
-            'mopp_recommender': MOPPRecommendationAgent(),
-            'sampling_strategist': SamplingStrategyAgent()
-        }
+        # Dependencies first, so the scheduler can release agents in a stable order
+        self.agent_order = registry.topological_order()
+        self.agents = registry.create_agents()
+        self.agent_specs = {name: registry.get(name) for name in self.agent_order}
+        self.confidence_weights = {name: spec.confidence_weight for name, spec in self.agent_specs.items()}
+        
+    def analyze_scene(self, scene_data: Dict[str, Any], agent_names: Optional[List[str]] = None,
+                      deadline: Optional[float] = None,
+                      previous: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Coordinate analysis across all agents (or the named subset)
         
-    def analyze_scene(self, scene_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Coordinate analysis across all agents"""
+        deadline, if given, is an absolute time.time() after which unfinished agents are reported as failed.
+        previous, the session's latest result per agent, lets agents whose inputs did not materially
+        change since that result keep it instead of re-running.
+        """
         start_time = time.time()
         
         try:
-            # Run all agents in parallel
-            agent_results = self._run_agents_parallel(scene_data)
+            # Run all agents, each as soon as its dependencies finish
+            agent_results, skipped_agents = self._run_agents_parallel(
+                scene_data, agent_names, deadline, previous=previous
+            )
+            
+            # Re-run uncertain flash results on the pro tier
+            escalated_results = self._escalate_low_confidence(scene_data, agent_results, deadline)
+            agent_results.update(escalated_results)
+            rerun_agents = self._rerun_dependents(
+                scene_data, agent_results, skipped_agents, list(escalated_results), deadline
+            )
             
             # Synthesize results
             synthesis = self._synthesize_results(agent_results)
@@ -47,10 +68,28 @@ class AgentCoordinator:
                 'synthesis': synthesis,
                 'unified_recommendations': unified_recommendations,
                 'overall_assessment': overall_assessment,
+                # Stored apart from the analysis for offline re-scoring; not part of the response
+                'raw_outputs': {
+                    name: {'model': result.metadata.get('model'), 'raw_text': result.raw_text}
+                    for name, result in agent_results.items() if result.raw_text is not None
+                },
                 'coordination_metadata': {
-                    'agents_used': list(self.agents.keys()),
+                    'agents_used': list(agent_results.keys()),
                     'successful_analyses': len([r for r in agent_results.values() if r.confidence > 0]),
-                    'failed_analyses': len([r for r in agent_results.values() if r.confidence == 0])
+                    'failed_analyses': len([r for r in agent_results.values() if r.confidence == 0]),
+                    'escalated_agents': list(escalated_results.keys()),
+                    'rerun_dependents': rerun_agents,
+                    'skipped_agents': skipped_agents,
+                    'cached_agents': [
+                        name for name, result in agent_results.items() if result.metadata.get('cached')
+                    ],
+                    'reused_agents': [
+                        name for name, result in agent_results.items() if result.metadata.get('reused')
+                    ],
+                    'agent_versions': {name: self.agents[name].version for name in agent_results},
+                    'models_used': {
+                        name: result.metadata.get('model') for name, result in agent_results.items()
+                    }
                 }
             }
             
@@ -58,29 +97,335 @@ class AgentCoordinator:
             self.logger.error(f"Error in scene analysis coordination: {str(e)}")
             return self._create_error_response(str(e))
             
-    def _run_agents_parallel(self, scene_data: Dict[str, Any]) -> Dict[str, AgentResult]:
-        """Run all agents in parallel for efficiency"""
+    def aggregate_results(self, agent_results: Dict[str, AgentResult]) -> Dict[str, Any]:
+        """Recompute synthesis, unified recommendations and overall assessment from agent results"""
+        return {
+            'synthesis': self._synthesize_results(agent_results),
+            'unified_recommendations': self._generate_unified_recommendations(agent_results),
+            'overall_assessment': self._calculate_overall_assessment(agent_results)
+        }
+        
+    def get_agent_versions(self) -> Dict[str, str]:
+        """Get the current version hash of every agent"""
+        return {name: agent.version for name, agent in self.agents.items()}
+        
+    def invalidate_cached_results(self, agent_name: Optional[str] = None, media_digest: Optional[str] = None,
+                                  stale_only: bool = False) -> int:
+        """Drop cached agent results; stale_only keeps entries for each agent's current version"""
+        agent_names = [agent_name] if agent_name else list(self.agents.keys())
+        return sum(
+            agent_cache.invalidate(
+                agent_name=name,
+                media_digest=media_digest,
+                keep_version=self.agents[name].version if stale_only else None
+            )
+            for name in agent_names
+        )
+        
+    def _run_agents_parallel(self, scene_data: Dict[str, Any],
+                             agent_names: Optional[List[str]] = None,
+                             deadline: Optional[float] = None,
+                             upstream: Optional[Dict[str, AgentResult]] = None,
+                             previous: Optional[Dict[str, Dict[str, Any]]] = None) -> Tuple[Dict[str, AgentResult], Dict[str, str]]:
+        """Run all agents (or the named subset) as a dependency DAG with maximal parallelism
+        
+        Each agent starts once the agents it depends on have finished and receives their results as
+        scene_data['upstream_results']. Dependencies outside the subset are taken from upstream.
+        Agents whose input signature matches their previous result reuse it, and agents with a cached
+        result for the same media and inputs take that.
+        Returns the agent results and the reasons for agents skipped by their gates.
+        """
         agent_results = {}
+        skipped_agents = {}
+        requested = set(agent_names or self.agent_order)
+        pending = [agent_name for agent_name in self.agent_order if agent_name in requested]
+        upstream = upstream or {}
+        previous = previous or {}
+        signatures = {}
+        agent_inputs = {}
         
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            # Submit all agent tasks
-            future_to_agent = {
-                executor.submit(agent.analyze, scene_data): agent_name
-                for agent_name, agent in self.agents.items()
-            }
+        # Results of unchanged agents on the same media are reused from the cache. Frames framed
+        # against a session summary report only what is new, so they neither use nor fill it.
+        media_digest = None if scene_data.get('session_summary') else agent_cache.media_digest(scene_data)
+        versions = {agent_name: self.agents[agent_name].version for agent_name in pending}
             
-            # Collect results as they complete
-            for future in as_completed(future_to_agent):
-                agent_name = future_to_agent[future]
+        # Agents share one executor across analyses, ordered by the request's priority class
+        priority = get_request_context().get('priority', Priority.COMMAND)
+        future_to_agent = {}
+        
+        while pending or future_to_agent:
+            # Release every agent whose in-subset dependencies have all finished
+            for agent_name in list(pending):
+                spec = self.agent_specs[agent_name]
+                if any(dependency in pending or dependency in future_to_agent.values()
+                       for dependency in spec.depends_on):
+                    continue
+                pending.remove(agent_name)
+                
+                available = dict(upstream, **agent_results)
+                skip_reason = self._check_gate(spec, scene_data, available)
+                if skip_reason:
+                    self.logger.info(f"Skipping agent {agent_name}: {skip_reason}")
+                    skipped_agents[agent_name] = skip_reason
+                    continue
+                    
+                # Session-incremental analysis: keep the last result if nothing it depends on changed
+                signature = self._input_signature(spec, scene_data, available)
+                reused = self._reuse_previous(previous.get(agent_name), signature)
+                if reused is not None:
+                    agent_results[agent_name] = reused
+                    continue
+                    
+                agent_data = dict(scene_data, upstream_results={
+                    dependency: available[dependency] for dependency in spec.depends_on if dependency in available
+                })
+                
+                if media_digest:
+                    cached = agent_cache.get(
+                        media_digest, agent_name, versions[agent_name],
+                        self._cache_signature(agent_name, agent_data, self.agents[agent_name].select_model(agent_data))
+                    )
+                    if cached is not None:
+                        cached.metadata['cached'] = True
+                        if signature:
+                            cached.metadata['input_signature'] = signature
+                        agent_results[agent_name] = cached
+                        continue
+                signatures[agent_name] = signature
+                agent_inputs[agent_name] = agent_data
+                
+                # Carry the caller's quota scheduling context into the worker thread
+                future = agent_executor.submit(
+                    priority, contextvars.copy_context().run, self.agents[agent_name].analyze, agent_data
+                )
+                future_to_agent[future] = agent_name
+                
+            if not future_to_agent:
+                continue
+                
+            timeout = max(0.0, deadline - time.time()) if deadline is not None else None
+            done, _ = wait(future_to_agent, timeout=timeout, return_when=FIRST_COMPLETED)
+            
+            if not done:
+                # Report stragglers and never-started dependents as failed; queued ones never start
+                for future, agent_name in future_to_agent.items():
+                    future.cancel()
+                    self.logger.warning(f"Agent {agent_name} missed the analysis deadline")
+                    agent_results[agent_name] = self._create_agent_error_result(agent_name, "Deadline exceeded")
+                for agent_name in pending:
+                    agent_results[agent_name] = self._create_agent_error_result(agent_name, "Deadline exceeded")
+                break
+                
+            for future in done:
+                agent_name = future_to_agent.pop(future)
                 try:
-                    result = future.result(timeout=30)  # 30 second timeout per agent
+                    result = future.result()
+                    if signatures.get(agent_name):
+                        result.metadata['input_signature'] = signatures[agent_name]
                     agent_results[agent_name] = result
                     self.logger.info(f"Agent {agent_name} completed analysis with confidence {result.confidence}")
+                    # Keyed by the model that actually ran, which may differ from the one looked up;
+                    # speculative work nobody has claimed yet leaves no cache entries behind
+                    if media_digest and result.metadata.get('model') and not speculative_runner.pending():
+                        agent_cache.put(
+                            media_digest, agent_name, versions[agent_name], result,
+                            self._cache_signature(agent_name, agent_inputs[agent_name], result.metadata['model'])
+                        )
                 except Exception as e:
                     self.logger.error(f"Agent {agent_name} failed: {str(e)}")
                     agent_results[agent_name] = self._create_agent_error_result(agent_name, str(e))
                     
-        return agent_results
+        return agent_results, skipped_agents
+        
+    def _check_gate(self, spec, scene_data: Dict[str, Any],
+                    available: Dict[str, AgentResult]) -> Optional[str]:
+        """Reason to skip an agent, or None if its inputs are present and its gate passes"""
+        missing_inputs = [field for field in spec.inputs if field not in scene_data]
+        if missing_inputs:
+            return f"Missing inputs: {', '.join(missing_inputs)}"
+            
+        if spec.gate is None:
+            return None
+            
+        try:
+            return spec.gate(available)
+        except Exception as e:
+            # A broken gate should not cost the analysis an agent
+            self.logger.error(f"Gate for agent {spec.name} failed: {str(e)}")
+            return None
+            
+    def _cache_signature(self, agent_name: str, agent_data: Dict[str, Any], model: str) -> str:
+        """Hash of what shapes an agent's result besides its media and version: model, scene and upstream inputs"""
+        inputs = {
+            'model': model,
+            'scene': self.agents[agent_name].cache_inputs(agent_data),
+            # Dependents are prompted with their dependencies' findings
+            'upstream': {
+                dependency: [result.hazard_level, result.findings, bool(result.metadata.get('error'))]
+                for dependency, result in agent_data.get('upstream_results', {}).items()
+            }
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()[:15]
+        
+    def _input_signature(self, spec, scene_data: Dict[str, Any],
+                         available: Dict[str, AgentResult]) -> Optional[Dict[str, Any]]:
+        """What an agent's result depends on: the frame and its upstream results; None outside incremental analysis"""
+        if not scene_data.get('frame_hash'):
+            return None
+            
+        return {
+            'frame': scene_data['frame_hash'],
+            'upstream': {
+                dependency: [available[dependency].hazard_level, round(available[dependency].confidence, 1)]
+                for dependency in spec.depends_on if dependency in available
+            }
+        }
+        
+    def _reuse_previous(self, previous_result: Optional[Dict[str, Any]],
+                        signature: Optional[Dict[str, Any]]) -> Optional[AgentResult]:
+        """The previous result if the agent's inputs have not materially changed since it was produced"""
+        if signature is None or not previous_result:
+            return None
+            
+        previous_signature = previous_result.get('metadata', {}).get('input_signature')
+        if not previous_signature or previous_signature.get('upstream') != signature['upstream']:
+            return None
+        if frame_changed(previous_signature.get('frame'), signature['frame']):
+            return None
+            
+        result = AgentResult.from_dict(previous_result)
+        result.metadata = dict(result.metadata, reused=True)
+        return result
+        
+    def update_session_assessment(self, state: Optional[Dict[str, Any]], agent_results: Dict[str, AgentResult],
+                                  frame_assessment: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Fold one frame into a session's running overall assessment
+        
+        The running confidence keeps each agent's latest weighted contribution, so only agents that
+        re-ran on this frame change it. Threat level and specialist teams accumulate across frames.
+        Returns the session assessment and the new state.
+        """
+        state = dict(state or {
+            'contributions': {},
+            'weighted_confidence': 0.0,
+            'total_weight': 0.0,
+            'threat_level': 'UNKNOWN',
+            'operation_type': 'UNKNOWN',
+            'specialist_teams_needed': [],
+            'frames': 0
+        })
+        contributions = dict(state['contributions'])
+        threat_priority = {'CRITICAL': 4, 'HIGH': 3, 'MODERATE': 2, 'LOW': 1, 'MINIMAL': 0, 'UNKNOWN': 0}
+        
+        for agent_name, result in agent_results.items():
+            if result.metadata.get('reused') or result.metadata.get('error'):
+                continue
+            previous = contributions.get(agent_name)
+            if previous:
+                state['weighted_confidence'] -= previous['confidence'] * previous['weight']
+                state['total_weight'] -= previous['weight']
+            weight = self.confidence_weights.get(agent_name, 1.0)
+            contributions[agent_name] = {'confidence': result.confidence, 'weight': weight}
+            state['weighted_confidence'] += result.confidence * weight
+            state['total_weight'] += weight
+        state['contributions'] = contributions
+        
+        frame_threat = frame_assessment.get('threat_level', 'UNKNOWN')
+        if threat_priority.get(frame_threat, 0) > threat_priority.get(state['threat_level'], 0):
+            state['threat_level'] = frame_threat
+        if frame_assessment.get('operation_type', 'UNKNOWN') != 'UNKNOWN':
+            state['operation_type'] = frame_assessment['operation_type']
+        for team in frame_assessment.get('specialist_teams_needed', []):
+            if team not in state['specialist_teams_needed']:
+                state['specialist_teams_needed'] = state['specialist_teams_needed'] + [team]
+        state['frames'] += 1
+        
+        overall_confidence = state['weighted_confidence'] / state['total_weight'] if state['total_weight'] > 0 else 0.0
+        assessment = {
+            'overall_confidence': overall_confidence,
+            'threat_level': state['threat_level'],
+            'operation_type': state['operation_type'],
+            'immediate_actions_required': (
+                state['threat_level'] in ['CRITICAL', 'HIGH'] or overall_confidence >= 0.8
+            ),
+            'specialist_teams_needed': list(state['specialist_teams_needed']),
+            'frames_analyzed': state['frames']
+        }
+        assessment['summary'] = (
+            f"Session Threat Level: {assessment['threat_level']} | "
+            f"Operation Type: {assessment['operation_type']} | "
+            f"Overall Confidence: {overall_confidence:.2f} | "
+            f"Frames: {state['frames']}"
+        )
+        
+        return assessment, state
+        
+    def _escalate_low_confidence(self, scene_data: Dict[str, Any],
+                                 agent_results: Dict[str, AgentResult],
+                                 deadline: Optional[float] = None) -> Dict[str, AgentResult]:
+        """Re-run agents whose flash-tier result has low confidence on the pro tier"""
+        # Escalate only if a pro call is expected to finish before the deadline
+        if deadline is not None and deadline - time.time() < model_router.expected_latency(PRO_MODEL):
+            return {}
+            
+        # Results reused from an earlier frame were already considered for escalation there
+        to_escalate = [
+            agent_name for agent_name, result in agent_results.items()
+            if not result.metadata.get('reused')
+            and model_router.should_escalate(result.metadata.get('model'), result.confidence)
+        ]
+        
+        if not to_escalate:
+            return {}
+            
+        self.logger.info(f"Escalating low-confidence agents to {PRO_MODEL}: {to_escalate}")
+        escalated_data = dict(scene_data, model_override=PRO_MODEL)
+        escalated_results, _ = self._run_agents_parallel(escalated_data, to_escalate, deadline, upstream=agent_results)
+        
+        # Keep the flash result when the pro re-run fails or misses the deadline
+        return {
+            agent_name: result for agent_name, result in escalated_results.items()
+            if not result.metadata.get('error')
+        }
+        
+    def _rerun_dependents(self, scene_data: Dict[str, Any], agent_results: Dict[str, AgentResult],
+                          skipped_agents: Dict[str, str], changed: List[str],
+                          deadline: Optional[float] = None) -> List[str]:
+        """Re-run agents downstream of replaced results, since they were built on the results replaced
+        
+        Updates agent_results and skipped_agents in place and returns the agents re-run. A dependent
+        whose re-run fails keeps its earlier result.
+        """
+        if not changed or (deadline is not None and time.time() >= deadline):
+            return []
+            
+        # Topological order makes this the transitive closure
+        dependents = []
+        for agent_name in self.agent_order:
+            if agent_name in changed or (agent_name not in agent_results and agent_name not in skipped_agents):
+                continue
+            if any(dependency in changed or dependency in dependents
+                   for dependency in self.agent_specs[agent_name].depends_on):
+                dependents.append(agent_name)
+                
+        if not dependents:
+            return []
+            
+        self.logger.info(f"Re-running dependents of escalated agents: {dependents}")
+        upstream = {name: result for name, result in agent_results.items() if name not in dependents}
+        rerun_results, rerun_skipped = self._run_agents_parallel(scene_data, dependents, deadline, upstream=upstream)
+        
+        rerun_agents = []
+        for agent_name in dependents:
+            if agent_name in rerun_skipped:
+                # The new upstream result no longer passes the gate
+                agent_results.pop(agent_name, None)
+                skipped_agents[agent_name] = rerun_skipped[agent_name]
+            elif agent_name in rerun_results and not rerun_results[agent_name].metadata.get('error'):
+                agent_results[agent_name] = rerun_results[agent_name]
+                skipped_agents.pop(agent_name, None)
+                rerun_agents.append(agent_name)
+        return rerun_agents
         
     def _synthesize_results(self, agent_results: Dict[str, AgentResult]) -> Dict[str, Any]:
         """Synthesize findings across all agents"""
@@ -90,6 +435,7 @@ class AgentCoordinator:
             'smoking_guns': [],
             'confidence_distribution': {},
             'hazard_level_consensus': 'UNKNOWN',
+            'cross_image_findings': [],
             'key_insights': []
         }
         
@@ -130,6 +476,16 @@ class AgentCoordinator:
                             'confidence': result.confidence
                         })
                         
+        # Findings confirmed in more than one photo of a multi-image scene
+        for agent_name, result in agent_results.items():
+            for finding, images in result.metadata.get('image_attribution', {}).items():
+                if len(images) >= 2:
+                    synthesis['cross_image_findings'].append({
+                        'agent': agent_name,
+                        'finding': finding,
+                        'images': images
+                    })
+                    
         # Determine hazard level consensus
         hazard_levels = [result.hazard_level for result in agent_results.values()]
         hazard_priority = {'CRITICAL': 4, 'HIGH': 3, 'MODERATE': 2, 'LOW': 1, 'MINIMAL': 0, 'UNKNOWN': 0}
@@ -202,18 +558,11 @@ class AgentCoordinator:
         }
         
         # Calculate overall confidence (weighted average)
-        weights = {
-            'hazard_detector': 1.5,
-            'synthesis_analyzer': 1.5,
-            'mopp_recommender': 1.0,
-            'sampling_strategist': 1.0
-        }
-        
         total_weighted_confidence = 0
         total_weight = 0
         
         for agent_name, result in agent_results.items():
-            weight = weights.get(agent_name, 1.0)
+            weight = self.confidence_weights.get(agent_name, 1.0)
             total_weighted_confidence += result.confidence * weight
             total_weight += weight
             
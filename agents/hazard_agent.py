@@ -1,11 +1,14 @@
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from agents.base_agent import BaseAgent, AgentResult
 from services.gemini_service import GeminiService
 
 class HazardDetectionAgent(BaseAgent):
     """Agent specialized in detecting chemical and biological hazards"""
     
+    # Findings mentioning these count as risk factors for the hazard level
+    RISK_FACTOR_KEYWORDS = ('toxic', 'explosive', 'corrosive', 'infectious')
+    
     def __init__(self):
         super().__init__("hazard_detector")
         self.gemini_service = GeminiService()
@@ -25,55 +28,7 @@ class HazardDetectionAgent(BaseAgent):
                 'emergency equipment', 'waste containers', 'decontamination areas'
             ]
         }
-        
-    def analyze(self, scene_data: Dict[str, Any]) -> AgentResult:
-        """Analyze scene for chemical and biological hazards"""
-        if not self.validate_input(scene_data):
-            return self._create_error_result("Invalid input data")
-            
-        try:
-            # Analyze image with Gemini for hazard detection
-            hazard_analysis = self._analyze_hazards(scene_data)
-            
-            # Extract specific hazard indicators
-            chemical_hazards = self._detect_chemical_hazards(hazard_analysis)
-            biological_hazards = self._detect_biological_hazards(hazard_analysis)
-            
-            # Combine findings
-            findings = chemical_hazards['findings'] + biological_hazards['findings']
-            recommendations = self._generate_recommendations(chemical_hazards, biological_hazards)
-            
-            # Calculate overall confidence
-            indicators = chemical_hazards['indicators'] + biological_hazards['indicators']
-            confidence = self.calculate_confidence(indicators)
-            
-            # Determine hazard level
-            risk_factors = [f for f in findings if any(keyword in f.lower() for keyword in ['toxic', 'explosive', 'corrosive', 'infectious'])]
-            hazard_level = self.determine_hazard_level(confidence, risk_factors)
-            
-            reasoning = self._build_reasoning(chemical_hazards, biological_hazards, confidence)
-            
-            return AgentResult(
-                agent_name=self.name,
-                confidence=confidence,
-                findings=findings,
-                recommendations=recommendations,
-                hazard_level=hazard_level,
-                metadata={
-                    'chemical_hazards': chemical_hazards,
-                    'biological_hazards': biological_hazards,
-                    'detection_methods': ['visual_analysis', 'pattern_recognition']
-                },
-                reasoning=reasoning
-            )
-            
-        except Exception as e:
-            self.logger.error(f"Error in hazard analysis: {str(e)}")
-            return self._create_error_result(f"Analysis failed: {str(e)}")
-            
-    def _analyze_hazards(self, scene_data: Dict[str, Any]) -> str:
-        """Use Gemini to analyze the scene for hazards"""
-        prompt = """
+        self.analysis_prompt = """
         Analyze this scene for chemical and biological hazards. Look for:
         
         CHEMICAL HAZARDS:
@@ -99,10 +54,70 @@ class HazardDetectionAgent(BaseAgent):
         Provide detailed observations about potential hazards, their locations, and severity indicators.
         """
         
+    def version_inputs(self) -> Dict[str, Any]:
+        """Indicator lists and prompts that shape this agent's results"""
+        return {'hazard_indicators': self.hazard_indicators, 'prompt': self.analysis_prompt}
+        
+    def analyze(self, scene_data: Dict[str, Any]) -> AgentResult:
+        """Analyze scene for chemical and biological hazards"""
+        if not self.validate_input(scene_data):
+            return self._create_error_result("Invalid input data")
+            
+        try:
+            # Route the model call to a tier for this scene
+            model = self.select_model(scene_data)
+            
+            # Analyze image with Gemini for hazard detection
+            analysis_text = self._analyze_hazards(scene_data, model)
+            
+            return self.score(analysis_text, scene_data, model)
+            
+        except Exception as e:
+            self.logger.error(f"Error in hazard analysis: {str(e)}")
+            return self._create_error_result(f"Analysis failed: {str(e)}")
+            
+    def score(self, analysis_text: str, scene_data: Dict[str, Any],
+              model: Optional[str] = None) -> AgentResult:
+        """Extract findings, confidence and hazard level from the model's analysis text"""
+        # Extract specific hazard indicators
+        chemical_hazards = self._detect_chemical_hazards(analysis_text)
+        biological_hazards = self._detect_biological_hazards(analysis_text)
+        
+        # Combine findings
+        findings = chemical_hazards['findings'] + biological_hazards['findings']
+        recommendations = self._generate_recommendations(chemical_hazards, biological_hazards)
+        
+        # Calculate overall confidence
+        indicators = chemical_hazards['indicators'] + biological_hazards['indicators']
+        confidence = self.calculate_confidence(indicators)
+        
+        # Determine hazard level
+        risk_factors = [f for f in findings if any(keyword in f.lower() for keyword in self.RISK_FACTOR_KEYWORDS)]
+        hazard_level = self.determine_hazard_level(confidence, risk_factors)
+        
+        reasoning = self._build_reasoning(chemical_hazards, biological_hazards, confidence)
+        
+        return AgentResult(
+            agent_name=self.name,
+            confidence=confidence,
+            findings=findings,
+            recommendations=recommendations,
+            hazard_level=hazard_level,
+            metadata={
+                'chemical_hazards': chemical_hazards,
+                'biological_hazards': biological_hazards,
+                'detection_methods': ['visual_analysis', 'pattern_recognition'],
+                'model': model,
+                **self.image_attribution(analysis_text, findings)
+            },
+            reasoning=reasoning,
+            raw_text=analysis_text
+        )
+        
+    def _analyze_hazards(self, scene_data: Dict[str, Any], model: str) -> str:
+        """Use Gemini to analyze the scene for hazards"""
         if scene_data.get('image_data'):
-            return self.gemini_service.analyze_image_with_prompt(
-                scene_data['image_data'], prompt
-            )
+            return self.analyze_scene_images(scene_data, self.analysis_prompt, model)
         else:
             return "No image data available for analysis"
             
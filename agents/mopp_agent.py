@@ -1,5 +1,5 @@
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from agents.base_agent import BaseAgent, AgentResult
 from services.gemini_service import GeminiService
 
@@ -41,62 +41,7 @@ class MOPPRecommendationAgent(BaseAgent):
                 'duration': 'Mission dependent - maximum protection'
             }
         }
-        
-    def analyze(self, scene_data: Dict[str, Any]) -> AgentResult:
-        """Analyze scene and provide MOPP recommendations"""
-        if not self.validate_input(scene_data):
-            return self._create_error_result("Invalid input data")
-            
-        try:
-            # Analyze threat level from scene
-            threat_analysis = self._analyze_threat_level(scene_data)
-            
-            # Assess environmental factors
-            environmental_factors = self._assess_environmental_factors(scene_data)
-            
-            # Determine MOPP level
-            mopp_level = self._determine_mopp_level(threat_analysis, environmental_factors)
-            
-            # Generate specific recommendations
-            recommendations = self._generate_mopp_recommendations(
-                mopp_level, threat_analysis, environmental_factors
-            )
-            
-            # Calculate confidence based on threat indicators
-            confidence = self._calculate_mopp_confidence(threat_analysis, environmental_factors)
-            
-            # Determine overall hazard level
-            hazard_level = self._determine_hazard_level_from_mopp(mopp_level)
-            
-            reasoning = self._build_mopp_reasoning(
-                mopp_level, threat_analysis, environmental_factors, confidence
-            )
-            
-            findings = self._generate_mopp_findings(threat_analysis, environmental_factors)
-            
-            return AgentResult(
-                agent_name=self.name,
-                confidence=confidence,
-                findings=findings,
-                recommendations=recommendations,
-                hazard_level=hazard_level,
-                metadata={
-                    'mopp_level': mopp_level,
-                    'threat_analysis': threat_analysis,
-                    'environmental_factors': environmental_factors,
-                    'equipment_required': self.mopp_levels[mopp_level]['equipment'],
-                    'duration_limit': self.mopp_levels[mopp_level]['duration']
-                },
-                reasoning=reasoning
-            )
-            
-        except Exception as e:
-            self.logger.error(f"Error in MOPP analysis: {str(e)}")
-            return self._create_error_result(f"Analysis failed: {str(e)}")
-            
-    def _analyze_threat_level(self, scene_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze the threat level from scene data"""
-        prompt = """
+        self.analysis_prompt = """
         Analyze this scene for chemical and biological threat indicators that would affect MOPP level decisions. Consider:
         
         IMMEDIATE THREATS:
@@ -123,14 +68,89 @@ class MOPPRecommendationAgent(BaseAgent):
         Assess the immediacy and severity of chemical/biological threats present.
         """
         
+    def version_inputs(self) -> Dict[str, Any]:
+        """Indicator lists and prompts that shape this agent's results"""
+        return {'mopp_levels': self.mopp_levels, 'prompt': self.analysis_prompt}
+        
+    def cache_inputs(self, scene_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Environmental factors read from the scene metadata adjust the MOPP level"""
+        return {'environmental_factors': self._assess_environmental_factors(scene_data)}
+        
+    def analyze(self, scene_data: Dict[str, Any]) -> AgentResult:
+        """Analyze scene and provide MOPP recommendations"""
+        if not self.validate_input(scene_data):
+            return self._create_error_result("Invalid input data")
+            
+        try:
+            # Route the model call to a tier for this scene
+            model = self.select_model(scene_data)
+            
+            # Analyze threat level from scene
+            analysis_text = self._analyze_threat_level(scene_data, model)
+            
+            return self.score(analysis_text, scene_data, model)
+            
+        except Exception as e:
+            self.logger.error(f"Error in MOPP analysis: {str(e)}")
+            return self._create_error_result(f"Analysis failed: {str(e)}")
+            
+    def score(self, analysis_text: str, scene_data: Dict[str, Any],
+              model: Optional[str] = None) -> AgentResult:
+        """Extract findings, confidence and hazard level from the model's analysis text"""
+        # Extract threat indicators
+        threat_analysis = self._summarize_threats(analysis_text)
+        
+        # Assess environmental factors
+        environmental_factors = self._assess_environmental_factors(scene_data)
+        
+        # Determine MOPP level
+        mopp_level = self._determine_mopp_level(threat_analysis, environmental_factors)
+        
+        # Generate specific recommendations
+        recommendations = self._generate_mopp_recommendations(
+            mopp_level, threat_analysis, environmental_factors
+        )
+        
+        # Calculate confidence based on threat indicators
+        confidence = self._calculate_mopp_confidence(threat_analysis, environmental_factors)
+        
+        # Determine overall hazard level
+        hazard_level = self._determine_hazard_level_from_mopp(mopp_level)
+        
+        reasoning = self._build_mopp_reasoning(
+            mopp_level, threat_analysis, environmental_factors, confidence
+        )
+        
+        findings = self._generate_mopp_findings(threat_analysis, environmental_factors)
+        
+        return AgentResult(
+            agent_name=self.name,
+            confidence=confidence,
+            findings=findings,
+            recommendations=recommendations,
+            hazard_level=hazard_level,
+            metadata={
+                'mopp_level': mopp_level,
+                'threat_analysis': threat_analysis,
+                'environmental_factors': environmental_factors,
+                'equipment_required': self.mopp_levels[mopp_level]['equipment'],
+                'duration_limit': self.mopp_levels[mopp_level]['duration'],
+                'model': model,
+                **self.image_attribution(analysis_text, findings)
+            },
+            reasoning=reasoning,
+            raw_text=analysis_text
+        )
+        
+    def _analyze_threat_level(self, scene_data: Dict[str, Any], model: str) -> str:
+        """Use Gemini to analyze the scene for threat indicators"""
         if scene_data.get('image_data'):
-            analysis_text = self.gemini_service.analyze_image_with_prompt(
-                scene_data['image_data'], prompt
-            )
+            return self.analyze_scene_images(scene_data, self.analysis_prompt, model)
         else:
-            analysis_text = "No image data available for threat analysis"
+            return "No image data available for threat analysis"
             
-        # Extract threat indicators
+    def _summarize_threats(self, analysis_text: str) -> Dict[str, Any]:
+        """Summarize threat indicators extracted from the analysis text"""
         threat_indicators = self._extract_threat_indicators(analysis_text)
         
         return {
@@ -0,0 +1,107 @@
+import importlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from agents.base_agent import BaseAgent, AgentResult
+from agents.hazard_agent import HazardDetectionAgent
+from agents.synthesis_agent import SynthesisAnalysisAgent
+from agents.mopp_agent import MOPPRecommendationAgent
+from agents.sampling_agent import SamplingStrategyAgent
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class AgentSpec:
+    """Declares an agent, the scene inputs it reads, its upstream agents and when it runs"""
+    name: str
+    factory: Callable[[], BaseAgent]
+    inputs: Tuple[str, ...] = ('image_data', 'metadata')
+    depends_on: Tuple[str, ...] = ()
+    # Given upstream results, returns a reason to skip the agent or None to run it
+    gate: Optional[Callable[[Dict[str, AgentResult]], Optional[str]]] = None
+    confidence_weight: float = 1.0
+
+class AgentRegistry:
+    """Registry of the agents the coordinator schedules"""
+
+    def __init__(self):
+        self._specs: Dict[str, AgentSpec] = {}
+
+    def register(self, spec: AgentSpec):
+        """Add or replace an agent"""
+        self._specs[spec.name] = spec
+
+    def unregister(self, name: str):
+        """Remove an agent"""
+        self._specs.pop(name, None)
+
+    def get(self, name: str) -> AgentSpec:
+        """Get an agent's spec"""
+        return self._specs[name]
+
+    def names(self) -> List[str]:
+        """Registered agent names in registration order"""
+        return list(self._specs.keys())
+
+    def confidence_weights(self) -> Dict[str, float]:
+        """Weight of each agent in the overall confidence average"""
+        return {name: spec.confidence_weight for name, spec in self._specs.items()}
+
+    def create_agents(self) -> Dict[str, BaseAgent]:
+        """Instantiate every registered agent, checking the dependency graph first"""
+        self.topological_order()
+        return {name: spec.factory() for name, spec in self._specs.items()}
+
+    def topological_order(self) -> List[str]:
+        """Agent names ordered so dependencies come first; raises ValueError on unknown or cyclic dependencies"""
+        order = []
+        state = {}
+
+        def visit(name: str, path: Tuple[str, ...]):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"Agent dependency cycle: {' -> '.join(path + (name,))}")
+            if name not in self._specs:
+                raise ValueError(f"Agent {path[-1]} depends on unknown agent {name}")
+
+            state[name] = 'visiting'
+            for dependency in self._specs[name].depends_on:
+                visit(dependency, path + (name,))
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self._specs:
+            visit(name, ())
+
+        return order
+
+    def load_plugins(self, modules: List[str]):
+        """Import plugin modules, which register their agents on import"""
+        for module in modules:
+            importlib.import_module(module)
+            logger.info(f"Loaded agent plugin {module}")
+
+def hazard_signal_present(upstream: Dict[str, AgentResult]) -> Optional[str]:
+    """Skip when the hazard detector ran cleanly and found nothing"""
+    hazard_result = upstream.get('hazard_detector')
+    if hazard_result is not None and not hazard_result.metadata.get('error') and hazard_result.confidence == 0:
+        return "No hazard indicators detected"
+    return None
+
+# Global agent registry instance
+agent_registry = AgentRegistry()
+agent_registry.register(AgentSpec('hazard_detector', HazardDetectionAgent, confidence_weight=1.5))
+agent_registry.register(AgentSpec('synthesis_analyzer', SynthesisAnalysisAgent, confidence_weight=1.5))
+agent_registry.register(AgentSpec('mopp_recommender', MOPPRecommendationAgent))
+agent_registry.register(AgentSpec(
+    'sampling_strategist', SamplingStrategyAgent,
+    depends_on=('hazard_detector',), gate=hazard_signal_present
+))
+
+# Comma-separated modules that register additional agents
+agent_registry.load_plugins([
+    module.strip() for module in os.environ.get("CHEMVIO_AGENT_PLUGINS", "").split(",") if module.strip()
+])
@@ -1,11 +1,14 @@
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from agents.base_agent import BaseAgent, AgentResult
 from services.gemini_service import GeminiService
 
 class SamplingStrategyAgent(BaseAgent):
     """Agent specialized in providing sampling strategy recommendations"""
     
+    # Bumped when the prompt started including upstream hazard findings
+    LOGIC_VERSION = 2
+    
     def __init__(self):
         super().__init__("sampling_strategist")
         self.gemini_service = GeminiService()
@@ -35,64 +38,7 @@ class SamplingStrategyAgent(BaseAgent):
                 'urgency': 'within 24 hours'
             }
         }
-        
-    def analyze(self, scene_data: Dict[str, Any]) -> AgentResult:
-        """Analyze scene and provide sampling strategy recommendations"""
-        if not self.validate_input(scene_data):
-            return self._create_error_result("Invalid input data")
-            
-        try:
-            # Analyze sampling targets
-            sampling_analysis = self._analyze_sampling_targets(scene_data)
-            
-            # Identify sampling priorities
-            priority_targets = self._identify_priority_targets(sampling_analysis)
-            
-            # Generate sampling strategy
-            sampling_strategy = self._generate_sampling_strategy(priority_targets)
-            
-            # Assess sampling risks
-            risk_assessment = self._assess_sampling_risks(sampling_analysis)
-            
-            # Generate recommendations
-            recommendations = self._generate_sampling_recommendations(
-                sampling_strategy, risk_assessment
-            )
-            
-            # Calculate confidence
-            confidence = self._calculate_sampling_confidence(priority_targets, risk_assessment)
-            
-            # Determine hazard level
-            hazard_level = self._determine_sampling_hazard_level(risk_assessment)
-            
-            reasoning = self._build_sampling_reasoning(
-                priority_targets, risk_assessment, confidence
-            )
-            
-            findings = self._generate_sampling_findings(priority_targets, risk_assessment)
-            
-            return AgentResult(
-                agent_name=self.name,
-                confidence=confidence,
-                findings=findings,
-                recommendations=recommendations,
-                hazard_level=hazard_level,
-                metadata={
-                    'sampling_strategy': sampling_strategy,
-                    'priority_targets': priority_targets,
-                    'risk_assessment': risk_assessment,
-                    'sampling_sequence': self._create_sampling_sequence(priority_targets)
-                },
-                reasoning=reasoning
-            )
-            
-        except Exception as e:
-            self.logger.error(f"Error in sampling analysis: {str(e)}")
-            return self._create_error_result(f"Analysis failed: {str(e)}")
-            
-    def _analyze_sampling_targets(self, scene_data: Dict[str, Any]) -> str:
-        """Analyze the scene for sampling targets"""
-        prompt = """
+        self.analysis_prompt = """
         Analyze this scene to identify sampling targets and priorities. Look for:
         
         CRITICAL SAMPLING TARGETS:
@@ -130,13 +76,96 @@ class SamplingStrategyAgent(BaseAgent):
         Provide detailed information about each sampling target, location, and recommended sampling approach.
         """
         
+    def version_inputs(self) -> Dict[str, Any]:
+        """Indicator lists and prompts that shape this agent's results"""
+        return {'sampling_priorities': self.sampling_priorities, 'prompt': self.analysis_prompt}
+        
+    def analyze(self, scene_data: Dict[str, Any]) -> AgentResult:
+        """Analyze scene and provide sampling strategy recommendations"""
+        if not self.validate_input(scene_data):
+            return self._create_error_result("Invalid input data")
+            
+        try:
+            # Route the model call to a tier for this scene
+            model = self.select_model(scene_data)
+            
+            # Analyze sampling targets
+            analysis_text = self._analyze_sampling_targets(scene_data, model)
+            
+            return self.score(analysis_text, scene_data, model)
+            
+        except Exception as e:
+            self.logger.error(f"Error in sampling analysis: {str(e)}")
+            return self._create_error_result(f"Analysis failed: {str(e)}")
+            
+    def score(self, analysis_text: str, scene_data: Dict[str, Any],
+              model: Optional[str] = None) -> AgentResult:
+        """Extract findings, confidence and hazard level from the model's analysis text"""
+        # Identify sampling priorities
+        priority_targets = self._identify_priority_targets(analysis_text)
+        
+        # Generate sampling strategy
+        sampling_strategy = self._generate_sampling_strategy(priority_targets)
+        
+        # Assess sampling risks
+        risk_assessment = self._assess_sampling_risks(analysis_text)
+        
+        # Generate recommendations
+        recommendations = self._generate_sampling_recommendations(
+            sampling_strategy, risk_assessment
+        )
+        
+        # Calculate confidence
+        confidence = self._calculate_sampling_confidence(priority_targets, risk_assessment)
+        
+        # Determine hazard level
+        hazard_level = self._determine_sampling_hazard_level(risk_assessment)
+        
+        reasoning = self._build_sampling_reasoning(
+            priority_targets, risk_assessment, confidence
+        )
+        
+        findings = self._generate_sampling_findings(priority_targets, risk_assessment)
+        
+        return AgentResult(
+            agent_name=self.name,
+            confidence=confidence,
+            findings=findings,
+            recommendations=recommendations,
+            hazard_level=hazard_level,
+            metadata={
+                'sampling_strategy': sampling_strategy,
+                'priority_targets': priority_targets,
+                'risk_assessment': risk_assessment,
+                'sampling_sequence': self._create_sampling_sequence(priority_targets),
+                'model': model,
+                **self.image_attribution(analysis_text, findings)
+            },
+            reasoning=reasoning,
+            raw_text=analysis_text
+        )
+        
+    def _analyze_sampling_targets(self, scene_data: Dict[str, Any], model: str) -> str:
+        """Analyze the scene for sampling targets"""
         if scene_data.get('image_data'):
-            return self.gemini_service.analyze_image_with_prompt(
-                scene_data['image_data'], prompt
-            )
+            return self.analyze_scene_images(scene_data, self._build_prompt(scene_data), model)
         else:
             return "No image data available for sampling analysis"
             
+    def _build_prompt(self, scene_data: Dict[str, Any]) -> str:
+        """Add the hazard detector's findings, when available, to focus the sampling analysis"""
+        hazard_result = scene_data.get('upstream_results', {}).get('hazard_detector')
+        if hazard_result is None or hazard_result.metadata.get('error') or not hazard_result.findings:
+            return self.analysis_prompt
+            
+        hazard_findings = "\n".join(f"- {finding}" for finding in hazard_result.findings)
+        return (
+            f"{self.analysis_prompt}\n"
+            f"Hazards already identified in this scene ({hazard_result.hazard_level}):\n"
+            f"{hazard_findings}\n"
+            "Prioritize sampling targets associated with these hazards."
+        )
+        
     def _identify_priority_targets(self, sampling_analysis: str) -> Dict[str, List[Dict[str, Any]]]:
         """Identify and categorize sampling targets by priority"""
         targets = {
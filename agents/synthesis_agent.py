@@ -1,5 +1,5 @@
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from agents.base_agent import BaseAgent, AgentResult
 from services.gemini_service import GeminiService
 
@@ -29,65 +29,7 @@ class SynthesisAnalysisAgent(BaseAgent):
                 'precursor diversion', 'waste disposal', 'chemical waste'
             ]
         }
-        
-    def analyze(self, scene_data: Dict[str, Any]) -> AgentResult:
-        """Analyze scene for chemical synthesis operations"""
-        if not self.validate_input(scene_data):
-            return self._create_error_result("Invalid input data")
-            
-        try:
-            # Analyze image with Gemini for synthesis indicators
-            synthesis_analysis = self._analyze_synthesis_operation(scene_data)
-            
-            # Extract synthesis indicators
-            equipment_found = self._detect_synthesis_equipment(synthesis_analysis)
-            precursors_found = self._detect_precursor_chemicals(synthesis_analysis)
-            processes_found = self._detect_synthesis_processes(synthesis_analysis)
-            illicit_indicators = self._detect_illicit_indicators(synthesis_analysis)
-            
-            # Combine findings
-            findings = (equipment_found['findings'] + precursors_found['findings'] + 
-                       processes_found['findings'] + illicit_indicators['findings'])
-                       
-            recommendations = self._generate_synthesis_recommendations(
-                equipment_found, precursors_found, processes_found, illicit_indicators
-            )
-            
-            # Calculate overall confidence
-            all_indicators = (equipment_found['indicators'] + precursors_found['indicators'] + 
-                            processes_found['indicators'] + illicit_indicators['indicators'])
-            confidence = self.calculate_confidence(all_indicators)
-            
-            # Determine synthesis threat level
-            threat_level = self._determine_synthesis_threat(confidence, illicit_indicators)
-            
-            reasoning = self._build_synthesis_reasoning(
-                equipment_found, precursors_found, processes_found, illicit_indicators, confidence
-            )
-            
-            return AgentResult(
-                agent_name=self.name,
-                confidence=confidence,
-                findings=findings,
-                recommendations=recommendations,
-                hazard_level=threat_level,
-                metadata={
-                    'equipment_detected': equipment_found,
-                    'precursors_detected': precursors_found,
-                    'processes_detected': processes_found,
-                    'illicit_indicators': illicit_indicators,
-                    'synthesis_complexity': self._assess_complexity(equipment_found, processes_found)
-                },
-                reasoning=reasoning
-            )
-            
-        except Exception as e:
-            self.logger.error(f"Error in synthesis analysis: {str(e)}")
-            return self._create_error_result(f"Analysis failed: {str(e)}")
-            
-    def _analyze_synthesis_operation(self, scene_data: Dict[str, Any]) -> str:
-        """Use Gemini to analyze the scene for synthesis operations"""
-        prompt = """
+        self.analysis_prompt = """
         Analyze this scene for chemical synthesis operations. Look for:
         
         SYNTHESIS EQUIPMENT:
@@ -121,10 +63,80 @@ class SynthesisAnalysisAgent(BaseAgent):
         Provide detailed observations about the synthesis operation, equipment sophistication, and potential products.
         """
         
+    def version_inputs(self) -> Dict[str, Any]:
+        """Indicator lists and prompts that shape this agent's results"""
+        return {'synthesis_indicators': self.synthesis_indicators, 'prompt': self.analysis_prompt}
+        
+    def analyze(self, scene_data: Dict[str, Any]) -> AgentResult:
+        """Analyze scene for chemical synthesis operations"""
+        if not self.validate_input(scene_data):
+            return self._create_error_result("Invalid input data")
+            
+        try:
+            # Route the model call to a tier for this scene
+            model = self.select_model(scene_data)
+            
+            # Analyze image with Gemini for synthesis indicators
+            analysis_text = self._analyze_synthesis_operation(scene_data, model)
+            
+            return self.score(analysis_text, scene_data, model)
+            
+        except Exception as e:
+            self.logger.error(f"Error in synthesis analysis: {str(e)}")
+            return self._create_error_result(f"Analysis failed: {str(e)}")
+            
+    def score(self, analysis_text: str, scene_data: Dict[str, Any],
+              model: Optional[str] = None) -> AgentResult:
+        """Extract findings, confidence and hazard level from the model's analysis text"""
+        # Extract synthesis indicators
+        equipment_found = self._detect_synthesis_equipment(analysis_text)
+        precursors_found = self._detect_precursor_chemicals(analysis_text)
+        processes_found = self._detect_synthesis_processes(analysis_text)
+        illicit_indicators = self._detect_illicit_indicators(analysis_text)
+        
+        # Combine findings
+        findings = (equipment_found['findings'] + precursors_found['findings'] + 
+                   processes_found['findings'] + illicit_indicators['findings'])
+                   
+        recommendations = self._generate_synthesis_recommendations(
+            equipment_found, precursors_found, processes_found, illicit_indicators
+        )
+        
+        # Calculate overall confidence
+        all_indicators = (equipment_found['indicators'] + precursors_found['indicators'] + 
+                        processes_found['indicators'] + illicit_indicators['indicators'])
+        confidence = self.calculate_confidence(all_indicators)
+        
+        # Determine synthesis threat level
+        threat_level = self._determine_synthesis_threat(confidence, illicit_indicators)
+        
+        reasoning = self._build_synthesis_reasoning(
+            equipment_found, precursors_found, processes_found, illicit_indicators, confidence
+        )
+        
+        return AgentResult(
+            agent_name=self.name,
+            confidence=confidence,
+            findings=findings,
+            recommendations=recommendations,
+            hazard_level=threat_level,
+            metadata={
+                'equipment_detected': equipment_found,
+                'precursors_detected': precursors_found,
+                'processes_detected': processes_found,
+                'illicit_indicators': illicit_indicators,
+                'synthesis_complexity': self._assess_complexity(equipment_found, processes_found),
+                'model': model,
+                **self.image_attribution(analysis_text, findings)
+            },
+            reasoning=reasoning,
+            raw_text=analysis_text
+        )
+        
+    def _analyze_synthesis_operation(self, scene_data: Dict[str, Any], model: str) -> str:
+        """Use Gemini to analyze the scene for synthesis operations"""
         if scene_data.get('image_data'):
-            return self.gemini_service.analyze_image_with_prompt(
-                scene_data['image_data'], prompt
-            )
+            return self.analyze_scene_images(scene_data, self.analysis_prompt, model)
         else:
             return "No image data available for analysis"
             
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Batch analysis command-line entry point
+
+Usage:
+    python batch_cli.py <directory|manifest>
+    python batch_cli.py --resume <batch_id>
+"""
+import argparse
+import sys
+
+from app import app
+from services.analysis_service import AnalysisService
+from services.batch_service import BatchService
+
+def print_progress(progress):
+    """Print a single-line progress report"""
+    counts = progress['item_counts']
+    done = counts['completed'] + counts['failed']
+    line = f"[batch {progress['batch_id']}] {done}/{progress['total_items']} done ({counts['failed']} failed)"
+    
+    if progress.get('throughput_per_minute'):
+        line += f" | {progress['throughput_per_minute']:.1f} items/min"
+    if progress.get('eta_seconds') is not None:
+        line += f" | ETA {progress['eta_seconds'] / 60:.1f} min"
+        
+    print(line, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a directory or manifest of evidence files")
+    parser.add_argument('source', nargs='?', help="Directory of media files or JSON/JSONL manifest")
+    parser.add_argument('--resume', type=int, metavar='BATCH_ID', help="Resume an interrupted batch")
+    parser.add_argument('--session', help="Session ID to store results under")
+    args = parser.parse_args()
+    
+    if not args.source and not args.resume:
+        parser.error("a source or --resume BATCH_ID is required")
+        
+    with app.app_context():
+        batch_service = BatchService(AnalysisService())
+        
+        if args.resume:
+            batch_id = args.resume
+        else:
+            batch = batch_service.create_batch(args.source, session_id=args.session)
+            batch_id = batch.id
+            print(f"Created batch {batch_id} with {batch.total_items} items")
+            
+        try:
+            progress = batch_service.run_batch(batch_id, progress_callback=print_progress)
+        except KeyboardInterrupt:
+            print(f"\nInterrupted; resume with: python batch_cli.py --resume {batch_id}")
+            return 130
+            
+        print_progress(progress)
+        return 0 if progress['item_counts']['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Embedding encoder command-line entry point
+
+Usage:
+    python embedding_cli.py export [--output DIR]
+    python embedding_cli.py benchmark [--corpus file.jsonl|directory] [--queries FILE] [--k 5]
+    python embedding_cli.py serve [--socket PATH]
+
+Set EMBEDDING_BACKEND=onnx to serve the exported encoder once the benchmark recall is acceptable.
+Set EMBEDDING_SERVER_SOCKET in the workers' environment to share one served encoder per host.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from services.knowledge_ingest import KnowledgeIngestor, chunk_document
+from services.embedding_server import (EMBEDDING_SERVER_MAX_BATCH, EMBEDDING_SERVER_SOCKET,
+                                       EMBEDDING_SERVER_WINDOW_MS, EmbeddingServer)
+from services.onnx_encoder import EMBEDDING_ONNX_DIR, OnnxEmbeddingEncoder, export_quantized_model
+from services.vector_db import AGENT_QUERIES, EMBEDDING_MODEL, VectorDatabase, load_local_encoder
+
+def load_corpus(source):
+    """Chunk texts of a JSONL file or directory, or of the documents already in the knowledge base"""
+    if source:
+        ingestor = KnowledgeIngestor(vector_db=None)
+        return [chunk['content'] for document in ingestor.iter_documents(source)
+                for chunk in chunk_document(document)]
+    
+    vector_db = VectorDatabase()
+    texts = []
+    for collection in (vector_db.chemvio_collection, vector_db.tactical_collection, vector_db.hazmat_collection):
+        texts.extend(collection.get(include=['documents'])['documents'])
+    return texts
+
+def load_queries(path):
+    """Queries from a file, one per line, or the agent domain queries"""
+    if path:
+        with open(path, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    return [query for queries in AGENT_QUERIES.values() for query in queries]
+
+def measure(encoder, corpus, queries, batch_size, repeats):
+    """Corpus throughput, single-query latency and the embeddings of both"""
+    encoder.encode(queries[:1])  # Warm up
+    
+    started = time.perf_counter()
+    corpus_embeddings = np.asarray(encoder.encode(corpus, batch_size=batch_size))
+    throughput = len(corpus) / (time.perf_counter() - started)
+    
+    latencies = []
+    for _ in range(repeats):
+        for query in queries:
+            started = time.perf_counter()
+            encoder.encode([query])
+            latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    
+    return {
+        'throughput_texts_per_second': round(throughput, 1),
+        'latency_ms_p50': round(statistics.median(latencies), 2),
+        'latency_ms_p95': round(latencies[int(len(latencies) * 0.95) - 1], 2)
+    }, corpus_embeddings, np.asarray(encoder.encode(queries, batch_size=batch_size))
+
+def top_k(query_embeddings, corpus_embeddings, k):
+    """Indices of each query's k nearest corpus texts by cosine similarity"""
+    corpus = corpus_embeddings / np.linalg.norm(corpus_embeddings, axis=1, keepdims=True)
+    queries = query_embeddings / np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+    return np.argsort(-(queries @ corpus.T), axis=1)[:, :k]
+
+def recall_at_k(expected, found):
+    """Mean fraction of the expected neighbours that were found"""
+    return round(float(np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(expected, found)])), 4)
+
+def benchmark(args):
+    """Compare the ONNX encoder against the SentenceTransformer encoder"""
+    from sentence_transformers import SentenceTransformer
+    
+    corpus = load_corpus(args.corpus)
+    queries = load_queries(args.queries)
+    k = min(args.k, len(corpus))
+    print(f"Benchmarking on {len(corpus)} texts and {len(queries)} queries, k={k}", flush=True)
+    
+    baseline_stats, baseline_corpus, baseline_queries = measure(
+        SentenceTransformer(EMBEDDING_MODEL, device='cpu'), corpus, queries, args.batch_size, args.repeats
+    )
+    onnx_stats, onnx_corpus, onnx_queries = measure(
+        OnnxEmbeddingEncoder(args.model_dir), corpus, queries, args.batch_size, args.repeats
+    )
+    
+    expected = top_k(baseline_queries, baseline_corpus, k)
+    report = {
+        'corpus_size': len(corpus),
+        'queries': len(queries),
+        'k': k,
+        'sentence_transformers': baseline_stats,
+        'onnx_int8': {
+            **onnx_stats,
+            # Both sides re-embedded with ONNX, as after re-ingesting the knowledge base
+            f'recall_at_{k}': recall_at_k(expected, top_k(onnx_queries, onnx_corpus, k)),
+            # ONNX queries against the existing PyTorch-embedded collections
+            f'recall_at_{k}_existing_index': recall_at_k(expected, top_k(onnx_queries, baseline_corpus, k))
+        }
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+def serve(args):
+    """Run the shared embedding server with the configured backend"""
+    encoder, backend = load_local_encoder()
+    if encoder is None:
+        print("No embedding encoder available; install sentence-transformers or export the ONNX encoder")
+        return 1
+        
+    server = EmbeddingServer(
+        encoder, backend, getattr(encoder, 'model_name', EMBEDDING_MODEL), args.socket,
+        max_batch=args.max_batch, window_ms=args.window_ms
+    )
+    print(f"Serving {backend} embeddings on {args.socket}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nStopped after {server.batcher.get_stats()['batches']} batches")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, benchmark and serve the embedding encoder")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    export_parser = subparsers.add_parser('export', help="Export and quantize the encoder (needs PyTorch)")
+    export_parser.add_argument('--model', default=EMBEDDING_MODEL, help="SentenceTransformer model to export")
+    export_parser.add_argument('--output', default=EMBEDDING_ONNX_DIR, help="Directory to write the export to")
+    
+    benchmark_parser = subparsers.add_parser('benchmark', help="Compare throughput, latency and recall@k")
+    benchmark_parser.add_argument('--corpus', help="JSONL file or directory; defaults to the knowledge base")
+    benchmark_parser.add_argument('--queries', help="File of queries, one per line; defaults to agent queries")
+    benchmark_parser.add_argument('--model-dir', default=EMBEDDING_ONNX_DIR, help="Directory of the ONNX export")
+    benchmark_parser.add_argument('--k', type=int, default=5, help="Neighbours compared for recall@k")
+    benchmark_parser.add_argument('--batch-size', type=int, default=64, help="Texts per encoder call")
+    benchmark_parser.add_argument('--repeats', type=int, default=5, help="Passes over the queries for latency")
+    
+    serve_parser = subparsers.add_parser('serve', help="Share one encoder between workers over a Unix socket")
+    serve_parser.add_argument('--socket', default=EMBEDDING_SERVER_SOCKET or '/tmp/chemvio-embeddings.sock',
+                              help="Unix socket to listen on")
+    serve_parser.add_argument('--window-ms', type=float, default=EMBEDDING_SERVER_WINDOW_MS,
+                              help="How long a request waits for others to batch with")
+    serve_parser.add_argument('--max-batch', type=int, default=EMBEDDING_SERVER_MAX_BATCH,
+                              help="Texts per micro-batch")
+    args = parser.parse_args()
+    
+    if args.command == 'export':
+        print(f"Wrote {export_quantized_model(args.model, args.output)}")
+        return 0
+    if args.command == 'serve':
+        return serve(args)
+    return benchmark(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
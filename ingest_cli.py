@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Knowledge base ingestion command-line entry point
+
+Usage:
+    python ingest_cli.py <file.jsonl|directory> [--category CATEGORY]
+    python ingest_cli.py <file.jsonl|directory> --restart
+"""
+import argparse
+import sys
+
+from services.knowledge_ingest import (INGEST_BATCH_SIZE, INGEST_CHUNK_OVERLAP, INGEST_CHUNK_SIZE,
+                                       KnowledgeIngestor)
+from services.vector_db import VectorDatabase
+
+def print_progress(progress):
+    """Print a single-line progress report"""
+    line = f"[ingest] {progress['documents']} documents, {progress['chunks']} chunks"
+    
+    if progress.get('chunks_per_second'):
+        line += f" | {progress['chunks_per_second']:.1f} chunks/s"
+    if progress.get('invalid_records'):
+        line += f" | {progress['invalid_records']} invalid records skipped"
+    
+    print(line, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a JSONL file or directory of documents into the knowledge base")
+    parser.add_argument('source', help="JSONL/JSON file of records, or directory of .txt/.md/.json/.jsonl files")
+    parser.add_argument('--category', help="Category for documents that do not specify one")
+    parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help="Chunks embedded per batch")
+    parser.add_argument('--chunk-size', type=int, default=INGEST_CHUNK_SIZE, help="Chunk length in characters")
+    parser.add_argument('--chunk-overlap', type=int, default=INGEST_CHUNK_OVERLAP,
+                        help="Characters shared by consecutive chunks")
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint of an interrupted run")
+    args = parser.parse_args()
+    
+    if args.chunk_overlap >= args.chunk_size:
+        parser.error("--chunk-overlap must be smaller than --chunk-size")
+    
+    ingestor = KnowledgeIngestor(
+        VectorDatabase(),
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap
+    )
+    
+    try:
+        progress = ingestor.ingest(args.source, category=args.category, resume=not args.restart,
+                                   progress_callback=print_progress)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; run again with the same source to resume: python ingest_cli.py {args.source}")
+        return 130
+    
+    print(f"Done in {progress['elapsed_seconds']:.1f}s")
+    return 0 if progress['invalid_records'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -92,3 +92,64 @@ class DataRetention(db.Model):
     archive_location = db.Column(db.String(256))  # archive storage location
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(16), default='active')  # 'active', 'suspended', 'archived'
+
+class BatchJob(db.Model):
+    """Model for a batch analysis run over a directory or manifest of evidence"""
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(64), nullable=False)
+    source = db.Column(db.String(512))  # directory or manifest path
+    status = db.Column(db.String(16), default='pending')  # 'pending', 'running', 'completed', 'interrupted'
+    total_items = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class BatchItem(db.Model):
+    """Model for a single item of a batch analysis, checkpointed as it completes"""
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batch_job.id'), nullable=False, index=True)
+    file_path = db.Column(db.String(512))
+    file_type = db.Column(db.String(16))  # 'image', 'video'
+    youtube_url = db.Column(db.String(512))
+    item_metadata = db.Column(JSON)
+    status = db.Column(db.String(16), default='pending')  # 'pending', 'running', 'completed', 'failed'
+    analysis_id = db.Column(db.Integer)
+    error = db.Column(Text)
+    attempts = db.Column(db.Integer, default=0)
+    duration = db.Column(db.Float)  # seconds
+    completed_at = db.Column(db.DateTime)
+
+class CachedAgentResult(db.Model):
+    """Model for caching agent results by media digest and agent version"""
+    id = db.Column(db.Integer, primary_key=True)
+    media_digest = db.Column(db.String(64), nullable=False)  # SHA-256 of the analyzed image bytes
+    agent_name = db.Column(db.String(64), nullable=False)
+    agent_version = db.Column(db.String(32), nullable=False)  # Agent version, plus ':<input signature>'
+    result = db.Column(JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('media_digest', 'agent_name', 'agent_version', name='uq_agent_result_key'),
+    )
+
+class AgentRawOutput(db.Model):
+    """Model for the raw model text each agent scored, kept for offline re-scoring"""
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('scene_analysis.id'), nullable=False, index=True)
+    agent_name = db.Column(db.String(64), nullable=False)
+    model = db.Column(db.String(64))
+    raw_text = db.Column(Text)
+    scoring_context = db.Column(JSON)  # scene metadata the agent's scoring reads
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SessionContext(db.Model):
+    """Model for the rolling context of a session analyzed frame by frame"""
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(64), nullable=False, unique=True)
+    summary = db.Column(Text)  # compact rolling summary passed to agents with each new frame
+    frame_count = db.Column(db.Integer, default=0)
+    last_frame_hash = db.Column(Text)  # perceptual hash of the latest frame, one per photo for multi-image scenes
+    agent_state = db.Column(JSON)  # latest successful result per agent, with its input signature
+    assessment_state = db.Column(JSON)  # running aggregates behind the session assessment
+    key_findings = db.Column(JSON)  # deduplicated findings with the frame they were first seen in
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Offline re-scoring command-line entry point
+
+Usage:
+    python rescore_cli.py                 # re-score agents whose version changed
+    python rescore_cli.py --all           # replay every agent of every analysis
+    python rescore_cli.py --ids 12 13 14  # re-score specific analyses
+    python rescore_cli.py --what-if '{"HIGH": [0.5, 1]}'  # preview hazard levels under other thresholds
+"""
+import argparse
+import json
+import sys
+
+from app import app
+from services.analysis_service import AnalysisService
+from services.rescoring_service import RescoringService
+
+def print_progress(progress):
+    """Print a single-line progress report"""
+    done = progress['rescored'] + progress['skipped'] + progress['failed']
+    line = f"[rescore] {done}/{progress['total']} processed ({progress['failed']} failed)"
+    
+    if progress.get('elapsed'):
+        line += f" | {done / progress['elapsed'] * 60:.0f} analyses/min"
+    
+    print(line, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored analyses from raw agent text without calling Gemini")
+    parser.add_argument('--ids', type=int, nargs='+', metavar='ANALYSIS_ID', help="Analyses to re-score")
+    parser.add_argument('--all', action='store_true', help="Replay agents even if their version is unchanged")
+    parser.add_argument('--processes', type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Analyses loaded per database round trip")
+    parser.add_argument('--what-if', metavar='THRESHOLDS',
+                        help="JSON of level: [min confidence, risk factors must exceed]; reports without saving")
+    args = parser.parse_args()
+    
+    with app.app_context():
+        rescoring_service = RescoringService(
+            AnalysisService(), processes=args.processes, chunk_size=args.chunk_size
+        )
+        if args.what_if:
+            report = rescoring_service.what_if(json.loads(args.what_if), analysis_ids=args.ids)
+            print(json.dumps(report, indent=2))
+            return 0
+            
+        stats = rescoring_service.rescore(
+            analysis_ids=args.ids, stale_only=not args.all, progress_callback=print_progress
+        )
+    
+    print(f"Re-scored {stats['rescored']} analyses with agent versions {stats['agent_versions']}")
+    return 0 if stats['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
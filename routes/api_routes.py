@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, current_app
 from flask_socketio import emit, join_room, leave_room
 import os
 import logging
+import math
 import uuid
 import time
 from werkzeug.utils import secure_filename
@@ -10,7 +11,19 @@ import io
 
 from services.analysis_service import AnalysisService
 from services.vector_db import VectorDatabase
+from services.batch_service import BATCH_ROOTS, BatchService
 from services.audit_service import audit_service
+from services.model_router import model_router
+from services.resilience import resilient_caller
+from services.quota_scheduler import quota_scheduler
+from services.singleflight import SingleFlight
+from services.priority import agent_executor, stage_gate
+from services.speculation import speculative_runner
+from services.agent_cache import agent_cache
+from services.triage import frame_triage
+from services.tiling import tile_cache
+from services.multi_image import MAX_SCENE_IMAGES
+from services.session_context import session_contexts
 from models import Communication, SensorData, db
 from app import socketio
 
@@ -26,6 +39,15 @@ UPLOAD_FOLDER = 'uploads'
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
 ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'wmv', 'flv', 'webm'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+IDEMPOTENCY_TTL = 3600  # seconds an idempotent /analyze result is replayed
+# Start analyzing uploads before /analyze arrives (uploads may also opt in with speculate=true)
+SPECULATIVE_ANALYSIS = os.environ.get("SPECULATIVE_ANALYSIS", "false").lower() == "true"
+
+# API batches may only read uploads and the configured batch directories
+batch_service = BatchService(analysis_service, allowed_roots=[UPLOAD_FOLDER] + BATCH_ROOTS)
+
+# Results of /analyze requests keyed by (session, Idempotency-Key)
+idempotent_analyses = SingleFlight(result_ttl=IDEMPOTENCY_TTL)
 
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and \
@@ -36,6 +58,67 @@ def ensure_upload_folder():
     if not os.path.exists(UPLOAD_FOLDER):
         os.makedirs(UPLOAD_FOLDER)
 
+def summary_delta_emitter(session_id, analysis_id=None):
+    """Build a callback that forwards streamed summary chunks to the session room"""
+    def emit_delta(artifact, delta):
+        socketio.emit('summary_delta', {
+            'session_id': session_id,
+            'analysis_id': analysis_id,
+            'artifact': artifact,
+            'delta': delta,
+            'timestamp': time.time()
+        }, room=session_id)
+    return emit_delta
+
+def parse_seconds(data, field):
+    """Read a positive number of seconds from request data, raising ValueError with a client-facing message"""
+    try:
+        seconds = float(data[field])
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number of seconds, got {data[field]!r}")
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"{field} must be a positive number of seconds, got {data[field]!r}")
+    return seconds
+
+def apply_analysis_options(scene_data, data, session_id):
+    """Copy analysis options and session metadata from request data into scene_data
+    
+    Raises ValueError for malformed options.
+    """
+    # Priority class: tactical users may flag live entry decisions, anyone may lower priority
+    if 'live' in data:
+        scene_data['live'] = str(data['live']).lower() == 'true'
+    if data.get('priority'):
+        scene_data['priority'] = data['priority']
+        
+    # Optional end-to-end latency budget (seconds) used for model routing
+    if data.get('latency_budget'):
+        scene_data['latency_budget'] = parse_seconds(data, 'latency_budget')
+        
+    # Analyze the frame even if local triage would reject or downgrade it
+    if 'skip_triage' in data:
+        scene_data['skip_triage'] = str(data['skip_triage']).lower() == 'true'
+        
+    # Tiled full-resolution scanning: true forces it, false disables it, unset tiles very large images
+    if 'tiling' in data:
+        scene_data['tiling'] = str(data['tiling']).lower() == 'true'
+        
+    # Analyze the frame as a delta against the session's earlier frames
+    if 'incremental' in data:
+        scene_data['incremental'] = str(data['incremental']).lower() == 'true'
+        
+    # Lite mode (per request or per session) returns a compact payload within a deadline
+    if (data.get('analysis_mode') or session.get('analysis_mode')) == 'lite':
+        scene_data['analysis_mode'] = 'lite'
+        if data.get('deadline'):
+            scene_data['deadline'] = parse_seconds(data, 'deadline')
+            
+    # Add metadata
+    scene_data['metadata'] = data.get('metadata', {})
+    scene_data['metadata']['session_id'] = session_id
+    scene_data['metadata']['user_type'] = session.get('user_type', 'tactical')
+    return scene_data
+
 @api_bp.route('/upload', methods=['POST'])
 def upload_file():
     """Handle file upload for analysis"""
@@ -98,8 +181,23 @@ def upload_file():
             }
         }
         
+        # Start the analysis now; a matching /analyze request attaches to it
+        speculative = False
+        if SPECULATIVE_ANALYSIS or request.form.get('speculate', '').lower() == 'true':
+            try:
+                options = request.form.to_dict()
+                options.pop('metadata', None)
+                speculative_data = {'image_path' if is_image else 'video_path': filepath}
+                apply_analysis_options(speculative_data, options, session_id)
+                speculative = analysis_service.speculate(
+                    session_id, speculative_data, on_delta=summary_delta_emitter(session_id)
+                )
+            except Exception as speculation_error:
+                logger.warning(f"Failed to start speculative analysis: {speculation_error}")
+        
         return jsonify({
             'status': 'success',
+            'speculative': speculative,
             'file_id': filename,
             'file_type': scene_data['file_type'],
             'scene_data': {
@@ -149,29 +247,67 @@ def analyze_scene():
                 logger.error(f"File not found: {filepath}")
                 return jsonify({'error': f'File not found: {filepath}'}), 404
                         
+        # Handle a multi-image scene: several photos analyzed together
+        if data.get('file_paths'):
+            filepaths = data['file_paths']
+            if not isinstance(filepaths, list) or len(filepaths) > MAX_SCENE_IMAGES:
+                return jsonify({'error': f'file_paths must be a list of at most {MAX_SCENE_IMAGES} images'}), 400
+            for filepath in filepaths:
+                if not os.path.exists(filepath):
+                    logger.error(f"File not found: {filepath}")
+                    return jsonify({'error': f'File not found: {filepath}'}), 404
+                if not allowed_file(filepath, ALLOWED_IMAGE_EXTENSIONS):
+                    return jsonify({'error': f'Not an image file: {filepath}'}), 400
+            if len(filepaths) == 1:
+                scene_data['image_path'] = filepaths[0]
+            else:
+                scene_data['image_paths'] = filepaths
+            logger.info(f"Scene images set: {filepaths}")
+            
         # Handle YouTube URL
         if 'youtube_url' in data:
             scene_data['youtube_url'] = data['youtube_url']
             logger.info(f"YouTube URL set: {data['youtube_url']}")
             
-        # Add metadata
-        scene_data['metadata'] = data.get('metadata', {})
-        scene_data['metadata']['session_id'] = session_id
-        scene_data['metadata']['user_type'] = session.get('user_type', 'tactical')
+        # Analysis options and session metadata
+        try:
+            apply_analysis_options(scene_data, data, session_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Add user feedback if provided
         user_feedback = data.get('user_feedback')
         
-        if not scene_data.get('image_path') and not scene_data.get('video_path') and not scene_data.get('youtube_url'):
+        if not any(scene_data.get(field) for field in ('image_path', 'image_paths', 'video_path', 'youtube_url')):
             logger.error("No valid scene data provided")
             return jsonify({'error': 'No valid scene data provided (image, video, or YouTube URL required)'}), 400
         
+        # Retried POSTs with the same idempotency key get the original result
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        if idempotency_key:
+            previous_results = idempotent_analyses.get((session_id, idempotency_key))
+            if previous_results is not None:
+                logger.info(f"Replaying result for idempotency key {idempotency_key}")
+                return jsonify({
+                    'status': 'success',
+                    'analysis_results': previous_results,
+                    'session_id': session_id,
+                    'idempotent_replay': True
+                })
+        
         logger.info("Starting analysis...")
         
         # Perform analysis
-        analysis_results = analysis_service.analyze_scene(
-            session_id, scene_data, user_feedback
-        )
+        def run_analysis():
+            return analysis_service.analyze_scene(
+                session_id, scene_data, user_feedback,
+                on_delta=summary_delta_emitter(session_id)
+            )
+            
+        if idempotency_key:
+            analysis_results = idempotent_analyses.do((session_id, idempotency_key), run_analysis)
+        else:
+            analysis_results = run_analysis()
         
         logger.info("Analysis completed successfully")
         
@@ -180,10 +316,10 @@ def analyze_scene():
             action_type='analysis',
             action_details={
                 'scene_type': data.get('file_type', 'unknown'),
-                'analysis_confidence': analysis_results.get('agent_analysis', {}).get('overall_assessment', {}).get('overall_confidence', 0),
+                'analysis_confidence': analysis_results.get('overall_confidence') or analysis_results.get('agent_analysis', {}).get('overall_assessment', {}).get('overall_confidence', 0),
                 'has_youtube_url': 'youtube_url' in scene_data
             },
-            resource_accessed=scene_data.get('image_path') or scene_data.get('video_path') or scene_data.get('youtube_url'),
+            resource_accessed=scene_data.get('image_path') or ', '.join(scene_data.get('image_paths', [])) or scene_data.get('video_path') or scene_data.get('youtube_url'),
             classification_level='confidential'
         )
         
@@ -230,7 +366,9 @@ def analyze_youtube():
         }
         
         # Perform analysis
-        analysis_results = analysis_service.analyze_scene(session_id, scene_data)
+        analysis_results = analysis_service.analyze_scene(
+            session_id, scene_data, on_delta=summary_delta_emitter(session_id)
+        )
         
         # Emit real-time update
         socketio.emit('analysis_update', {
@@ -249,6 +387,110 @@ def analyze_youtube():
         logger.error(f"Error in YouTube analysis: {str(e)}")
         return jsonify({'error': f'YouTube analysis failed: {str(e)}'}), 500
 
+def start_batch_run(batch_id, session_id):
+    """Run a batch in the background, emitting progress to the session room"""
+    app = current_app._get_current_object()
+    
+    def emit_progress(progress):
+        socketio.emit('batch_progress', progress, room=session_id)
+        
+    def run():
+        with app.app_context():
+            try:
+                batch_service.run_batch(batch_id, progress_callback=emit_progress)
+            except Exception as e:
+                logger.error(f"Batch {batch_id} failed: {str(e)}")
+                
+    socketio.start_background_task(run)
+
+@api_bp.route('/batch', methods=['POST'])
+def create_batch():
+    """Create and start a batch analysis from a directory, manifest or item list"""
+    try:
+        data = request.get_json()
+        
+        if not data or not (data.get('directory') or data.get('manifest') or data.get('items')):
+            return jsonify({'error': 'directory, manifest or items required'}), 400
+            
+        session_id = session.get('session_id', str(uuid.uuid4()))
+        
+        source = data.get('directory') or data.get('manifest')
+        try:
+            if data.get('items'):
+                batch = batch_service.create_batch_from_items(data['items'], session_id=session_id)
+            else:
+                batch = batch_service.create_batch(source, session_id=session_id)
+        except PermissionError as e:
+            return jsonify({'error': str(e)}), 403
+        except FileNotFoundError:
+            return jsonify({'error': f'Source not found: {source}'}), 404
+            
+        audit_service.log_activity(
+            action_type='analysis',
+            action_details={
+                'batch_id': batch.id,
+                'total_items': batch.total_items
+            },
+            resource_accessed=batch.source,
+            classification_level='confidential'
+        )
+        
+        start_batch_run(batch.id, session_id)
+        
+        return jsonify({
+            'status': 'success',
+            'batch_id': batch.id,
+            'total_items': batch.total_items,
+            'session_id': session_id
+        })
+        
+    except Exception as e:
+        logger.error(f"Error creating batch: {str(e)}")
+        return jsonify({'error': f'Batch creation failed: {str(e)}'}), 500
+
+@api_bp.route('/batch/<int:batch_id>')
+def get_batch_progress(batch_id):
+    """Get batch progress and item counts"""
+    try:
+        progress = batch_service.get_progress(batch_id)
+        
+        if not progress:
+            return jsonify({'error': 'Batch not found'}), 404
+            
+        return jsonify({
+            'status': 'success',
+            'progress': progress
+        })
+        
+    except Exception as e:
+        logger.error(f"Error retrieving batch progress: {str(e)}")
+        return jsonify({'error': f'Failed to retrieve batch progress: {str(e)}'}), 500
+
+@api_bp.route('/batch/<int:batch_id>/resume', methods=['POST'])
+def resume_batch(batch_id):
+    """Resume an interrupted batch, skipping completed items"""
+    try:
+        progress = batch_service.get_progress(batch_id)
+        
+        if not progress:
+            return jsonify({'error': 'Batch not found'}), 404
+            
+        # A second run would re-analyze the items the first one is still working on
+        if not batch_service.claim_batch(batch_id):
+            return jsonify({'error': 'Batch is already running; resume a run that died with batch_cli.py'}), 409
+            
+        start_batch_run(batch_id, progress['session_id'])
+        
+        return jsonify({
+            'status': 'success',
+            'batch_id': batch_id,
+            'item_counts': progress['item_counts']
+        })
+        
+    except Exception as e:
+        logger.error(f"Error resuming batch: {str(e)}")
+        return jsonify({'error': f'Batch resume failed: {str(e)}'}), 500
+
 @api_bp.route('/sensor_data', methods=['POST'])
 def submit_sensor_data():
     """Submit sensor data for analysis"""
@@ -346,6 +588,37 @@ def submit_feedback():
         logger.error(f"Error submitting feedback: {str(e)}")
         return jsonify({'error': f'Feedback submission failed: {str(e)}'}), 500
 
+@api_bp.route('/analysis/<int:analysis_id>/<artifact>')
+def get_analysis_artifact(analysis_id, artifact):
+    """Get a lazily generated summary artifact (command_briefing, tactical_summary)"""
+    try:
+        session_id = session.get('session_id')
+        if not session_id:
+            return jsonify({'error': 'Session ID required'}), 400
+            
+        if artifact not in analysis_service.artifact_generators:
+            return jsonify({'error': f'Unknown artifact: {artifact}'}), 400
+            
+        text = analysis_service.get_analysis_artifact(
+            session_id, analysis_id, artifact,
+            on_delta=summary_delta_emitter(session_id, analysis_id),
+            user_type=session.get('user_type', 'tactical')
+        )
+        
+        if text is None:
+            return jsonify({'error': 'Analysis not found'}), 404
+            
+        return jsonify({
+            'status': 'success',
+            'analysis_id': analysis_id,
+            'artifact': artifact,
+            'content': text
+        })
+        
+    except Exception as e:
+        logger.error(f"Error retrieving {artifact}: {str(e)}")
+        return jsonify({'error': f'Failed to retrieve {artifact}: {str(e)}'}), 500
+
 @api_bp.route('/knowledge/search', methods=['POST'])
 def search_knowledge():
     """Search knowledge base"""
@@ -379,13 +652,109 @@ def get_knowledge_stats():
         
         return jsonify({
             'status': 'success',
-            'stats': stats
+            'stats': stats,
+            'static_context': vector_db.get_static_context_stats(),
+            'embedding_cache': vector_db.embedding_cache.get_stats()
         })
         
     except Exception as e:
         logger.error(f"Error getting knowledge stats: {str(e)}")
         return jsonify({'error': f'Failed to retrieve stats: {str(e)}'}), 500
 
+@api_bp.route('/model/stats')
+def get_model_stats():
+    """Get Gemini model latency, circuit breaker, quota, triage and tile cache statistics"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'latency': model_router.get_latency_stats(),
+            'resilience': resilient_caller.get_stats(),
+            'quota': quota_scheduler.get_stats(),
+            'agent_queue': agent_executor.queue_depth(),
+            'active_analyses': stage_gate.get_active(),
+            'speculation': speculative_runner.get_stats(),
+            'triage': frame_triage.get_stats(),
+            'tiles': tile_cache.get_stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting model stats: {str(e)}")
+        return jsonify({'error': f'Failed to retrieve model stats: {str(e)}'}), 500
+
+@api_bp.route('/session/context', methods=['GET'])
+def get_session_context():
+    """Get the rolling context of the current session's incremental analysis"""
+    try:
+        session_id = session.get('session_id')
+        if not session_id:
+            return jsonify({'error': 'No active session'}), 400
+            
+        session_context = session_contexts.load(session_id)
+        return jsonify({
+            'status': 'success',
+            'session_id': session_id,
+            'frame_count': session_context['frame_count'],
+            'summary': session_context['summary'],
+            'key_findings': session_context['key_findings']
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting session context: {str(e)}")
+        return jsonify({'error': f'Failed to retrieve session context: {str(e)}'}), 500
+
+@api_bp.route('/session/context', methods=['DELETE'])
+def reset_session_context():
+    """Start the current session's incremental analysis over"""
+    try:
+        session_id = session.get('session_id')
+        if not session_id:
+            return jsonify({'error': 'No active session'}), 400
+            
+        return jsonify({
+            'status': 'success',
+            'reset': session_contexts.reset(session_id)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error resetting session context: {str(e)}")
+        return jsonify({'error': f'Failed to reset session context: {str(e)}'}), 500
+
+@api_bp.route('/agents/cache')
+def get_agent_cache_stats():
+    """Get agent versions and result cache statistics"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'agent_versions': analysis_service.coordinator.get_agent_versions(),
+            'cache': agent_cache.get_stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting agent cache stats: {str(e)}")
+        return jsonify({'error': f'Failed to retrieve agent cache stats: {str(e)}'}), 500
+
+@api_bp.route('/agents/cache/invalidate', methods=['POST'])
+def invalidate_agent_cache():
+    """Invalidate cached agent results by agent and/or media digest"""
+    try:
+        data = request.get_json() or {}
+        agent_name = data.get('agent_name')
+        
+        if agent_name and agent_name not in analysis_service.coordinator.agents:
+            return jsonify({'error': f'Unknown agent: {agent_name}'}), 400
+            
+        deleted = analysis_service.coordinator.invalidate_cached_results(
+            agent_name=agent_name,
+            media_digest=data.get('media_digest'),
+            stale_only=bool(data.get('stale_only', False))
+        )
+        
+        return jsonify({'status': 'success', 'invalidated': deleted})
+        
+    except Exception as e:
+        logger.error(f"Error invalidating agent cache: {str(e)}")
+        return jsonify({'error': f'Failed to invalidate agent cache: {str(e)}'}), 500
+
 # Socket.IO event handlers
 @socketio.on('connect')
 def handle_connect():
@@ -460,6 +829,37 @@ def handle_analysis_update_request(data):
     except Exception as e:
         logger.error(f"Error handling analysis update request: {str(e)}")
 
+@socketio.on('request_artifact')
+def handle_artifact_request(data):
+    """Handle request for a lazily generated summary artifact"""
+    try:
+        session_id = session.get('session_id')
+        if not session_id:
+            return
+            
+        analysis_id = data.get('analysis_id')
+        artifact = data.get('artifact', 'command_briefing')
+        if not analysis_id or artifact not in analysis_service.artifact_generators:
+            return
+            
+        text = analysis_service.get_analysis_artifact(
+            session_id, int(analysis_id), artifact,
+            on_delta=summary_delta_emitter(session_id, analysis_id),
+            user_type=session.get('user_type', 'tactical')
+        )
+        
+        if text is not None:
+            emit('artifact_ready', {
+                'session_id': session_id,
+                'analysis_id': analysis_id,
+                'artifact': artifact,
+                'content': text,
+                'timestamp': time.time()
+            }, room=session_id)
+            
+    except Exception as e:
+        logger.error(f"Error handling artifact request: {str(e)}")
+
 @socketio.on('join_session')
 def handle_join_session(data):
     """Handle joining a specific session"""
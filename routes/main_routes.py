@@ -32,7 +32,8 @@ def get_session():
     
     return jsonify({
         'session_id': session['session_id'],
-        'user_type': session.get('user_type', 'tactical')
+        'user_type': session.get('user_type', 'tactical'),
+        'analysis_mode': session.get('analysis_mode', 'full')
     })
 
 @main_bp.route('/session/type', methods=['POST'])
@@ -47,6 +48,18 @@ def set_user_type():
     else:
         return jsonify({'status': 'error', 'message': 'Invalid user type'}), 400
 
+@main_bp.route('/session/mode', methods=['POST'])
+def set_analysis_mode():
+    """Set analysis mode (full, or lite for bandwidth-constrained units)"""
+    data = request.get_json()
+    analysis_mode = data.get('analysis_mode', 'full')
+    
+    if analysis_mode in ['full', 'lite']:
+        session['analysis_mode'] = analysis_mode
+        return jsonify({'status': 'success', 'analysis_mode': analysis_mode})
+    else:
+        return jsonify({'status': 'error', 'message': 'Invalid analysis mode'}), 400
+
 @main_bp.route('/uploads/<filename>')
 def uploaded_file(filename):
     """Serve uploaded files"""
@@ -0,0 +1,127 @@
+"""
+Agent Result Cache
+Persistent cache of agent results keyed by media digest, agent name, agent version and input signature
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from agents.base_agent import AgentResult
+from models import CachedAgentResult, db
+
+logger = logging.getLogger(__name__)
+
+class AgentResultCache:
+    """Database-backed store of agent results so unchanged agents are not re-run"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._stats = Counter()
+        self._lock = threading.Lock()
+
+    def media_digest(self, scene_data: Dict[str, Any]) -> Optional[str]:
+        """SHA-256 of the image bytes the agents analyze, or None if there are none"""
+        images = scene_data.get('images') or [scene_data.get('image_data')]
+        if not all(images):
+            return None
+        
+        digest = hashlib.sha256(images[0])
+        # Multi-image scenes hash every photo in order
+        for image_data in images[1:]:
+            digest.update(hashlib.sha256(image_data).digest())
+        return digest.hexdigest()
+
+    def get(self, media_digest: str, agent_name: str, agent_version: str,
+            input_signature: Optional[str] = None) -> Optional[AgentResult]:
+        """Get a cached result, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        try:
+            entry = CachedAgentResult.query.filter_by(
+                media_digest=media_digest,
+                agent_name=agent_name,
+                agent_version=self._entry_version(agent_version, input_signature)
+            ).first()
+        except Exception as e:
+            logger.warning(f"Agent cache lookup failed: {str(e)}")
+            return None
+
+        self._count('hits' if entry else 'misses')
+        return AgentResult.from_dict(entry.result) if entry else None
+
+    def put(self, media_digest: str, agent_name: str, agent_version: str, result: AgentResult,
+            input_signature: Optional[str] = None):
+        """Store a successful agent result, replacing any entry for the same key"""
+        if not self.enabled or result.metadata.get('error'):
+            return
+
+        entry_version = self._entry_version(agent_version, input_signature)
+        try:
+            entry = CachedAgentResult.query.filter_by(
+                media_digest=media_digest,
+                agent_name=agent_name,
+                agent_version=entry_version
+            ).first()
+            if entry is None:
+                entry = CachedAgentResult(
+                    media_digest=media_digest,
+                    agent_name=agent_name,
+                    agent_version=entry_version
+                )
+                db.session.add(entry)
+            entry.result = dict(result.to_dict(), raw_text=result.raw_text)
+            db.session.commit()
+        except Exception as e:
+            logger.warning(f"Agent cache store failed: {str(e)}")
+            db.session.rollback()
+
+    def invalidate(self, agent_name: Optional[str] = None, media_digest: Optional[str] = None,
+                   keep_version: Optional[str] = None) -> int:
+        """Delete cached results matching the filters; keep_version spares an agent's current version"""
+        query = CachedAgentResult.query
+        if agent_name:
+            query = query.filter(CachedAgentResult.agent_name == agent_name)
+        if media_digest:
+            query = query.filter(CachedAgentResult.media_digest == media_digest)
+        if keep_version:
+            query = query.filter(~CachedAgentResult.agent_version.startswith(keep_version))
+
+        try:
+            deleted = query.delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Agent cache invalidation failed: {str(e)}")
+            db.session.rollback()
+            return 0
+
+        logger.info(f"Invalidated {deleted} cached agent results")
+        return deleted
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counts and hit rate"""
+        with self._lock:
+            hits, misses = self._stats['hits'], self._stats['misses']
+        return {
+            'enabled': self.enabled,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0
+        }
+
+    def _entry_version(self, agent_version: str, input_signature: Optional[str]) -> str:
+        """Stored version column: the agent version, suffixed with the input signature when there is one"""
+        # Agent versions are 16 hex digits and signatures 15, within the 32-character column
+        return f"{agent_version}:{input_signature}" if input_signature else agent_version
+
+    def _count(self, outcome: str):
+        """Count a cache lookup outcome"""
+        with self._lock:
+            self._stats[outcome] += 1
+
+# Global agent result cache instance
+agent_cache = AgentResultCache(enabled=os.environ.get("AGENT_CACHE_ENABLED", "true").lower() == "true")
@@ -1,8 +1,13 @@
 import logging
-from typing import Dict, Any, List, Optional
+import os
+import threading
+import hashlib
+import json
+from typing import Dict, Any, List, Optional, Callable
 import io
 import base64
 from PIL import Image
+from flask import current_app
 import cv2
 import numpy as np
 import time
@@ -10,7 +15,51 @@ import time
 from agents.coordinator import AgentCoordinator
 from services.gemini_service import GeminiService
 from services.vector_db import VectorDatabase
-from models import SceneAnalysis, db
+from services.model_router import model_router, FLASH_MODEL
+from services.quota_scheduler import request_context
+from services.singleflight import SingleFlight
+from services.priority import resolve_priority, stage_gate
+from services.speculation import SpeculationCancelledError, speculative_runner
+from services.triage import REJECT, DOWNGRADE, FULL, frame_triage
+from services.tiling import TILE_SCAN_TIMEOUT, TiledImageAnalyzer, tile_cache
+from services.session_context import INCREMENTAL_ANALYSIS, scene_hash, session_contexts
+from agents.base_agent import AgentResult
+from models import AgentRawOutput, SceneAnalysis, db
+
+# Artifacts generated on first request instead of during analysis.
+# Comma-separated subset of 'command_briefing' and 'tactical_summary'.
+LAZY_ARTIFACTS = {
+    name.strip() for name in
+    os.environ.get("CHEMVIO_LAZY_ARTIFACTS", "command_briefing").split(",")
+    if name.strip()
+}
+
+# Lite mode: reduced pipeline and compact payload for bandwidth-constrained field units
+LITE_AGENTS = ['hazard_detector', 'mopp_recommender']
+LITE_DEADLINE_SECONDS = float(os.environ.get("LITE_DEADLINE_SECONDS", "20"))
+LITE_IMAGE_MAX_SIZE = int(os.environ.get("LITE_IMAGE_MAX_SIZE", "768"))
+LITE_MAX_ITEMS = 5
+LITE_SUMMARY_CHARS = 600
+
+# Context queries _generate_context_query produces for scenes without location or environment metadata
+STATIC_CONTEXT_QUERIES = [
+    "visual scene analysis",
+    "video surveillance analysis",
+    "visual scene analysis video surveillance analysis",
+    "chemical biological hazard analysis"
+]
+RAG_KNOWLEDGE_LIMIT = 10
+
+# Fixed pool of artifact generation locks; unrelated artifacts rarely share one
+ARTIFACT_LOCK_STRIPES = 64
+
+def file_digest(path: str) -> str:
+    """SHA-256 hex digest of a media file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
 class AnalysisService:
     """Main service for coordinating ChemBio scene analysis"""
@@ -20,51 +69,417 @@ class AnalysisService:
         self.coordinator = AgentCoordinator()
         self.gemini_service = GeminiService()
         self.vector_db = VectorDatabase()
+        self.vector_db.register_static_queries(STATIC_CONTEXT_QUERIES, limit=RAG_KNOWLEDGE_LIMIT)
+        self.artifact_generators = {
+            'tactical_summary': self.gemini_service.generate_tactical_summary,
+            'command_briefing': self.gemini_service.generate_command_briefing
+        }
+        self._artifact_locks = [threading.Lock() for _ in range(ARTIFACT_LOCK_STRIPES)]
+        self._scene_flights = SingleFlight()
+        self.tile_analyzer = TiledImageAnalyzer(self.gemini_service, tile_cache)
         
     def analyze_scene(self, session_id: str, scene_data: Dict[str, Any], 
-                     user_feedback: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Main method to analyze a scene with all available agents"""
+                     user_feedback: Optional[Dict[str, Any]] = None,
+                     on_delta: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+        """Main method to analyze a scene with all available agents
+        
+        on_delta, if given, receives (artifact, chunk) as summary text streams in.
+        Concurrent identical requests in a session share one analysis.
+        """
+        flight_key = self.scene_flight_key(session_id, scene_data, user_feedback)
+        if flight_key is None:
+            return self._run_scene_analysis(session_id, scene_data, user_feedback, on_delta)
+        
+        # Work started speculatively at upload time is picked up instead of redone
+        speculation = speculative_runner.claim(flight_key)
+        if speculation is not None:
+            try:
+                return speculation.wait()
+            except Exception as e:
+                self.logger.warning(f"Speculative analysis failed, rerunning: {str(e)}")
+                
+        def run():
+            return self._scene_flights.do(
+                flight_key,
+                lambda: self._run_scene_analysis(session_id, scene_data, user_feedback, on_delta)
+            )
+            
+        try:
+            return run()
+        except SpeculationCancelledError:
+            # Attached to speculative work whose window passed meanwhile; run it for real
+            return run()
+        
+    def speculate(self, session_id: str, scene_data: Dict[str, Any],
+                  on_delta: Optional[Callable[[str, str], None]] = None) -> bool:
+        """Start analyzing a scene before it is requested; a matching analyze_scene call claims it
+        
+        Unclaimed work is cancelled at the next stage boundary once the speculation window passes.
+        Finished work waits for its claim before anything is stored, and streams nothing until claimed.
+        """
+        app = current_app._get_current_object()
+        flight_key = self.scene_flight_key(session_id, scene_data)
+        if flight_key is None:
+            return False
+        
+        def claimed_delta(artifact, chunk):
+            if on_delta is not None and not speculative_runner.pending():
+                on_delta(artifact, chunk)
+                
+        def run():
+            with app.app_context():
+                return self._scene_flights.do(
+                    flight_key,
+                    lambda: self._run_scene_analysis(session_id, scene_data, None, claimed_delta)
+                )
+                
+        return speculative_runner.start(flight_key, run)
+        
+    def _run_scene_analysis(self, session_id: str, scene_data: Dict[str, Any],
+                            user_feedback: Optional[Dict[str, Any]] = None,
+                            on_delta: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+        """Run the full analysis pipeline for a scene"""
+        # Tag every Gemini call and agent task in this analysis with its session and priority class
+        user_type = scene_data.get('metadata', {}).get('user_type')
+        priority = resolve_priority(user_type, scene_data.get('priority'), scene_data.get('live', False))
+        
+        with request_context(session_id=session_id, user_type=user_type, priority=priority), \
+                stage_gate.track(priority):
+            if scene_data.get('analysis_mode') == 'lite':
+                return self._run_lite_analysis(session_id, scene_data)
+                
+            try:
+                start_time = time.time()
+                self.logger.info(f"Starting {priority.name} scene analysis for session {session_id}")
+                
+                # Preprocess scene data
+                processed_data = self._preprocess_scene_data(scene_data, tiling=scene_data.get('tiling'))
+                
+                # Frames that cannot hold evidence never reach the models; marginal ones get the lite agents
+                triage = self._triage_frame(processed_data)
+                if triage and triage['decision'] == REJECT:
+                    return self._create_rejected_frame_response(session_id, scene_data, triage)
+                downgraded = triage is not None and triage['decision'] == DOWNGRADE
+                
+                # Frames of an incremental session are analyzed as deltas against its rolling context
+                session_context = self._load_session_context(session_id, processed_data)
+                
+                # Add contextual knowledge from RAG
+                self._stage_boundary(priority, 'rag')
+                enhanced_data = self._enhance_with_rag_knowledge(processed_data)
+                
+                # Run coordinated agent analysis, scanning full-resolution tiles alongside
+                self._stage_boundary(priority, 'agents')
+                tile_job = None if downgraded else self._start_tile_analysis(processed_data)
+                analysis_results = self.coordinator.analyze_scene(
+                    enhanced_data, agent_names=LITE_AGENTS if downgraded else None,
+                    previous=session_context['agent_state'] if session_context else None
+                )
+                raw_outputs = analysis_results.pop('raw_outputs', {})
+                reused_agents = analysis_results.get('coordination_metadata', {}).get('reused_agents', [])
+                frame_unchanged = bool(reused_agents) and len(reused_agents) == len(analysis_results['agent_results'])
+                
+                # Generate supplementary analysis with Gemini
+                self._stage_boundary(priority, 'supplementary')
+                if downgraded:
+                    supplementary_analysis = {'skipped': 'Frame downgraded by triage'}
+                elif frame_unchanged:
+                    supplementary_analysis = {'skipped': 'Frame unchanged since the previous analysis'}
+                else:
+                    supplementary_analysis = self._generate_supplementary_analysis(enhanced_data)
+                
+                # Combine results
+                self._stage_boundary(priority, 'summaries')
+                final_results = self._combine_analysis_results(
+                    analysis_results, supplementary_analysis, user_feedback, on_delta
+                )
+                final_results['triage'] = triage
+                if processed_data.get('image_paths'):
+                    final_results['scene_images'] = self._scene_images(processed_data)
+                if tile_job is not None:
+                    # Tiles wait no longer than the request's latency budget allows
+                    final_results['tile_analysis'] = tile_job.result(
+                        deadline=start_time + float(processed_data.get('latency_budget') or TILE_SCAN_TIMEOUT)
+                    )
+                if session_context is not None:
+                    final_results['session_context'] = self._update_session_context(
+                        session_id, processed_data.get('frame_hash'), analysis_results
+                    )
+                
+                # Store results in database
+                analysis_id = self._store_analysis_results(
+                    session_id, scene_data, final_results, raw_outputs, enhanced_data.get('metadata')
+                )
+                final_results['analysis_id'] = analysis_id
+                
+                self.logger.info(f"Scene analysis completed for session {session_id}")
+                return final_results
+                
+            except SpeculationCancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Error in scene analysis: {str(e)}")
+                return self._create_fallback_analysis(session_id, scene_data)
+            
+    def _load_session_context(self, session_id: str, processed_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Load the session's rolling context for incremental analysis and attach it to the scene"""
+        if not processed_data.get('incremental', INCREMENTAL_ANALYSIS) or not processed_data.get('image_data'):
+            return None
+            
+        try:
+            session_context = session_contexts.load(session_id)
+        except Exception as e:
+            self.logger.error(f"Error loading session context: {str(e)}")
+            return None
+            
+        # Every photo of a multi-image scene counts, not just the first
+        processed_data['frame_hash'] = scene_hash(processed_data.get('images') or [processed_data['image_data']])
+        if session_context['summary']:
+            processed_data['session_summary'] = session_context['summary']
+        return session_context
+        
+    def _update_session_context(self, session_id: str, current_frame_hash: Optional[str],
+                                analysis_results: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Fold this frame's agent results into the session context and running assessment"""
+        speculative_runner.await_claim()
+        agent_data = analysis_results.get('agent_results', {})
+        agent_results = {name: AgentResult.from_dict(data) for name, data in agent_data.items()}
+        
         try:
-            self.logger.info(f"Starting scene analysis for session {session_id}")
+            return session_contexts.update(
+                session_id, current_frame_hash, agent_data,
+                lambda state: self.coordinator.update_session_assessment(
+                    state, agent_results, analysis_results.get('overall_assessment', {})
+                )
+            )
+        except Exception as e:
+            self.logger.error(f"Error updating session context: {str(e)}")
+            return None
+            
+    def _scene_images(self, scene_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Image numbers used in multi-image attribution, mapped to their files"""
+        return [
+            {'image': number, 'filename': os.path.basename(path)}
+            for number, path in enumerate(scene_data['image_paths'], start=1)
+        ]
+        
+    def _start_tile_analysis(self, processed_data: Dict[str, Any]):
+        """Start scanning tiles of the full-resolution image, if it was kept for tiling"""
+        if not processed_data.get('full_resolution_image'):
+            return None
             
-            # Preprocess scene data
-            processed_data = self._preprocess_scene_data(scene_data)
+        try:
+            return self.tile_analyzer.start(processed_data['full_resolution_image'])
+        except Exception as e:
+            self.logger.error(f"Error starting tiled analysis: {str(e)}")
+            return None
             
-            # Add contextual knowledge from RAG
-            enhanced_data = self._enhance_with_rag_knowledge(processed_data)
+    def _stage_boundary(self, priority, stage: str):
+        """Yield to higher-priority analyses, then drop speculative work nobody claimed"""
+        stage_gate.checkpoint(priority, stage)
+        speculative_runner.check()
+        
+    def _run_lite_analysis(self, session_id: str, scene_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the reduced lite pipeline within its deadline and return a compact payload"""
+        start_time = time.time()
+        deadline = start_time + float(scene_data.get('deadline') or LITE_DEADLINE_SECONDS)
+        
+        try:
+            self.logger.info(f"Starting lite scene analysis for session {session_id}")
             
-            # Run coordinated agent analysis
-            analysis_results = self.coordinator.analyze_scene(enhanced_data)
+            # Downscaled media; RAG context and the supplementary pass are skipped
+            processed_data = self._preprocess_scene_data(scene_data, max_image_size=LITE_IMAGE_MAX_SIZE)
+            processed_data.setdefault('latency_budget', deadline - time.time())
             
-            # Generate supplementary analysis with Gemini
-            supplementary_analysis = self._generate_supplementary_analysis(enhanced_data)
+            triage = self._triage_frame(processed_data)
+            if triage and triage['decision'] == REJECT:
+                return self._create_rejected_frame_response(session_id, scene_data, triage, lite=True)
             
-            # Combine results
-            final_results = self._combine_analysis_results(
-                analysis_results, supplementary_analysis, user_feedback
+            analysis_results = self.coordinator.analyze_scene(
+                processed_data, agent_names=LITE_AGENTS, deadline=deadline
             )
+            raw_outputs = analysis_results.pop('raw_outputs', {})
             
-            # Store results in database
-            self._store_analysis_results(session_id, scene_data, final_results)
+            # Summarize only if a flash call still fits in the deadline; the briefing stays lazy
+            tactical_summary = None
+            if deadline - time.time() > model_router.expected_latency(FLASH_MODEL):
+                tactical_summary = self.gemini_service.generate_tactical_summary(analysis_results)
+                
+            payload = self._build_lite_payload(analysis_results, tactical_summary)
+            payload['triage'] = triage
+            if processed_data.get('image_paths'):
+                payload['scene_images'] = self._scene_images(processed_data)
+            payload['duration'] = round(time.time() - start_time, 2)
+            payload['deadline_met'] = time.time() <= deadline
+            
+            # Full agent outputs and summary are stored so artifacts can be requested later
+            stored_results = dict(payload, agent_analysis=analysis_results)
+            stored_results['tactical_summary'] = tactical_summary if payload['tactical_summary'] else None
+            stored_results['pending_artifacts'] = [
+                artifact for artifact in self.artifact_generators if not stored_results.get(artifact)
+            ]
+            payload['analysis_id'] = self._store_analysis_results(
+                session_id, scene_data, stored_results, raw_outputs, processed_data.get('metadata')
+            )
             
-            self.logger.info(f"Scene analysis completed for session {session_id}")
-            return final_results
+            self.logger.info(f"Lite scene analysis completed for session {session_id} in {payload['duration']}s")
+            return payload
             
+        except SpeculationCancelledError:
+            raise
         except Exception as e:
-            self.logger.error(f"Error in scene analysis: {str(e)}")
-            return self._create_fallback_analysis(session_id, scene_data)
+            self.logger.error(f"Error in lite scene analysis: {str(e)}")
+            return self._create_error_response(str(e))
+            
+    def _triage_frame(self, processed_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Triage the scene's image when it is the only media; video and YouTube evidence is never dropped"""
+        if (processed_data.get('skip_triage') or processed_data.get('video_data') or
+                processed_data.get('youtube_url') or len(processed_data.get('images') or []) > 1):
+            return None
+            
+        triage = frame_triage.assess(processed_data.get('image_data'))
+        if triage and triage['decision'] != FULL:
+            self.logger.info(f"Frame triage: {triage['decision']} ({'; '.join(triage['reasons'])})")
+        return triage
+        
+    def _create_rejected_frame_response(self, session_id: str, scene_data: Dict[str, Any],
+                                        triage: Dict[str, Any], lite: bool = False) -> Dict[str, Any]:
+        """Record and return the result for a frame triage rejected without any model calls"""
+        reasons = '; '.join(triage['reasons'])
+        message = f"Frame not analyzed: {reasons}. Recapture the scene if it may contain evidence."
+        alerts = [{
+            'level': 'WARNING',
+            'message': message,
+            'timestamp': time.time(),
+            'type': 'triage'
+        }]
+        
+        if lite:
+            results = dict(self._build_lite_payload({}, message), triage=triage, duration=0.0, deadline_met=True)
+        else:
+            results = {
+                'timestamp': time.time(),
+                'status': 'triaged',
+                'triage': triage,
+                'agent_analysis': {},
+                'supplementary_analysis': {'skipped': 'Frame rejected by triage'},
+                'tactical_summary': message,
+                'command_briefing': message,
+                'pending_artifacts': [],
+                'confidence_metrics': {'overall_confidence': 0.0},
+                'actionable_intelligence': {'immediate_actions': ['Recapture the scene']},
+            }
+        results['alerts'] = alerts
+        
+        results['analysis_id'] = self._store_analysis_results(session_id, scene_data, results)
+        return results
+        
+    def _build_lite_payload(self, analysis_results: Dict[str, Any],
+                            tactical_summary: Optional[str]) -> Dict[str, Any]:
+        """Build the compact lite response: levels, top findings, actions and alerts"""
+        assessment = analysis_results.get('overall_assessment', {})
+        agent_data = analysis_results.get('agent_results', {})
+        hazard_result = agent_data.get('hazard_detector', {})
+        mopp_metadata = agent_data.get('mopp_recommender', {}).get('metadata', {})
+        
+        if tactical_summary and tactical_summary.startswith('Error'):
+            tactical_summary = None
             
-    def _preprocess_scene_data(self, scene_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Preprocess scene data for analysis"""
+        return {
+            'timestamp': time.time(),
+            'analysis_mode': 'lite',
+            'threat_level': assessment.get('threat_level', 'UNKNOWN'),
+            'overall_confidence': round(assessment.get('overall_confidence', 0.0), 2),
+            'mopp_level': mopp_metadata.get('mopp_level'),
+            'findings': hazard_result.get('findings', [])[:LITE_MAX_ITEMS],
+            'immediate_actions': analysis_results.get('unified_recommendations', [])[:LITE_MAX_ITEMS],
+            'alerts': [
+                {'level': alert['level'], 'message': alert['message']}
+                for alert in self._generate_alerts(analysis_results)
+            ],
+            'tactical_summary': tactical_summary[:LITE_SUMMARY_CHARS] if tactical_summary else None,
+            'failed_agents': [
+                agent_name for agent_name, result in agent_data.items()
+                if result.get('metadata', {}).get('error')
+            ]
+        }
+        
+    def scene_flight_key(self, session_id: str, scene_data: Dict[str, Any],
+                         user_feedback: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Key identifying identical analyses: session, media digest and analysis options
+        
+        None if the media cannot be read or digested, in which case the request is not coalesced
+        and the pipeline reports the error itself.
+        """
+        digest = hashlib.sha256()
+        
+        try:
+            for field in ('image_path', 'video_path'):
+                if scene_data.get(field):
+                    digest.update(file_digest(scene_data[field]).encode())
+            for path in scene_data.get('image_paths') or []:
+                digest.update(file_digest(path).encode())
+            for field in ('image_file', 'video_file'):
+                if scene_data.get(field) is not None:
+                    digest.update(self._upload_digest(scene_data[field]).encode())
+        except Exception as e:
+            self.logger.warning(f"Analyzing without request coalescing: {str(e)}")
+            return None
+                
+        # Request metadata such as timestamps does not change the analysis
+        options = {
+            key: value for key, value in scene_data.items()
+            if key not in ('image_path', 'image_paths', 'video_path', 'image_file', 'video_file', 'metadata')
+        }
+        options['user_feedback'] = user_feedback
+        digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+        
+        return f"{session_id}:{digest.hexdigest()}"
+        
+    def _upload_digest(self, upload) -> str:
+        """SHA-256 hex digest of an uploaded file object's contents, leaving its position unchanged"""
+        position = upload.tell()
+        contents = upload.read()
+        upload.seek(position)
+        return hashlib.sha256(contents).hexdigest()
+        
+    def _preprocess_scene_data(self, scene_data: Dict[str, Any], max_image_size: int = 2048,
+                               tiling: Optional[bool] = False) -> Dict[str, Any]:
+        """Preprocess scene data for analysis
+        
+        tiling True keeps the full-resolution original of images larger than a tile for tiled
+        analysis; None does so only for very large images.
+        """
         processed_data = scene_data.copy()
         
         # Handle image data
+        original_data = None
         if 'image_file' in scene_data:
-            image_data = self._process_image_file(scene_data['image_file'])
+            original_data = scene_data['image_file'].read()
+            image_data = self._process_image_file(io.BytesIO(original_data), max_image_size)
             processed_data['image_data'] = image_data
         elif 'image_path' in scene_data:
-            image_data = self._process_image_path(scene_data['image_path'])
+            image_data = self._process_image_path(scene_data['image_path'], max_image_size)
             processed_data['image_data'] = image_data
+            if tiling is not False:
+                with open(scene_data['image_path'], 'rb') as f:
+                    original_data = f.read()
+        elif 'image_paths' in scene_data:
+            # Photos of one scene go to each model call together; the first stands in where one image is needed
+            # Unreadable files are dropped so image numbers stay aligned with image_paths
+            images = [(path, self._process_image_path(path, max_image_size)) for path in scene_data['image_paths']]
+            processed_data['image_paths'] = [path for path, image_data in images if image_data]
+            processed_data['images'] = [image_data for path, image_data in images if image_data]
+            processed_data['image_data'] = processed_data['images'][0] if processed_data['images'] else b''
+                    
+        if self.tile_analyzer.should_tile(original_data, tiling):
+            processed_data['full_resolution_image'] = original_data
+            
+        # Score image complexity once for model routing
+        if processed_data.get('image_data'):
+            processed_data['image_complexity'] = model_router.image_complexity(
+                processed_data['image_data']
+            )
             
         # Handle video data
         if 'video_file' in scene_data:
@@ -88,6 +503,7 @@ class AnalysisService:
         
         if 'image_data' in processed_data:
             processed_data['metadata']['data_types'].append('image')
+            processed_data['metadata']['image_count'] = len(processed_data.get('images') or [0])
             
         if 'video_data' in processed_data:
             processed_data['metadata']['data_types'].append('video')
@@ -97,7 +513,7 @@ class AnalysisService:
             
         return processed_data
         
-    def _process_image_file(self, image_file) -> bytes:
+    def _process_image_file(self, image_file, max_size: int = 2048) -> bytes:
         """Process uploaded image file"""
         try:
             # Read image file
@@ -110,8 +526,7 @@ class AnalysisService:
             if image.mode != 'RGB':
                 image = image.convert('RGB')
                 
-            # Resize if too large (max 2048x2048)
-            max_size = 2048
+            # Resize if too large
             if image.width > max_size or image.height > max_size:
                 image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
                 
@@ -124,7 +539,7 @@ class AnalysisService:
             self.logger.error(f"Error processing image: {str(e)}")
             return b''
     
-    def _process_image_path(self, image_path: str) -> bytes:
+    def _process_image_path(self, image_path: str, max_size: int = 2048) -> bytes:
         """Process image file from path"""
         try:
             # Read image file from path
@@ -138,8 +553,7 @@ class AnalysisService:
             if image.mode != 'RGB':
                 image = image.convert('RGB')
                 
-            # Resize if too large (max 2048x2048)
-            max_size = 2048
+            # Resize if too large
             if image.width > max_size or image.height > max_size:
                 image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
                 
@@ -182,7 +596,7 @@ class AnalysisService:
         context_query = self._generate_context_query(scene_data)
         
         # Search for relevant knowledge
-        relevant_knowledge = self.vector_db.search_knowledge(context_query, limit=10)
+        relevant_knowledge = self.vector_db.search_knowledge(context_query, limit=RAG_KNOWLEDGE_LIMIT)
         
         # Add knowledge to scene data
         enhanced_data['rag_knowledge'] = relevant_knowledge
@@ -232,7 +646,8 @@ class AnalysisService:
             
     def _combine_analysis_results(self, agent_results: Dict[str, Any], 
                                 supplementary_analysis: Dict[str, Any],
-                                user_feedback: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                                user_feedback: Optional[Dict[str, Any]] = None,
+                                on_delta: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
         """Combine all analysis results into final output"""
         combined_results = {
             'timestamp': time.time(),
@@ -241,20 +656,21 @@ class AnalysisService:
             'user_feedback': user_feedback,
             'tactical_summary': '',
             'command_briefing': '',
+            'pending_artifacts': [],
             'confidence_metrics': {},
             'actionable_intelligence': {},
             'alerts': []
         }
         
-        # Generate tactical summary
-        combined_results['tactical_summary'] = self.gemini_service.generate_tactical_summary(
-            agent_results
-        )
-        
-        # Generate command briefing
-        combined_results['command_briefing'] = self.gemini_service.generate_command_briefing(
-            agent_results
-        )
+        # Generate tactical summary and command briefing unless deferred
+        for artifact, generator in self.artifact_generators.items():
+            if artifact in LAZY_ARTIFACTS:
+                combined_results[artifact] = None
+                combined_results['pending_artifacts'].append(artifact)
+            else:
+                combined_results[artifact] = generator(
+                    agent_results, self._bind_delta(on_delta, artifact)
+                )
         
         # Calculate confidence metrics
         combined_results['confidence_metrics'] = self._calculate_confidence_metrics(agent_results)
@@ -384,13 +800,36 @@ class AnalysisService:
                 
         return alerts
         
+    def refresh_derived_results(self, analysis_results: Dict[str, Any],
+                                agent_outputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Recompute confidence metrics, intelligence and alerts after agent outputs change"""
+        results = dict(analysis_results)
+        results['agent_analysis'] = agent_outputs
+        results['confidence_metrics'] = self._calculate_confidence_metrics(agent_outputs)
+        results['actionable_intelligence'] = self._generate_actionable_intelligence(agent_outputs)
+        results['alerts'] = self._generate_alerts(agent_outputs)
+        
+        # Lite analyses also carry the compact summary fields
+        if results.get('analysis_mode') == 'lite':
+            lite_payload = self._build_lite_payload(agent_outputs, None)
+            for field in ('timestamp', 'tactical_summary'):
+                lite_payload.pop(field)
+            results.update(lite_payload)
+            
+        return results
+        
     def _store_analysis_results(self, session_id: str, scene_data: Dict[str, Any], 
-                              analysis_results: Dict[str, Any]):
-        """Store analysis results in database"""
+                              analysis_results: Dict[str, Any],
+                              raw_outputs: Optional[Dict[str, Dict[str, Any]]] = None,
+                              scoring_context: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """Store analysis results and each agent's raw model text; return the new row id"""
+        # Speculative results nobody claims are discarded instead of stored
+        speculative_runner.await_claim()
+        
         try:
             scene_analysis = SceneAnalysis(
                 session_id=session_id,
-                image_path=scene_data.get('image_path'),
+                image_path=scene_data.get('image_path') or (scene_data.get('image_paths') or [None])[0],
                 video_path=scene_data.get('video_path'),
                 youtube_url=scene_data.get('youtube_url'),
                 analysis_results=analysis_results,
@@ -399,11 +838,25 @@ class AnalysisService:
             )
             
             db.session.add(scene_analysis)
+            db.session.flush()
+            
+            # Raw model text lets the analysis be re-scored later without calling Gemini
+            for agent_name, raw_output in (raw_outputs or {}).items():
+                db.session.add(AgentRawOutput(
+                    analysis_id=scene_analysis.id,
+                    agent_name=agent_name,
+                    model=raw_output.get('model'),
+                    raw_text=raw_output.get('raw_text'),
+                    scoring_context={'metadata': scoring_context or {}}
+                ))
+                
             db.session.commit()
+            return scene_analysis.id
             
         except Exception as e:
             self.logger.error(f"Error storing analysis results: {str(e)}")
             db.session.rollback()
+            return None
             
     def _create_error_response(self, error_message: str) -> Dict[str, Any]:
         """Create error response"""
@@ -465,3 +918,63 @@ class AnalysisService:
             self.logger.error(f"Error updating user feedback: {str(e)}")
             db.session.rollback()
             return False
+            
+    def get_analysis_artifact(self, session_id: str, analysis_id: int, artifact: str,
+                              on_delta: Optional[Callable[[str, str], None]] = None,
+                              user_type: Optional[str] = None) -> Optional[str]:
+        """Return a summary artifact, generating and memoizing it on first request"""
+        if artifact not in self.artifact_generators:
+            raise ValueError(f"Unknown artifact: {artifact}")
+            
+        analysis = SceneAnalysis.query.filter_by(
+            session_id=session_id,
+            id=analysis_id
+        ).first()
+        
+        if not analysis:
+            return None
+            
+        cached = (analysis.analysis_results or {}).get(artifact)
+        if cached:
+            return cached
+            
+        # Serialize generation per analysis so concurrent viewers share one model call
+        with self._get_artifact_lock(analysis_id, artifact):
+            db.session.refresh(analysis)
+            results = dict(analysis.analysis_results or {})
+            if results.get(artifact):
+                return results[artifact]
+                
+            with request_context(session_id=session_id, user_type=user_type):
+                text = self.artifact_generators[artifact](
+                    analysis.agent_outputs or {}, self._bind_delta(on_delta, artifact)
+                )
+            if text.startswith('Error'):
+                # Do not memoize failures; the next request retries
+                return text
+                
+            results[artifact] = text
+            results['pending_artifacts'] = [
+                name for name in results.get('pending_artifacts', []) if name != artifact
+            ]
+            
+            try:
+                # Reassign so SQLAlchemy detects the JSON column change
+                analysis.analysis_results = results
+                db.session.commit()
+            except Exception as e:
+                self.logger.error(f"Error memoizing {artifact}: {str(e)}")
+                db.session.rollback()
+                
+            return text
+            
+    def _bind_delta(self, on_delta: Optional[Callable[[str, str], None]],
+                    artifact: str) -> Optional[Callable[[str], None]]:
+        """Bind an artifact name to a (artifact, chunk) delta callback"""
+        if on_delta is None:
+            return None
+        return lambda chunk: on_delta(artifact, chunk)
+        
+    def _get_artifact_lock(self, analysis_id: int, artifact: str) -> threading.Lock:
+        """Get the generation lock for an analysis artifact"""
+        return self._artifact_locks[hash((analysis_id, artifact)) % len(self._artifact_locks)]
@@ -0,0 +1,222 @@
+"""
+Batch Scoring
+Vectorized NumPy versions of the agents' scalar scoring rules for many scenes at once
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agents.hazard_agent import HazardDetectionAgent
+from agents.registry import agent_registry
+
+# (minimum confidence, risk factors must exceed) per level, checked in order;
+# MODERATE needs either condition, the others both. Mirrors BaseAgent.determine_hazard_level.
+HAZARD_THRESHOLDS = {
+    'CRITICAL': (0.8, 2),
+    'HIGH': (0.6, 1),
+    'MODERATE': (0.4, 0)
+}
+
+def indicator_matrices(indicator_lists: Sequence[List[Dict[str, Any]]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack per-scene indicator dicts into zero-padded confidence and weight matrices"""
+    width = max((len(indicators) for indicators in indicator_lists), default=0)
+    confidences = np.zeros((len(indicator_lists), width))
+    weights = np.zeros((len(indicator_lists), width))
+
+    for row, indicators in enumerate(indicator_lists):
+        for column, indicator in enumerate(indicators):
+            confidences[row, column] = indicator.get('confidence', 0.0)
+            weights[row, column] = indicator.get('weight', 1.0)
+
+    return confidences, weights
+
+def batch_confidence(confidences: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """BaseAgent.calculate_confidence for each row; padding entries must have weight 0"""
+    scenes, width = confidences.shape
+    total_weight = np.zeros(scenes)
+    weighted_confidence = np.zeros(scenes)
+
+    # Accumulate column by column so sums round exactly like the scalar left-to-right sum
+    for column in range(width):
+        total_weight += weights[:, column]
+        weighted_confidence += confidences[:, column] * weights[:, column]
+
+    ratio = np.divide(
+        weighted_confidence, total_weight, out=np.zeros(scenes), where=total_weight != 0
+    )
+    return np.minimum(ratio, 1.0)
+
+def batch_hazard_level(confidence: np.ndarray, risk_factor_counts: np.ndarray,
+                       thresholds: Optional[Dict[str, Tuple[float, int]]] = None) -> np.ndarray:
+    """BaseAgent.determine_hazard_level for each scene; pass thresholds for what-if analysis"""
+    thresholds = thresholds or HAZARD_THRESHOLDS
+    critical_confidence, critical_risks = thresholds['CRITICAL']
+    high_confidence, high_risks = thresholds['HIGH']
+    moderate_confidence, moderate_risks = thresholds['MODERATE']
+
+    conditions = [
+        (confidence >= critical_confidence) & (risk_factor_counts > critical_risks),
+        (confidence >= high_confidence) & (risk_factor_counts > high_risks),
+        (confidence >= moderate_confidence) | (risk_factor_counts > moderate_risks)
+    ]
+    return np.select(conditions, ['CRITICAL', 'HIGH', 'MODERATE'], default='LOW')
+
+def batch_mopp_level(immediate_threats: np.ndarray, potential_threats: np.ndarray,
+                     ventilation_absent: np.ndarray, indoor: np.ndarray) -> np.ndarray:
+    """MOPPRecommendationAgent._determine_mopp_level for each scene"""
+    # Escalate based on immediate threats
+    mopp_level = np.select(
+        [immediate_threats >= 3, immediate_threats >= 2, immediate_threats >= 1], [4, 3, 2], default=0
+    )
+
+    # Escalate based on potential threats
+    mopp_level = np.where(
+        (potential_threats >= 5) & (mopp_level < 2), 2,
+        np.where((potential_threats >= 3) & (mopp_level < 1), 1, mopp_level)
+    )
+
+    # Adjust for environmental factors
+    mopp_level = np.where(ventilation_absent & (mopp_level < 2), mopp_level + 1, mopp_level)
+    mopp_level = np.where(indoor & (mopp_level < 1), mopp_level + 1, mopp_level)
+
+    return np.minimum(mopp_level, 4)
+
+def batch_hazard_level_from_mopp(mopp_levels: np.ndarray) -> np.ndarray:
+    """MOPPRecommendationAgent._determine_hazard_level_from_mopp for each scene"""
+    return np.select(
+        [mopp_levels >= 4, mopp_levels >= 3, mopp_levels >= 2, mopp_levels >= 1],
+        ['CRITICAL', 'HIGH', 'MODERATE', 'LOW'],
+        default='MINIMAL'
+    )
+
+def agent_confidence_matrices(agent_results: Sequence[Dict[str, Any]]
+                              ) -> Tuple[List[List[str]], np.ndarray, np.ndarray, np.ndarray]:
+    """Pack per-scene agent results into zero-padded name, confidence, weight and presence matrices
+
+    Column j of a row is the scene's j-th agent in the order its results were stored, which is the
+    order the scalar scoring summed them in; matching it keeps the batch sums exact to the last bit.
+    """
+    confidence_weights = agent_registry.confidence_weights()
+    width = max((len(results) for results in agent_results), default=0)
+    names = [list(results) for results in agent_results]
+    confidences = np.zeros((len(agent_results), width))
+    weights = np.zeros((len(agent_results), width))
+    present = np.zeros((len(agent_results), width), dtype=bool)
+
+    for row, results in enumerate(agent_results):
+        for column, (agent_name, result) in enumerate(results.items()):
+            confidences[row, column] = result.get('confidence', 0.0)
+            weights[row, column] = confidence_weights.get(agent_name, 1.0)
+            present[row, column] = True
+
+    return names, confidences, weights, present
+
+def batch_overall_confidence(confidences: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """The coordinator's weighted overall_confidence for each scene
+
+    Columns are each scene's agents in stored order, as from agent_confidence_matrices; padding has weight 0.
+    """
+    scenes, width = confidences.shape
+    total_weighted_confidence = np.zeros(scenes)
+    total_weight = np.zeros(scenes)
+
+    for column in range(width):
+        total_weighted_confidence += confidences[:, column] * weights[:, column]
+        total_weight += weights[:, column]
+
+    return np.divide(
+        total_weighted_confidence, total_weight, out=np.zeros(scenes), where=total_weight > 0
+    )
+
+def batch_consensus(confidences: np.ndarray,
+                    present: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Mean confidence, variance and consensus score per scene, as in the analysis confidence metrics
+
+    Columns are each scene's agents in stored order, as from agent_confidence_matrices.
+    """
+    scenes = confidences.shape[0]
+    present = np.ones(confidences.shape, dtype=bool) if present is None else present
+    overall_confidence = np.zeros(scenes)
+    variance = np.zeros(scenes)
+    consensus_score = np.ones(scenes)
+
+    # Rows with the same set of agents share a dense sub-matrix, so np.var matches the scalar call exactly
+    patterns, pattern_index = np.unique(present, axis=0, return_inverse=True)
+    for pattern_number, pattern in enumerate(patterns):
+        rows = np.flatnonzero(pattern_index.ravel() == pattern_number)
+        values = confidences[np.ix_(rows, np.flatnonzero(pattern))]
+        if values.shape[1] == 0:
+            continue
+
+        total = np.zeros(len(rows))
+        for column in range(values.shape[1]):
+            total += values[:, column]
+        overall_confidence[rows] = total / values.shape[1]
+
+        if values.shape[1] > 1:
+            variance[rows] = np.var(values, axis=1)
+            consensus_score[rows] = np.maximum(0, 1 - variance[rows])
+
+    return {
+        'overall_confidence': overall_confidence,
+        'variance': variance,
+        'consensus_score': consensus_score
+    }
+
+def rescore_stored_results(agent_results: Sequence[Dict[str, Dict[str, Any]]],
+                           hazard_thresholds: Optional[Dict[str, Tuple[float, int]]] = None) -> Dict[str, np.ndarray]:
+    """Re-derive levels and confidences of stored agent result dicts, one row per scene
+
+    Uses the indicators, findings and threat counts the agents stored, so no model text is re-parsed.
+    Scenes without a usable hazard or MOPP result get '' levels and -1 MOPP levels.
+    """
+    hazard_metadata = [results.get('hazard_detector', {}).get('metadata', {}) for results in agent_results]
+    mopp_metadata = [results.get('mopp_recommender', {}).get('metadata', {}) for results in agent_results]
+
+    # Hazard detector: confidence from stored indicators, risk factors from stored findings
+    has_hazard = np.array(['chemical_hazards' in metadata for metadata in hazard_metadata], dtype=bool)
+    confidences, weights = indicator_matrices([
+        metadata['chemical_hazards']['indicators'] + metadata['biological_hazards']['indicators']
+        if 'chemical_hazards' in metadata else []
+        for metadata in hazard_metadata
+    ])
+    hazard_confidence = batch_confidence(confidences, weights)
+    risk_factor_counts = np.array([
+        sum(any(keyword in finding.lower() for keyword in HazardDetectionAgent.RISK_FACTOR_KEYWORDS)
+            for finding in results.get('hazard_detector', {}).get('findings', []))
+        for results in agent_results
+    ], dtype=int)
+    hazard_level = np.where(
+        has_hazard, batch_hazard_level(hazard_confidence, risk_factor_counts, hazard_thresholds), ''
+    )
+
+    # MOPP recommender: level from stored threat counts and environmental factors
+    has_mopp = np.array([
+        'threat_analysis' in metadata and 'environmental_factors' in metadata for metadata in mopp_metadata
+    ], dtype=bool)
+    threats = [metadata.get('threat_analysis', {}) for metadata in mopp_metadata]
+    environment = [metadata.get('environmental_factors', {}) for metadata in mopp_metadata]
+    mopp_level = np.where(has_mopp, batch_mopp_level(
+        np.array([threat.get('immediate_threats', 0) for threat in threats], dtype=int),
+        np.array([threat.get('potential_threats', 0) for threat in threats], dtype=int),
+        np.array([factors.get('ventilation') == 'absent' for factors in environment], dtype=bool),
+        np.array([factors.get('space_type') == 'indoor' for factors in environment], dtype=bool)
+    ), -1)
+    mopp_hazard_level = np.where(has_mopp, batch_hazard_level_from_mopp(mopp_level), '')
+
+    # Overall and consensus confidence over every stored agent, in the order each scene stored them
+    agent_names, agent_confidences, agent_weights, present = agent_confidence_matrices(agent_results)
+    for row, names in enumerate(agent_names):
+        if has_hazard[row]:
+            agent_confidences[row, names.index('hazard_detector')] = hazard_confidence[row]
+
+    consensus = batch_consensus(agent_confidences, present)
+    return {
+        'hazard_confidence': np.where(has_hazard, hazard_confidence, 0.0),
+        'hazard_level': hazard_level,
+        'mopp_level': mopp_level,
+        'mopp_hazard_level': mopp_hazard_level,
+        'overall_confidence': batch_overall_confidence(agent_confidences, agent_weights),
+        'consensus_score': consensus['consensus_score']
+    }
@@ -0,0 +1,269 @@
+"""
+Batch Analysis Service
+Fans out analysis of evidence directories and manifests with database checkpointing
+"""
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import current_app
+
+from models import BatchJob, BatchItem, db
+
+logger = logging.getLogger(__name__)
+
+MEDIA_EXTENSIONS = {
+    'image': {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'},
+    'video': {'mp4', 'avi', 'mov', 'wmv', 'flv', 'webm'}
+}
+
+# Server directories API-created batches may read besides the upload folder, separated by os.pathsep
+BATCH_ROOTS = [root for root in os.environ.get("BATCH_ROOTS", "").split(os.pathsep) if root]
+
+# Shared by all batch runs so concurrent batches do not multiply worker threads
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("BATCH_MAX_WORKERS", "4")),
+    thread_name_prefix="batch-analysis"
+)
+
+def detect_file_type(path: str) -> Optional[str]:
+    """Get 'image' or 'video' from a file extension"""
+    extension = path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+    for file_type, extensions in MEDIA_EXTENSIONS.items():
+        if extension in extensions:
+            return file_type
+    return None
+
+class BatchService:
+    """Service for batch analysis of many evidence files
+
+    With allowed_roots, every source and file path must resolve inside one of those directories;
+    without, any path the process can read is accepted (for trusted callers such as batch_cli.py).
+    """
+
+    def __init__(self, analysis_service, allowed_roots: Optional[List[str]] = None):
+        self.analysis_service = analysis_service
+        self.allowed_roots = None if allowed_roots is None else [os.path.realpath(root) for root in allowed_roots]
+
+    def create_batch(self, source: str, session_id: Optional[str] = None) -> BatchJob:
+        """Create a batch from a directory or a JSON/JSONL manifest"""
+        source = self._check_path(source)
+        if os.path.isdir(source):
+            items = self._scan_directory(source)
+        else:
+            items = self._load_manifest(source)
+
+        return self.create_batch_from_items(items, session_id=session_id, source=source)
+
+    def create_batch_from_items(self, items: List[Dict[str, Any]], session_id: Optional[str] = None,
+                                source: Optional[str] = None) -> BatchJob:
+        """Create a batch from item dicts with file_path/file_type or youtube_url"""
+        items = [
+            dict(item, file_path=self._check_path(item['file_path'])) if item.get('file_path') else item
+            for item in items
+        ]
+        batch = BatchJob(session_id=session_id or 'batch', source=source, total_items=len(items))
+        db.session.add(batch)
+        db.session.flush()
+
+        if not session_id:
+            batch.session_id = f"batch-{batch.id}"
+
+        for item in items:
+            file_path = item.get('file_path')
+            db.session.add(BatchItem(
+                batch_id=batch.id,
+                file_path=file_path,
+                file_type=item.get('file_type') or (detect_file_type(file_path) if file_path else None),
+                youtube_url=item.get('youtube_url'),
+                item_metadata=item.get('metadata', {})
+            ))
+
+        db.session.commit()
+        logger.info(f"Created batch {batch.id} with {len(items)} items")
+        return batch
+
+    def run_batch(self, batch_id: int,
+                  progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Analyze all unfinished items of a batch; safe to call again to resume"""
+        app = current_app._get_current_object()
+        batch = db.session.get(BatchJob, batch_id)
+        if batch is None:
+            raise ValueError(f"Batch {batch_id} not found")
+
+        # Completed items are checkpointed and never re-analyzed
+        pending_ids = [
+            item.id for item in BatchItem.query.filter(
+                BatchItem.batch_id == batch_id,
+                BatchItem.status != 'completed'
+            ).all()
+        ]
+
+        batch.status = 'running'
+        batch.started_at = batch.started_at or datetime.utcnow()
+        db.session.commit()
+
+        run_start = time.time()
+        processed = 0
+        futures = [
+            batch_executor.submit(self._run_item, app, item_id, batch.session_id)
+            for item_id in pending_ids
+        ]
+
+        try:
+            for future in as_completed(futures):
+                future.result()
+                processed += 1
+                if progress_callback:
+                    progress_callback(self.get_progress(batch_id, run_start, processed))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            batch.status = 'interrupted'
+            db.session.commit()
+            raise
+
+        batch.status = 'completed'
+        batch.finished_at = datetime.utcnow()
+        db.session.commit()
+
+        return self.get_progress(batch_id, run_start, processed)
+
+    def claim_batch(self, batch_id: int) -> bool:
+        """Mark a batch running unless a run already holds it; the check and update are one statement"""
+        claimed = BatchJob.query.filter(
+            BatchJob.id == batch_id, BatchJob.status != 'running'
+        ).update({'status': 'running'}, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def get_progress(self, batch_id: int, run_start: Optional[float] = None,
+                     processed: int = 0) -> Dict[str, Any]:
+        """Get item counts, throughput and ETA for a batch"""
+        batch = db.session.get(BatchJob, batch_id)
+        if batch is None:
+            return {}
+
+        counts = {'pending': 0, 'running': 0, 'completed': 0, 'failed': 0}
+        for status, count in db.session.query(
+            BatchItem.status, db.func.count(BatchItem.id)
+        ).filter(BatchItem.batch_id == batch_id).group_by(BatchItem.status):
+            counts[status] = count
+
+        progress = {
+            'batch_id': batch_id,
+            'session_id': batch.session_id,
+            'status': batch.status,
+            'total_items': batch.total_items,
+            'item_counts': counts,
+            'throughput_per_minute': None,
+            'eta_seconds': None
+        }
+
+        # Throughput is measured over this run only, so resumed runs are not skewed
+        if run_start and processed:
+            elapsed = time.time() - run_start
+            throughput = processed / elapsed if elapsed > 0 else 0.0
+            remaining = counts['pending'] + counts['running']
+            progress['throughput_per_minute'] = throughput * 60
+            progress['eta_seconds'] = remaining / throughput if throughput > 0 else None
+
+        return progress
+
+    def _run_item(self, app, item_id: int, session_id: str):
+        """Analyze one item in its own app context and checkpoint the outcome"""
+        with app.app_context():
+            item = db.session.get(BatchItem, item_id)
+            item.status = 'running'
+            item.attempts = (item.attempts or 0) + 1
+            db.session.commit()
+
+            start_time = time.time()
+            try:
+                scene_data = self._build_scene_data(item, session_id)
+                results = self.analysis_service.analyze_scene(session_id, scene_data)
+
+                if results.get('error'):
+                    raise RuntimeError(results['error'])
+
+                item.status = 'completed'
+                item.analysis_id = results.get('analysis_id')
+                item.error = None
+
+            except Exception as e:
+                logger.error(f"Batch item {item_id} failed: {str(e)}")
+                db.session.rollback()
+                item = db.session.get(BatchItem, item_id)
+                item.status = 'failed'
+                item.error = str(e)
+
+            item.duration = time.time() - start_time
+            item.completed_at = datetime.utcnow()
+            db.session.commit()
+
+    def _build_scene_data(self, item: BatchItem, session_id: str) -> Dict[str, Any]:
+        """Build analyze_scene input for a batch item"""
+        scene_data = {}
+
+        if item.file_path:
+            if not os.path.exists(item.file_path):
+                raise FileNotFoundError(f"File not found: {item.file_path}")
+            if item.file_type == 'image':
+                scene_data['image_path'] = item.file_path
+            elif item.file_type == 'video':
+                scene_data['video_path'] = item.file_path
+
+        if item.youtube_url:
+            scene_data['youtube_url'] = item.youtube_url
+
+        if not scene_data:
+            raise ValueError("Item has no analyzable media")
+
+        scene_data['metadata'] = dict(item.item_metadata or {})
+        scene_data['metadata']['session_id'] = session_id
+        scene_data['metadata']['user_type'] = 'batch'
+        return scene_data
+
+    def _check_path(self, path: str) -> str:
+        """Resolved path if it lies inside an allowed root; raises PermissionError otherwise"""
+        if self.allowed_roots is None:
+            return path
+
+        resolved = os.path.realpath(path)
+        for root in self.allowed_roots:
+            if resolved == root or resolved.startswith(root + os.sep):
+                return resolved
+        raise PermissionError(f"Path outside the allowed batch directories: {path}")
+
+    def _scan_directory(self, directory: str) -> List[Dict[str, Any]]:
+        """List analyzable media files under a directory"""
+        items = []
+        for root, _, filenames in os.walk(directory):
+            for filename in sorted(filenames):
+                file_path = os.path.join(root, filename)
+                file_type = detect_file_type(file_path)
+                if file_type:
+                    items.append({'file_path': file_path, 'file_type': file_type})
+        return items
+
+    def _load_manifest(self, manifest_path: str) -> List[Dict[str, Any]]:
+        """Load items from a JSON list or JSONL manifest; relative file paths are relative to the manifest"""
+        with open(manifest_path) as f:
+            content = f.read()
+
+        if content.lstrip().startswith('['):
+            items = json.loads(content)
+        else:
+            items = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+        manifest_directory = os.path.dirname(os.path.abspath(manifest_path))
+        return [
+            dict(item, file_path=os.path.join(manifest_directory, item['file_path']))
+            if item.get('file_path') and not os.path.isabs(item['file_path']) else item
+            for item in items
+        ]
@@ -0,0 +1,172 @@
+"""
+Embedding Cache
+Bounded LRU of query embeddings with an optional on-disk tier, keyed by encoder identity and normalized text
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DISK_TRIM_INTERVAL = 100
+
+def normalize_query(text: str, lowercase: bool = False) -> str:
+    """Canonical form of a query: Unicode-normalized with whitespace collapsed
+
+    Only lowercase for encoders whose tokenizer is uncased, where case cannot change the vector.
+    """
+    text = " ".join(unicodedata.normalize('NFKC', text).split())
+    return text.lower() if lowercase else text
+
+class EmbeddingCache:
+    """Thread-safe LRU of embeddings in memory, backed by an optional SQLite file shared across restarts"""
+
+    def __init__(self, max_entries: int = 2048, disk_path: Optional[str] = None, disk_max_entries: int = 50000):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+        self._disk = self._open_disk(disk_path) if disk_path else None
+        self._disk_models = set()
+        self._disk_writes = 0
+
+    def get_many(self, model_id: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached embedding of each normalized text, or None for misses"""
+        with self._lock:
+            found = []
+            for text in texts:
+                vector = self._entries.get((model_id, text))
+                if vector is not None:
+                    self._entries.move_to_end((model_id, text))
+                    self._stats['memory_hits'] += 1
+                else:
+                    vector = self._disk_get(model_id, text)
+                    if vector is not None:
+                        self._remember((model_id, text), vector)
+                        self._stats['disk_hits'] += 1
+                    else:
+                        self._stats['misses'] += 1
+                found.append(list(vector) if vector is not None else None)
+            return found
+
+    def put_many(self, model_id: str, texts: List[str], vectors: List[List[float]]):
+        """Store embeddings of normalized texts in memory and on disk"""
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                self._remember((model_id, text), tuple(vector))
+            self._disk_put(model_id, texts, vectors)
+
+    def clear(self):
+        """Drop every cached embedding"""
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM embeddings")
+                self._disk.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get size, hit/miss counts and hit rate"""
+        with self._lock:
+            stats = dict(self._stats)
+            size = len(self._entries)
+        hits = stats.get('memory_hits', 0) + stats.get('disk_hits', 0)
+        misses = stats.get('misses', 0)
+        return {
+            'entries': size,
+            'disk_enabled': self._disk is not None,
+            'memory_hits': stats.get('memory_hits', 0),
+            'disk_hits': stats.get('disk_hits', 0),
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0
+        }
+
+    def _remember(self, key: Tuple[str, str], vector: Tuple[float, ...]):
+        """Insert into the memory tier, evicting the least recently used; call with _lock held"""
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _open_disk(self, path: str) -> Optional[sqlite3.Connection]:
+        """Open the on-disk tier, or None if it cannot be opened"""
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (model, text))"
+            )
+            connection.commit()
+            return connection
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Embedding disk cache unavailable at {path}: {e}")
+            return None
+
+    def _disk_get(self, model_id: str, text: str) -> Optional[Tuple[float, ...]]:
+        """Look up the disk tier; call with _lock held"""
+        if self._disk is None:
+            return None
+        self._purge_other_models(model_id)
+        try:
+            row = self._disk.execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND text = ?", (model_id, text)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading embedding disk cache: {e}")
+            return None
+        return tuple(array('f', row[0])) if row else None
+
+    def _disk_put(self, model_id: str, texts: List[str], vectors: List[List[float]]):
+        """Write to the disk tier, trimming the oldest entries past disk_max_entries; call with _lock held"""
+        if self._disk is None:
+            return
+        self._purge_other_models(model_id)
+        now = time.time()
+        try:
+            self._disk.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text, vector, created_at) VALUES (?, ?, ?, ?)",
+                [(model_id, text, array('f', vector).tobytes(), now) for text, vector in zip(texts, vectors)]
+            )
+            self._disk_writes += 1
+            # Trimming scans the table, so only do it every DISK_TRIM_INTERVAL writes
+            if self._disk_writes % DISK_TRIM_INTERVAL == 0:
+                self._disk.execute(
+                    "DELETE FROM embeddings WHERE rowid IN ("
+                    "SELECT rowid FROM embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_max_entries,)
+                )
+            self._disk.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Error writing embedding disk cache: {e}")
+
+    def _purge_other_models(self, model_id: str):
+        """Delete disk entries of other encoders the first time a model is seen; call with _lock held"""
+        if model_id in self._disk_models:
+            return
+        self._disk_models.add(model_id)
+        try:
+            deleted = self._disk.execute("DELETE FROM embeddings WHERE model != ?", (model_id,)).rowcount
+            self._disk.commit()
+            if deleted:
+                logger.info(f"Dropped {deleted} cached embeddings of other encoders")
+        except sqlite3.Error as e:
+            logger.warning(f"Error purging embedding disk cache: {e}")
+
+# Global embedding cache instance
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.environ.get("EMBEDDING_CACHE_SIZE", "2048")),
+    disk_path=os.environ.get("EMBEDDING_CACHE_PATH") or None,
+    disk_max_entries=int(os.environ.get("EMBEDDING_CACHE_DISK_MAX", "50000"))
+)
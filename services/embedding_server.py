@@ -0,0 +1,285 @@
+"""
+Embedding Server
+One shared encoder per host behind a Unix socket, coalescing concurrent requests into micro-batches
+"""
+
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Socket of a running embedding server; unset to encode in-process
+EMBEDDING_SERVER_SOCKET = os.environ.get("EMBEDDING_SERVER_SOCKET", "")
+# How long the first request of a batch waits for others to join
+EMBEDDING_SERVER_WINDOW_MS = float(os.environ.get("EMBEDDING_SERVER_WINDOW_MS", "5"))
+# Texts per micro-batch; larger requests are encoded alone
+EMBEDDING_SERVER_MAX_BATCH = int(os.environ.get("EMBEDDING_SERVER_MAX_BATCH", "64"))
+EMBEDDING_SERVER_TIMEOUT = float(os.environ.get("EMBEDDING_SERVER_TIMEOUT", "30"))
+
+# Frame: header length and payload length, then a JSON header and raw float32 payload
+_FRAME = struct.Struct('>II')
+
+def _send(connection: socket.socket, header: Dict[str, Any], payload: bytes = b''):
+    """Write one frame"""
+    data = json.dumps(header).encode()
+    connection.sendall(_FRAME.pack(len(data), len(payload)) + data + payload)
+
+def _receive(connection: socket.socket) -> Tuple[Dict[str, Any], bytes]:
+    """Read one frame; raises ConnectionError when the peer hangs up"""
+    header_length, payload_length = _FRAME.unpack(_read_exact(connection, _FRAME.size))
+    header = json.loads(_read_exact(connection, header_length))
+    return header, _read_exact(connection, payload_length)
+
+def _read_exact(connection: socket.socket, length: int) -> bytes:
+    """Read exactly length bytes"""
+    chunks = []
+    while length:
+        chunk = connection.recv(min(length, 1 << 20))
+        if not chunk:
+            raise ConnectionError("embedding server connection closed")
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+class MicroBatcher:
+    """Single encoding thread that merges requests arriving within a short window into one encoder call"""
+
+    def __init__(self, encode: Callable[[List[str]], Any], max_batch: int = EMBEDDING_SERVER_MAX_BATCH,
+                 window_ms: float = EMBEDDING_SERVER_WINDOW_MS):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.window_seconds = window_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        """Queue texts for encoding; the future resolves to a float32 array with one row per text"""
+        future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get request, batch and text counts"""
+        with self._lock:
+            stats = dict(self._stats)
+        batches = stats.get('batches', 0)
+        return {
+            'requests': stats.get('requests', 0),
+            'batches': batches,
+            'texts': stats.get('texts', 0),
+            'mean_batch_texts': round(stats.get('texts', 0) / batches, 1) if batches else 0.0
+        }
+
+    def _run(self):
+        """Collect and encode batches forever"""
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.window_seconds
+
+            # Requests that queued up during the previous encode join without waiting
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                embeddings = np.asarray(self.encode(texts), dtype=np.float32)
+            except Exception as e:
+                logger.error(f"Error encoding embedding batch: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._lock:
+                self._stats['requests'] += len(batch)
+                self._stats['batches'] += 1
+                self._stats['texts'] += len(texts)
+
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    """Serves requests of one client connection until it closes"""
+
+    def handle(self):
+        server = self.server.embedding_server
+        while True:
+            try:
+                request, _ = _receive(self.request)
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                _send(self.request, *server.respond(request))
+            except (ConnectionError, OSError):
+                return
+
+class EmbeddingServer:
+    """Unix socket front end of a MicroBatcher around one encoder"""
+
+    def __init__(self, encoder, backend: str, model_name: str, socket_path: str,
+                 max_batch: int = EMBEDDING_SERVER_MAX_BATCH, window_ms: float = EMBEDDING_SERVER_WINDOW_MS):
+        self.encoder = encoder
+        self.socket_path = socket_path
+        self.info = {
+            'model': model_name,
+            'backend': backend,
+            'dimension': encoder.get_sentence_embedding_dimension(),
+            'do_lower_case': bool(getattr(getattr(encoder, 'tokenizer', None), 'do_lower_case', False))
+        }
+        self.batcher = MicroBatcher(
+            lambda texts: encoder.encode(texts, batch_size=max_batch, show_progress_bar=False),
+            max_batch=max_batch, window_ms=window_ms
+        )
+
+    def respond(self, request: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+        """Answer one request with a header and payload"""
+        op = request.get('op')
+        if op == 'info':
+            return self.info, b''
+        if op == 'stats':
+            return self.batcher.get_stats(), b''
+        if op != 'encode':
+            return {'error': f"unknown op {op!r}"}, b''
+
+        try:
+            embeddings = self.batcher.submit(list(request['texts'])).result()
+        except Exception as e:
+            return {'error': str(e)}, b''
+        return {'rows': len(embeddings), 'dimension': self.info['dimension']}, embeddings.tobytes()
+
+    def serve_forever(self):
+        """Listen on the socket until interrupted"""
+        if os.path.exists(self.socket_path):
+            if _socket_in_use(self.socket_path):
+                raise RuntimeError(f"An embedding server is already listening on {self.socket_path}")
+            os.unlink(self.socket_path)
+
+        with socketserver.ThreadingUnixStreamServer(self.socket_path, _ConnectionHandler) as server:
+            server.daemon_threads = True
+            server.embedding_server = self
+            os.chmod(self.socket_path, 0o660)
+            logger.info(f"Embedding server for {self.info['model']} ({self.info['backend']}) on {self.socket_path}")
+            try:
+                server.serve_forever()
+            finally:
+                os.unlink(self.socket_path)
+
+def _socket_in_use(socket_path: str) -> bool:
+    """Whether something accepts connections on a socket file"""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+class EmbeddingClient:
+    """Encoder stand-in that sends texts to the embedding server, one connection per thread"""
+
+    def __init__(self, socket_path: str = EMBEDDING_SERVER_SOCKET, timeout: float = EMBEDDING_SERVER_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+        info, _ = self._request({'op': 'info'})
+        self.model_name = info['model']
+        self.backend = info['backend']
+        self.dimension = info['dimension']
+        # Read by the embedding cache to decide whether queries may be case-folded
+        self.tokenizer = SimpleNamespace(do_lower_case=info['do_lower_case'])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        """Size of the embedding vectors"""
+        return self.dimension
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               show_progress_bar: bool = False) -> np.ndarray:
+        """Embed one text or a list of texts; long lists go in batch_size requests so queries can interleave"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        parts = []
+        for start in range(0, len(texts), max(batch_size, 1)):
+            header, payload = self._request({'op': 'encode', 'texts': texts[start:start + batch_size]})
+            parts.append(np.frombuffer(payload, dtype=np.float32).reshape(header['rows'], header['dimension']))
+        embeddings = np.concatenate(parts) if parts else np.zeros((0, self.dimension), dtype=np.float32)
+
+        return embeddings[0] if single else embeddings
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the server's batching statistics"""
+        return self._request({'op': 'stats'})[0]
+
+    def _request(self, message: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+        """Send a request on this thread's connection, reconnecting once if the server restarted"""
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                _send(connection, message)
+                header, payload = _receive(connection)
+                break
+            except (ConnectionError, OSError):
+                self._close()
+                if attempt:
+                    raise
+
+        if 'error' in header:
+            raise RuntimeError(f"Embedding server error: {header['error']}")
+        return header, payload
+
+    def _connection(self) -> socket.socket:
+        """This thread's connection, opened on first use"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            connection.connect(self.socket_path)
+            self._local.connection = connection
+        return connection
+
+    def _close(self):
+        """Drop this thread's connection"""
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            connection.close()
+
+def connect_embedding_server(socket_path: str = EMBEDDING_SERVER_SOCKET) -> Optional[EmbeddingClient]:
+    """Client of the configured embedding server, or None if it is not configured or not reachable"""
+    if not socket_path:
+        return None
+
+    try:
+        client = EmbeddingClient(socket_path)
+        logger.info(f"Using embedding server at {socket_path} ({client.model_name}, {client.backend})")
+        return client
+    except Exception as e:
+        logger.warning(f"Embedding server at {socket_path} unavailable, encoding in-process: {e}")
+        return None
@@ -1,13 +1,65 @@
 import json
 import logging
 import os
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Type
 import base64
+import time
 
 from google import genai
 from google.genai import types
 from pydantic import BaseModel
 
+from services.model_router import model_router, PRO_MODEL
+from services.resilience import resilient_caller, GeminiError
+from services.quota_scheduler import quota_scheduler, estimate_tokens, get_request_context
+from services.priority import PRIORITY_WEIGHTS
+from services.multi_image import MULTI_IMAGE_INSTRUCTIONS, STRUCTURED_MULTI_IMAGE_INSTRUCTIONS, image_label
+
+class HazardItem(BaseModel):
+    """A single hazard observed in the scene"""
+    description: str
+    category: str  # 'chemical', 'biological', 'physical', 'environmental'
+    severity: str  # 'CRITICAL', 'HIGH', 'MODERATE', 'LOW'
+    confidence: float
+
+class OperationalAssessment(BaseModel):
+    """Assessment of the operation depicted in the scene"""
+    operation_type: str
+    sophistication_level: str
+    scale: str
+    security_measures: List[str]
+
+class EvidenceIndicator(BaseModel):
+    """A piece of evidence relevant to the investigation"""
+    description: str
+    category: str  # 'smoking_gun', 'precursor', 'equipment', 'waste'
+    confidence: float
+
+class ConfidenceAssessment(BaseModel):
+    """Reliability of the overall assessment"""
+    overall_confidence: float
+    visual_reliability: str
+    areas_for_investigation: List[str]
+
+class ComprehensiveSceneAnalysis(BaseModel):
+    """Schema-constrained response for comprehensive scene analysis"""
+    immediate_hazards: List[HazardItem]
+    operational_assessment: OperationalAssessment
+    evidence_indicators: List[EvidenceIndicator]
+    tactical_recommendations: List[str]
+    confidence_assessment: ConfidenceAssessment
+
+class TileFinding(BaseModel):
+    """A detail found in one tile of a high-resolution image"""
+    description: str
+    category: str  # 'label', 'container', 'equipment', 'chemical', 'hazard'
+    box: List[float]  # [x0, y0, x1, y1] as fractions of the tile
+    confidence: float
+
+class TileAnalysis(BaseModel):
+    """Schema-constrained response for one image tile"""
+    findings: List[TileFinding]
+
 class GeminiService:
     """Service for interacting with Google Gemini API"""
     
@@ -15,11 +67,47 @@ class GeminiService:
         self.logger = logging.getLogger("gemini_service")
         self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY", "default_key"))
         
-    def analyze_image_with_prompt(self, image_data: bytes, prompt: str) -> str:
+    def _timed_generate(self, model: str, **kwargs):
+        """Call generate_content through the quota scheduler and resilience layer
+        
+        Raises GeminiError when the call fails after retries or the model's circuit is open.
+        """
+        # Captured here because hedged attempts run on other threads
+        context = get_request_context()
+        estimated_tokens = estimate_tokens(kwargs.get('contents'))
+        
+        def generate():
+            self._acquire_quota(model, estimated_tokens, context)
+            start_time = time.time()
+            response = self.client.models.generate_content(model=model, **kwargs)
+            model_router.record_latency(model, time.time() - start_time)
+            self._settle_quota(model, estimated_tokens, response)
+            return response
+            
+        return resilient_caller.call(model, generate)
+        
+    def _acquire_quota(self, model: str, estimated_tokens: int, context: Dict[str, Any]):
+        """Wait for the model's quota in the session's fair-share queue"""
+        wait_time = quota_scheduler.acquire(
+            model, estimated_tokens,
+            session_id=context.get('session_id'),
+            user_type=context.get('user_type'),
+            weight=PRIORITY_WEIGHTS.get(context.get('priority'))
+        )
+        if wait_time > 1.0:
+            self.logger.info(f"Waited {wait_time:.1f}s for {model} quota")
+            
+    def _settle_quota(self, model: str, estimated_tokens: int, response):
+        """Reconcile the token estimate with reported usage"""
+        usage = getattr(response, 'usage_metadata', None)
+        quota_scheduler.settle(model, estimated_tokens, getattr(usage, 'total_token_count', None))
+        
+    def analyze_image_with_prompt(self, image_data: bytes, prompt: str,
+                                  model: str = PRO_MODEL) -> str:
         """Analyze image with custom prompt"""
         try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-pro",
+            response = self._timed_generate(
+                model,
                 contents=[
                     types.Part.from_bytes(
                         data=image_data,
@@ -31,15 +119,43 @@ class GeminiService:
             
             return response.text if response.text else "No analysis generated"
             
-        except Exception as e:
+        except GeminiError as e:
+            # Propagate so agents report a failure instead of scanning error text
             self.logger.error(f"Error in image analysis: {str(e)}")
-            return f"Error in image analysis: {str(e)}"
+            raise
+            
+    def analyze_images_with_prompt(self, images: List[bytes], prompt: str,
+                                   model: str = PRO_MODEL) -> str:
+        """Analyze several images of one scene in a single request, answered per image"""
+        try:
+            response = self._timed_generate(
+                model,
+                contents=self._image_parts(images) + [
+                    prompt + MULTI_IMAGE_INSTRUCTIONS.format(count=len(images))
+                ],
+            )
+            
+            return response.text if response.text else "No analysis generated"
             
-    def analyze_video_with_prompt(self, video_data: bytes, prompt: str) -> str:
+        except GeminiError as e:
+            # Propagate so agents report a failure instead of scanning error text
+            self.logger.error(f"Error in multi-image analysis: {str(e)}")
+            raise
+            
+    def _image_parts(self, images: List[bytes]) -> List[Any]:
+        """Labelled JPEG parts for a multi-image request"""
+        parts = []
+        for number, image_data in enumerate(images, start=1):
+            parts.append(image_label(number))
+            parts.append(types.Part.from_bytes(data=image_data, mime_type="image/jpeg"))
+        return parts
+        
+    def analyze_video_with_prompt(self, video_data: bytes, prompt: str,
+                                  model: str = PRO_MODEL) -> str:
         """Analyze video with custom prompt"""
         try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-pro",
+            response = self._timed_generate(
+                model,
                 contents=[
                     types.Part.from_bytes(
                         data=video_data,
@@ -51,10 +167,51 @@ class GeminiService:
             
             return response.text if response.text else "No analysis generated"
             
-        except Exception as e:
+        except GeminiError as e:
+            # Propagate so agents report a failure instead of scanning error text
             self.logger.error(f"Error in video analysis: {str(e)}")
-            return f"Error in video analysis: {str(e)}"
+            raise
             
+    def analyze_media_structured(self, media_data: bytes, mime_type: str, prompt: str,
+                                 schema: Type[BaseModel], model: str = PRO_MODEL) -> BaseModel:
+        """Analyze image or video with a schema-constrained JSON response"""
+        response = self._timed_generate(
+            model,
+            contents=[
+                types.Part.from_bytes(
+                    data=media_data,
+                    mime_type=mime_type,
+                ),
+                prompt
+            ],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=schema,
+            ),
+        )
+        
+        if isinstance(response.parsed, schema):
+            return response.parsed
+        return schema.model_validate_json(response.text or "")
+        
+    def _analyze_images_structured(self, images: List[bytes], prompt: str,
+                                   schema: Type[BaseModel], model: str = PRO_MODEL) -> BaseModel:
+        """Analyze several images of one scene with a schema-constrained JSON response"""
+        response = self._timed_generate(
+            model,
+            contents=self._image_parts(images) + [
+                prompt + STRUCTURED_MULTI_IMAGE_INSTRUCTIONS.format(count=len(images))
+            ],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=schema,
+            ),
+        )
+        
+        if isinstance(response.parsed, schema):
+            return response.parsed
+        return schema.model_validate_json(response.text or "")
+        
     def analyze_scene_comprehensively(self, scene_data: Dict[str, Any]) -> Dict[str, Any]:
         """Perform comprehensive scene analysis"""
         prompt = """
@@ -89,29 +246,105 @@ class GeminiService:
            - Certainty of threat assessment
            - Areas requiring additional investigation
         
-        Format the response as structured JSON with clear sections and confidence scores.
+        Confidence scores are between 0.0 and 1.0.
         """
         
+        model = model_router.select_model(
+            'comprehensive',
+            latency_budget=scene_data.get('latency_budget'),
+            complexity=scene_data.get('image_complexity')
+        )
+        
         try:
-            if scene_data.get('image_data'):
-                analysis_text = self.analyze_image_with_prompt(scene_data['image_data'], prompt)
+            if len(scene_data.get('images') or []) > 1:
+                analysis = self._analyze_images_structured(
+                    scene_data['images'], prompt, ComprehensiveSceneAnalysis, model
+                )
+            elif scene_data.get('image_data'):
+                analysis = self.analyze_media_structured(
+                    scene_data['image_data'], "image/jpeg", prompt, ComprehensiveSceneAnalysis, model
+                )
             elif scene_data.get('video_data'):
-                analysis_text = self.analyze_video_with_prompt(scene_data['video_data'], prompt)
+                analysis = self.analyze_media_structured(
+                    scene_data['video_data'], "video/mp4", prompt, ComprehensiveSceneAnalysis, model
+                )
             else:
                 return {'error': 'No image or video data provided'}
                 
-            # Try to parse as JSON, fall back to structured text
-            try:
-                return json.loads(analysis_text)
-            except json.JSONDecodeError:
-                return {'comprehensive_analysis': analysis_text}
+            return analysis.model_dump()
                 
         except Exception as e:
             self.logger.error(f"Error in comprehensive scene analysis: {str(e)}")
             return {'error': f"Analysis failed: {str(e)}"}
             
-    def generate_tactical_summary(self, analysis_results: Dict[str, Any]) -> str:
-        """Generate tactical summary for operators"""
+    def analyze_image_tile(self, tile_data: bytes, model: str) -> List[Dict[str, Any]]:
+        """Find small details in one tile of a high-resolution image
+        
+        Raises on failure so failed tiles are not cached.
+        """
+        prompt = """
+        This is one tile cut from a high-resolution image of a possible ChemBio scene.
+        Report only details visible in this tile, reading them as closely as the resolution allows:
+        
+        - Container labels, chemical names, hazard pictograms and UN/NFPA markings
+        - Containers, their condition and any leaks or residue
+        - Laboratory glassware and process equipment
+        - Visible chemicals, powders and liquids
+        - Physical and environmental hazards
+        
+        For each finding give a category ('label', 'container', 'equipment', 'chemical' or 'hazard'),
+        a bounding box [x0, y0, x1, y1] as fractions (0.0 - 1.0) of the tile width and height,
+        and a confidence between 0.0 and 1.0. Return no findings for tiles with nothing relevant.
+        """
+        
+        analysis = self.analyze_media_structured(tile_data, "image/jpeg", prompt, TileAnalysis, model)
+        return [finding.model_dump() for finding in analysis.findings]
+        
+    def _generate_text(self, model: str, prompt: str,
+                       on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Generate text, streaming chunks to on_delta when a callback is given"""
+        if on_delta is None:
+            response = self._timed_generate(
+                model,
+                contents=prompt
+            )
+            return response.text or ""
+            
+        context = get_request_context()
+        estimated_tokens = estimate_tokens(prompt)
+        
+        def stream():
+            self._acquire_quota(model, estimated_tokens, context)
+            start_time = time.time()
+            chunks = []
+            # Usage is reported with the stream's chunks, completely on the last one
+            usage_chunk = None
+            try:
+                for chunk in self.client.models.generate_content_stream(
+                    model=model,
+                    contents=prompt
+                ):
+                    if getattr(chunk, 'usage_metadata', None) is not None:
+                        usage_chunk = chunk
+                    if chunk.text:
+                        chunks.append(chunk.text)
+                        try:
+                            on_delta(chunk.text)
+                        except Exception as e:
+                            # A broken listener must not abort generation
+                            self.logger.warning(f"Error forwarding stream chunk: {str(e)}")
+                            
+                model_router.record_latency(model, time.time() - start_time)
+                return "".join(chunks)
+            finally:
+                self._settle_quota(model, estimated_tokens, usage_chunk)
+            
+        # Chunks already forwarded cannot be retracted, so streams are not retried
+        return resilient_caller.call_once(model, stream)
+        
+    def generate_tactical_summary(self, analysis_results: Dict[str, Any],
+                                  on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Generate tactical summary for operators, optionally streaming chunks to on_delta"""
         prompt = f"""
         Based on the following analysis results, generate a concise tactical summary for field operators:
         
@@ -128,19 +361,17 @@ class GeminiService:
         """
         
         try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
+            text = self._generate_text(model_router.select_model('tactical_summary'), prompt, on_delta)
             
-            return response.text if response.text else "Unable to generate tactical summary"
+            return text if text else "Unable to generate tactical summary"
             
         except Exception as e:
             self.logger.error(f"Error generating tactical summary: {str(e)}")
             return f"Error generating summary: {str(e)}"
             
-    def generate_command_briefing(self, analysis_results: Dict[str, Any]) -> str:
-        """Generate detailed briefing for command center"""
+    def generate_command_briefing(self, analysis_results: Dict[str, Any],
+                                  on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """Generate detailed briefing for command center, optionally streaming chunks to on_delta"""
         prompt = f"""
         Based on the following analysis results, generate a comprehensive briefing for command center personnel:
         
@@ -159,12 +390,9 @@ class GeminiService:
         """
         
         try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-pro",
-                contents=prompt
-            )
+            text = self._generate_text(model_router.select_model('command_briefing'), prompt, on_delta)
             
-            return response.text if response.text else "Unable to generate command briefing"
+            return text if text else "Unable to generate command briefing"
             
         except Exception as e:
             self.logger.error(f"Error generating command briefing: {str(e)}")
@@ -187,8 +415,8 @@ class GeminiService:
         """
         
         try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
+            response = self._timed_generate(
+                model_router.select_model('youtube'),
                 contents=prompt
             )
             
@@ -0,0 +1,284 @@
+"""
+Knowledge Ingestion
+Streams documents from JSONL files or directories into the vector database in chunked, resumable batches
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from services.vector_db import CATEGORY_COLLECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Chunks embedded and written per batch
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "256"))
+# Chunk length and overlap between consecutive chunks, in characters
+INGEST_CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", "1500"))
+INGEST_CHUNK_OVERLAP = int(os.environ.get("INGEST_CHUNK_OVERLAP", "200"))
+INGEST_CHECKPOINT_DIR = os.environ.get("INGEST_CHECKPOINT_DIR", "./instance/ingest_checkpoints")
+
+TEXT_EXTENSIONS = {'txt', 'md'}
+RECORD_EXTENSIONS = {'json', 'jsonl'}
+
+def chunk_text(text: str, chunk_size: int = INGEST_CHUNK_SIZE, overlap: int = INGEST_CHUNK_OVERLAP) -> List[str]:
+    """Split text into overlapping chunks, breaking at paragraph or word boundaries where possible"""
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Prefer a paragraph break, then a word break, in the second half of the window
+            floor = start + chunk_size // 2
+            for separator in ('\n\n', '\n', ' '):
+                boundary = text.rfind(separator, floor, end)
+                if boundary > start:
+                    end = boundary
+                    break
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+
+        # Step back by the overlap, then forward to the next word so chunks do not start mid-word
+        next_start = max(end - overlap, start + 1)
+        word_start = text.find(' ', next_start, end)
+        start = word_start + 1 if overlap and word_start != -1 else next_start
+
+    return chunks
+
+def chunk_document(document: Dict[str, Any], chunk_size: int = INGEST_CHUNK_SIZE,
+                   overlap: int = INGEST_CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """Split a document into knowledge entries; single-chunk documents keep their id"""
+    chunks = chunk_text(document['content'], chunk_size, overlap)
+    if len(chunks) == 1:
+        return [{**document, 'content': chunks[0]}]
+
+    return [
+        {
+            **document,
+            'id': f"{document['id']}#{index}",
+            'content': chunk,
+            'document_id': document['id'],
+            'chunk': index,
+            'chunks': len(chunks)
+        }
+        for index, chunk in enumerate(chunks)
+    ]
+
+class KnowledgeIngestor:
+    """Bulk loader for the vector database with checkpointing after every written batch"""
+
+    def __init__(self, vector_db, batch_size: int = INGEST_BATCH_SIZE, chunk_size: int = INGEST_CHUNK_SIZE,
+                 chunk_overlap: int = INGEST_CHUNK_OVERLAP, checkpoint_dir: str = INGEST_CHECKPOINT_DIR):
+        self.vector_db = vector_db
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.checkpoint_dir = checkpoint_dir
+
+    def ingest(self, source: str, category: Optional[str] = None, resume: bool = True,
+               progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Load a JSONL file or directory; an interrupted run continues from its last written batch
+
+        Writes are upserts with ids derived from the documents, so re-ingesting a source is idempotent.
+        """
+        fingerprint = self._fingerprint(source)
+        checkpoint_path = self._checkpoint_path(source)
+        checkpoint = self._load_checkpoint(checkpoint_path) if resume else None
+        if checkpoint and checkpoint.get('fingerprint') != fingerprint:
+            logger.info(f"{source} changed since the interrupted run; starting over")
+            checkpoint = None
+
+        skip_documents = checkpoint['documents'] if checkpoint else 0
+        progress = {
+            'source': source,
+            'documents': skip_documents,
+            'chunks': checkpoint['chunks'] if checkpoint else 0,
+            'resumed_from': skip_documents,
+            'invalid_records': 0,
+            'elapsed_seconds': 0.0,
+            'chunks_per_second': None
+        }
+        if skip_documents:
+            logger.info(f"Resuming ingestion of {source} after {skip_documents} documents")
+
+        started_at = time.time()
+        written_this_run = 0
+        pending = []
+        pending_documents = 0
+
+        def flush():
+            nonlocal pending, pending_documents, written_this_run
+            if pending:
+                written = self.vector_db.add_knowledge_batch(pending, upsert=True)
+                written_this_run += written
+                progress['chunks'] += written
+            progress['documents'] += pending_documents
+            pending, pending_documents = [], 0
+
+            elapsed = time.time() - started_at
+            progress['elapsed_seconds'] = round(elapsed, 1)
+            progress['chunks_per_second'] = round(written_this_run / elapsed, 1) if elapsed > 0 else None
+            self._save_checkpoint(checkpoint_path, {
+                'source': source,
+                'fingerprint': fingerprint,
+                'documents': progress['documents'],
+                'chunks': progress['chunks']
+            })
+            if progress_callback:
+                progress_callback(dict(progress))
+
+        for index, document in enumerate(self.iter_documents(source, category, progress)):
+            if index < skip_documents:
+                continue
+            pending.extend(chunk_document(document, self.chunk_size, self.chunk_overlap))
+            pending_documents += 1
+            # Flush only at document boundaries so the checkpoint never splits a document
+            if len(pending) >= self.batch_size:
+                flush()
+
+        flush()
+        self._clear_checkpoint(checkpoint_path)
+        logger.info(f"Ingested {progress['documents']} documents ({progress['chunks']} chunks) from {source}")
+        return progress
+
+    def iter_documents(self, source: str, category: Optional[str] = None,
+                       progress: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Stream normalized documents from a JSONL file or a directory tree, in a stable order"""
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+                    # Files filed under a known category directory take that category
+                    directory = os.path.basename(root)
+                    file_category = category or (directory if directory in CATEGORY_COLLECTIONS else None)
+
+                    if extension in TEXT_EXTENSIONS:
+                        document = self._text_document(path, source, file_category)
+                        if document:
+                            yield document
+                    elif extension in RECORD_EXTENSIONS:
+                        yield from self._record_documents(path, file_category, progress)
+        else:
+            yield from self._record_documents(source, category, progress)
+
+    def _text_document(self, path: str, root: str, category: Optional[str]) -> Optional[Dict[str, Any]]:
+        """One plain text or Markdown file as a document"""
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                content = f.read()
+        except OSError as e:
+            logger.warning(f"Skipping unreadable file {path}: {e}")
+            return None
+
+        if not content.strip():
+            return None
+
+        relative_path = os.path.relpath(path, root)
+        return {
+            'id': self._document_id(relative_path),
+            'title': os.path.splitext(os.path.basename(path))[0].replace('_', ' '),
+            'content': content,
+            'category': category or 'general',
+            'tags': [],
+            'source': relative_path
+        }
+
+    def _record_documents(self, path: str, category: Optional[str],
+                          progress: Optional[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Documents from a JSONL file, one record per line, or a JSON file holding a record or a list"""
+        with open(path, encoding='utf-8') as f:
+            if path.lower().endswith('.json'):
+                data = json.load(f)
+                records = data if isinstance(data, list) else [data]
+            else:
+                records = (line for line in f if line.strip())
+
+            for line_number, record in enumerate(records, start=1):
+                try:
+                    if isinstance(record, str):
+                        record = json.loads(record)
+                    yield self._normalize_record(record, path, line_number, category)
+                except (ValueError, TypeError, AttributeError) as e:
+                    logger.warning(f"Skipping invalid record {line_number} of {path}: {e}")
+                    if progress is not None:
+                        progress['invalid_records'] += 1
+
+    def _normalize_record(self, record: Dict[str, Any], path: str, line_number: int,
+                          category: Optional[str]) -> Dict[str, Any]:
+        """Fill in the fields a knowledge entry needs"""
+        content = record.get('content') or record.get('text')
+        if not content or not isinstance(content, str):
+            raise ValueError("record has no content")
+
+        document_id = str(record.get('id') or self._document_id(f"{path}:{line_number}"))
+        tags = record.get('tags') or []
+        return {
+            'id': document_id,
+            'title': record.get('title') or document_id,
+            'content': content,
+            'category': record.get('category') or category or 'general',
+            'tags': tags if isinstance(tags, list) else [tags],
+            'source': record.get('source') or os.path.basename(path)
+        }
+
+    def _document_id(self, key: str) -> str:
+        """Stable id for documents without one"""
+        return f"doc_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+    def _fingerprint(self, source: str) -> str:
+        """Sizes and modification times of the source files; a changed source restarts ingestion"""
+        if os.path.isdir(source):
+            entries = []
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append(f"{os.path.relpath(os.path.join(root, name), source)}:{stat.st_size}:{stat.st_mtime_ns}")
+        else:
+            stat = os.stat(source)
+            entries = [f"{stat.st_size}:{stat.st_mtime_ns}"]
+        return hashlib.sha256("\n".join(entries).encode()).hexdigest()
+
+    def _checkpoint_path(self, source: str) -> str:
+        """Checkpoint file of a source"""
+        key = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:16]
+        return os.path.join(self.checkpoint_dir, f"{key}.json")
+
+    def _load_checkpoint(self, path: str) -> Optional[Dict[str, Any]]:
+        """Read a checkpoint, or None if there is none"""
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable ingestion checkpoint {path}: {e}")
+            return None
+
+    def _save_checkpoint(self, path: str, checkpoint: Dict[str, Any]):
+        """Atomically replace a checkpoint"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(temporary_path, path)
+
+    def _clear_checkpoint(self, path: str):
+        """Remove a finished source's checkpoint"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
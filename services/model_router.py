@@ -0,0 +1,118 @@
+"""
+Model Routing Policy
+Chooses between the flash and pro Gemini tiers per call
+"""
+
+import logging
+import threading
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+FLASH_MODEL = "gemini-2.5-flash"
+PRO_MODEL = "gemini-2.5-pro"
+
+logger = logging.getLogger(__name__)
+
+class ModelRouter:
+    """Routes each Gemini call to a model tier based on agent, budget, complexity and latency"""
+
+    # Default tier per caller; routine extraction runs on flash
+    AGENT_TIERS = {
+        'hazard_detector': FLASH_MODEL,
+        'synthesis_analyzer': PRO_MODEL,  # small labels and glassware details
+        'mopp_recommender': FLASH_MODEL,
+        'sampling_strategist': FLASH_MODEL,
+        'comprehensive': PRO_MODEL,
+        'tile_scanner': FLASH_MODEL,  # many small calls; tiles are already full resolution
+        'tactical_summary': FLASH_MODEL,
+        'command_briefing': PRO_MODEL,
+        'youtube': FLASH_MODEL
+    }
+
+    # Image complexity thresholds (0.0 - 1.0)
+    LOW_COMPLEXITY = 0.2
+    HIGH_COMPLEXITY = 0.6
+
+    # Flash results below this confidence are re-run on pro
+    ESCALATION_CONFIDENCE = 0.4
+
+    # Smoothing factor for the per-model latency moving average
+    LATENCY_ALPHA = 0.2
+
+    # Latency assumed before any call to a model has been observed
+    DEFAULT_LATENCY = {
+        FLASH_MODEL: 4.0,
+        PRO_MODEL: 15.0
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = dict(self.DEFAULT_LATENCY)
+
+    def select_model(self, agent: Optional[str] = None, latency_budget: Optional[float] = None,
+                     complexity: Optional[float] = None) -> str:
+        """Select the model for a call"""
+        model = self.AGENT_TIERS.get(agent, PRO_MODEL)
+
+        # Cluttered scenes need the stronger model, near-empty ones do not
+        if complexity is not None:
+            if complexity >= self.HIGH_COMPLEXITY:
+                model = PRO_MODEL
+            elif complexity < self.LOW_COMPLEXITY:
+                model = FLASH_MODEL
+
+        # Drop to flash when pro is not expected to finish within budget
+        if latency_budget is not None and model == PRO_MODEL:
+            if self.expected_latency(PRO_MODEL) > latency_budget:
+                model = FLASH_MODEL
+
+        return model
+
+    def should_escalate(self, model: Optional[str], confidence: float) -> bool:
+        """Check whether a flash result is uncertain enough to re-run on pro"""
+        return model == FLASH_MODEL and 0.0 < confidence < self.ESCALATION_CONFIDENCE
+
+    def record_latency(self, model: str, seconds: float):
+        """Record an observed call latency for a model"""
+        with self._lock:
+            previous = self._latency.get(model, seconds)
+            self._latency[model] = (
+                self.LATENCY_ALPHA * seconds + (1 - self.LATENCY_ALPHA) * previous
+            )
+
+    def expected_latency(self, model: str) -> float:
+        """Get the moving-average latency for a model"""
+        with self._lock:
+            return self._latency.get(model, self.DEFAULT_LATENCY.get(model, 0.0))
+
+    def get_latency_stats(self) -> Dict[str, float]:
+        """Get the moving-average latency for all observed models"""
+        with self._lock:
+            return dict(self._latency)
+
+    def image_complexity(self, image_data: bytes) -> Optional[float]:
+        """Cheap visual complexity score from edge density and texture"""
+        try:
+            buffer = np.frombuffer(image_data, dtype=np.uint8)
+            # Decode at 1/4 resolution; the score only needs coarse structure
+            image = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+            if image is None:
+                return None
+
+            edges = cv2.Canny(image, 100, 200)
+            edge_density = float(np.count_nonzero(edges)) / edges.size
+
+            laplacian_variance = float(cv2.Laplacian(image, cv2.CV_64F).var())
+            texture = min(laplacian_variance / 1000.0, 1.0)
+
+            # Edge density above ~15% is already a very busy scene
+            return min(0.7 * min(edge_density / 0.15, 1.0) + 0.3 * texture, 1.0)
+
+        except Exception as e:
+            logger.warning(f"Error scoring image complexity: {e}")
+            return None
+
+# Global model router instance
+model_router = ModelRouter()
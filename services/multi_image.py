@@ -0,0 +1,65 @@
+"""
+Multi-Image Scenes
+Prompt framing for several photos of one scene in a single request, and attribution of findings to photos
+"""
+
+import os
+import re
+from typing import Dict, List
+
+# Most photos packed into one scene request
+MAX_SCENE_IMAGES = int(os.environ.get("MAX_SCENE_IMAGES", "8"))
+
+# How the photos are introduced, shared by free-text and schema-constrained requests
+MULTI_IMAGE_LABELS = """
+The attached images are {count} photos of the same scene, labelled Image 1 to Image {count}.
+"""
+
+MULTI_IMAGE_INSTRUCTIONS = MULTI_IMAGE_LABELS + """Organize your answer into one section per image, each starting with a line "IMAGE N:", describing
+what is visible in that photo. Finish with an "ACROSS IMAGES:" section for observations that only
+emerge from combining the photos, such as the same item seen from several angles.
+"""
+
+# JSON answers have no sections, so items cite the photos they are seen in
+STRUCTURED_MULTI_IMAGE_INSTRUCTIONS = MULTI_IMAGE_LABELS + """Cite the photos each item is seen in as [Image N] in its description.
+"""
+
+_SECTION_PATTERN = re.compile(r'^[\s#*]*(IMAGE\s+(\d+)|ACROSS IMAGES)\s*:?[*\s]*', re.IGNORECASE | re.MULTILINE)
+
+def image_label(number: int) -> str:
+    """Label placed before each image part"""
+    return f"Image {number}:"
+
+def split_image_sections(analysis_text: str) -> Dict[int, str]:
+    """Split a multi-image answer into the text of each per-image section, keyed by 1-based image number"""
+    sections = {}
+    matches = list(_SECTION_PATTERN.finditer(analysis_text))
+
+    for index, match in enumerate(matches):
+        if match.group(2) is None:
+            continue
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(analysis_text)
+        number = int(match.group(2))
+        sections[number] = sections.get(number, '') + analysis_text[match.end():end]
+
+    return sections
+
+def attribute_findings(analysis_text: str, findings: List[str]) -> Dict[str, List[int]]:
+    """Images whose section mentions each finding's indicator term; empty for single-image answers
+
+    Agent findings end in the matched indicator ("...: <term>"); count-style findings are not attributed.
+    """
+    sections = {number: text.lower() for number, text in split_image_sections(analysis_text).items()}
+    if not sections:
+        return {}
+
+    attribution = {}
+    for finding in findings:
+        term = finding.rsplit(':', 1)[-1].strip().lower()
+        if not term or term.isdigit() or term == finding.lower():
+            continue
+        images = sorted(number for number, text in sections.items() if term in text)
+        if images:
+            attribution[finding] = images
+
+    return attribution
@@ -0,0 +1,161 @@
+"""
+ONNX Embedding Encoder
+int8-quantized MiniLM on ONNX Runtime CPU as a drop-in for the SentenceTransformer encoder
+"""
+
+import json
+import logging
+import os
+from types import SimpleNamespace
+from typing import List, Optional, Union
+
+import numpy as np
+
+# Try to import ONNX Runtime and the fast tokenizer, use the PyTorch encoder if not available
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    HAS_ONNXRUNTIME = True
+except ImportError:
+    HAS_ONNXRUNTIME = False
+
+logger = logging.getLogger(__name__)
+
+# Directory holding model_int8.onnx, tokenizer.json and encoder_config.json from export_quantized_model
+EMBEDDING_ONNX_DIR = os.environ.get("EMBEDDING_ONNX_DIR", "./models/minilm-int8")
+# Intra-op threads per inference; 0 lets ONNX Runtime use every core
+EMBEDDING_ONNX_THREADS = int(os.environ.get("EMBEDDING_ONNX_THREADS", "0"))
+
+MODEL_FILE = 'model_int8.onnx'
+TOKENIZER_FILE = 'tokenizer.json'
+CONFIG_FILE = 'encoder_config.json'
+
+class OnnxEmbeddingEncoder:
+    """Mean-pooled sentence embeddings from an exported transformer, with the SentenceTransformer calls VectorDatabase makes"""
+
+    def __init__(self, model_dir: str = EMBEDDING_ONNX_DIR, threads: int = EMBEDDING_ONNX_THREADS):
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.model_name = self.config['model']
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, MODEL_FILE), options, providers=['CPUExecutionProvider']
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self._tokenizer.enable_truncation(max_length=self.config['max_seq_length'])
+        self._tokenizer.enable_padding(pad_id=self.config['pad_token_id'], pad_token=self.config['pad_token'])
+        # Read by the embedding cache to decide whether queries may be case-folded
+        self.tokenizer = SimpleNamespace(do_lower_case=self.config.get('do_lower_case', False))
+
+    def get_sentence_embedding_dimension(self) -> int:
+        """Size of the embedding vectors"""
+        return self.config['dimension']
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               show_progress_bar: bool = False) -> np.ndarray:
+        """Embed one text or a list of texts; a list gives one row per text"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Batch texts of similar length so little compute goes to padding
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            indices = order[start:start + batch_size]
+            encodings = self._tokenizer.encode_batch([texts[index] for index in indices])
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            feeds = {
+                'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                'attention_mask': attention_mask
+            }
+            if 'token_type_ids' in self._input_names:
+                feeds['token_type_ids'] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+
+            hidden_states = self.session.run(None, feeds)[0]
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden_states * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.config.get('normalize', False):
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings[indices] = pooled
+
+        return embeddings[0] if single else embeddings
+
+def load_onnx_encoder(model_dir: str = EMBEDDING_ONNX_DIR) -> Optional[OnnxEmbeddingEncoder]:
+    """Load the exported encoder, or None if ONNX Runtime or the export is unavailable"""
+    if not HAS_ONNXRUNTIME:
+        logger.warning("ONNX Runtime or tokenizers not installed; ONNX embedding backend unavailable")
+        return None
+
+    try:
+        encoder = OnnxEmbeddingEncoder(model_dir)
+        logger.info(f"Loaded ONNX embedding encoder from {model_dir}")
+        return encoder
+    except Exception as e:
+        logger.warning(f"Could not load ONNX embedding encoder from {model_dir}: {e}")
+        return None
+
+def export_quantized_model(model_name: str, output_dir: str = EMBEDDING_ONNX_DIR) -> str:
+    """Export a SentenceTransformer's transformer to ONNX and quantize its weights to int8; returns the model path
+
+    Needs PyTorch and sentence-transformers, which the serving hosts then no longer do.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0].auto_model.eval()
+    tokenizer = model[0].tokenizer
+
+    class HiddenStates(torch.nn.Module):
+        """Transformer returning only the token embeddings, for a single-output graph"""
+
+        def __init__(self, wrapped):
+            super().__init__()
+            self.wrapped = wrapped
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.wrapped(input_ids=input_ids, attention_mask=attention_mask,
+                                token_type_ids=token_type_ids)[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+
+    sample = tokenizer(["example query"], return_tensors='pt', return_token_type_ids=True)
+    input_names = ['input_ids', 'attention_mask', 'token_type_ids']
+    fp32_path = os.path.join(output_dir, 'model_fp32.onnx')
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenStates(transformer),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']},
+            opset_version=14
+        )
+
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    with open(os.path.join(output_dir, CONFIG_FILE), 'w') as f:
+        json.dump({
+            'model': model_name,
+            'dimension': model.get_sentence_embedding_dimension(),
+            'max_seq_length': model.max_seq_length,
+            'pad_token': tokenizer.pad_token,
+            'pad_token_id': tokenizer.pad_token_id,
+            'do_lower_case': bool(getattr(tokenizer, 'do_lower_case', False)),
+            # all-MiniLM-L6-v2 ends in a Normalize module, so its vectors are unit length
+            'normalize': any(type(module).__name__ == 'Normalize' for module in model)
+        }, f, indent=2)
+
+    logger.info(f"Exported int8 ONNX encoder for {model_name} to {output_dir}")
+    return model_path
@@ -0,0 +1,200 @@
+"""
+Analysis Priority Scheduling
+Priority classes, an aging priority executor and stage-boundary preemption
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class Priority(IntEnum):
+    """Analysis priority classes; lower values are served first"""
+    TACTICAL_LIVE = 0
+    TACTICAL_UPLOAD = 1
+    COMMAND = 2
+    BATCH = 3
+
+# Fair-share weight of each class in the Gemini quota scheduler
+PRIORITY_WEIGHTS = {
+    Priority.TACTICAL_LIVE: 8.0,
+    Priority.TACTICAL_UPLOAD: 4.0,
+    Priority.COMMAND: 1.0,
+    Priority.BATCH: 0.25
+}
+
+USER_TYPE_PRIORITIES = {
+    'tactical': Priority.TACTICAL_UPLOAD,
+    'command': Priority.COMMAND,
+    'batch': Priority.BATCH
+}
+
+def resolve_priority(user_type: Optional[str], requested: Optional[str] = None,
+                     live: bool = False) -> Priority:
+    """Resolve the priority class for a request
+
+    Tactical users may mark a request live; an explicit class may only lower priority.
+    """
+    priority = USER_TYPE_PRIORITIES.get(user_type, Priority.COMMAND)
+
+    if live and user_type == 'tactical':
+        priority = Priority.TACTICAL_LIVE
+
+    if requested:
+        try:
+            requested_priority = Priority[str(requested).upper()]
+        except KeyError:
+            logger.warning(f"Ignoring unknown priority class: {requested}")
+        else:
+            priority = max(priority, requested_priority)
+
+    return priority
+
+@dataclass
+class _WorkItem:
+    """A queued task"""
+    priority: int
+    sequence: int
+    enqueued_at: float
+    future: Future = field(repr=False)
+    fn: Callable = field(repr=False)
+    args: tuple = field(repr=False)
+    kwargs: dict = field(repr=False)
+
+class PriorityExecutor:
+    """Thread pool that runs the highest-priority task first, aging waiting tasks to avoid starvation"""
+
+    def __init__(self, max_workers: int, aging_seconds: float = 10.0,
+                 thread_name_prefix: str = "priority-worker"):
+        self.max_workers = max_workers
+        self.aging_seconds = aging_seconds
+        self.thread_name_prefix = thread_name_prefix
+        self._pending = []
+        self._workers = []
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+
+    def submit(self, priority: int, fn: Callable, *args, **kwargs) -> Future:
+        """Queue fn at the given priority"""
+        future = Future()
+        with self._cond:
+            self._pending.append(_WorkItem(
+                int(priority), next(self._sequence), time.monotonic(), future, fn, args, kwargs
+            ))
+            self._ensure_workers()
+            self._cond.notify()
+        return future
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Count queued tasks per priority class"""
+        with self._cond:
+            counts = Counter(Priority(item.priority).name.lower() for item in self._pending)
+        return dict(counts)
+
+    def _next_item(self) -> _WorkItem:
+        """Pick the task with the best aged priority (caller holds the lock)"""
+        now = time.monotonic()
+        item = min(self._pending, key=lambda work: (
+            # Each aging interval waited raises a task by one class
+            work.priority - (now - work.enqueued_at) / self.aging_seconds,
+            work.sequence
+        ))
+        self._pending.remove(item)
+        return item
+
+    def _worker(self):
+        """Run queued tasks forever"""
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                item = self._next_item()
+
+            if not item.future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                result = item.fn(*item.args, **item.kwargs)
+            except BaseException as e:
+                item.future.set_exception(e)
+            else:
+                item.future.set_result(result)
+
+    def _ensure_workers(self):
+        """Start worker threads up to max_workers (caller holds the lock)"""
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker,
+                name=f"{self.thread_name_prefix}-{len(self._workers)}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+class StageGate:
+    """Lets lower-priority analyses yield at stage boundaries while higher-priority ones run"""
+
+    def __init__(self, max_defer: float = 15.0):
+        self.max_defer = max_defer
+        self._active = Counter()
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def track(self, priority: Priority):
+        """Register an analysis as active for the duration of the block"""
+        with self._cond:
+            self._active[priority] += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[priority] -= 1
+                self._cond.notify_all()
+
+    def checkpoint(self, priority: Optional[Priority], stage: str) -> float:
+        """Wait at a stage boundary while higher-priority analyses are active
+
+        Waiting is capped at max_defer per boundary so low classes always progress.
+        """
+        if priority is None:
+            return 0.0
+
+        start_time = time.monotonic()
+        with self._cond:
+            while self._higher_priority_active(priority):
+                remaining = self.max_defer - (time.monotonic() - start_time)
+                if remaining <= 0:
+                    break
+                self._cond.wait(timeout=remaining)
+
+        waited = time.monotonic() - start_time
+        if waited > 0.1:
+            logger.info(f"{Priority(priority).name} analysis yielded {waited:.1f}s before {stage}")
+        return waited
+
+    def get_active(self) -> Dict[str, int]:
+        """Count active analyses per priority class"""
+        with self._cond:
+            return {Priority(p).name.lower(): count for p, count in self._active.items() if count}
+
+    def _higher_priority_active(self, priority: Priority) -> bool:
+        """Check for active analyses of a strictly higher class (caller holds the lock)"""
+        return any(count > 0 for p, count in self._active.items() if p < priority)
+
+# Shared executor for agent fan-out across all analyses
+agent_executor = PriorityExecutor(
+    max_workers=int(os.environ.get("AGENT_MAX_WORKERS", "16")),
+    thread_name_prefix="agent-worker"
+)
+
+# Global stage gate instance
+stage_gate = StageGate(max_defer=float(os.environ.get("STAGE_MAX_DEFER_SECONDS", "15")))
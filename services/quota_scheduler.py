@@ -0,0 +1,250 @@
+"""
+Gemini Quota Scheduler
+Process-wide RPM/TPM token buckets with weighted fair queuing across sessions
+"""
+
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.model_router import FLASH_MODEL, PRO_MODEL
+from services.resilience import GeminiError
+
+logger = logging.getLogger(__name__)
+
+# Session and user type of the analysis issuing Gemini calls on this thread
+_request_context = contextvars.ContextVar('gemini_request_context', default={})
+
+@contextmanager
+def request_context(**context):
+    """Attach scheduling context (session_id, user_type, ...) to Gemini calls made inside the block"""
+    token = _request_context.set({**_request_context.get(), **context})
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+def get_request_context() -> Dict[str, Any]:
+    """Get the scheduling context of the current thread"""
+    return _request_context.get()
+
+# Rough token costs used before the response reports actual usage
+IMAGE_TOKENS = 1290
+VIDEO_TOKENS_PER_MB = 5000
+EXPECTED_OUTPUT_TOKENS = 1000
+
+def estimate_tokens(contents: Any) -> int:
+    """Estimate the token cost of a generate_content request"""
+    if not isinstance(contents, list):
+        contents = [contents]
+
+    tokens = EXPECTED_OUTPUT_TOKENS
+    for part in contents:
+        if isinstance(part, str):
+            tokens += len(part) // 4
+            continue
+
+        inline_data = getattr(part, 'inline_data', None)
+        if inline_data is not None and inline_data.mime_type.startswith('video/'):
+            tokens += int(len(inline_data.data or b'') / (1024 * 1024) * VIDEO_TOKENS_PER_MB)
+        else:
+            tokens += IMAGE_TOKENS
+
+    return tokens
+
+class QuotaTimeoutError(GeminiError):
+    """A call waited longer than the scheduler allows for quota"""
+
+    def __init__(self, model: str, waited: float):
+        super().__init__(f"Quota wait for {model} exceeded {waited:.1f}s", kind='quota_timeout', model=model)
+
+class TokenBucket:
+    """Per-minute budget refilled continuously"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Seconds until amount is available (a request larger than capacity waits for a full bucket)"""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        deficit = min(amount, self.capacity) - self.level
+        return max(0.0, deficit / self.rate)
+
+    def consume(self, amount: float):
+        """Take amount from the bucket; may go negative when settling actual usage"""
+        self.level -= amount
+
+@dataclass(order=True)
+class _Ticket:
+    """A queued call, ordered by weighted-fair virtual finish tag"""
+    finish_tag: float
+    sequence: int
+    start_tag: float = field(compare=False)
+    flow: Tuple[str, str] = field(compare=False)
+    tokens: int = field(compare=False)
+
+class QuotaScheduler:
+    """Admits Gemini calls within per-model RPM/TPM quotas, fairly across sessions"""
+
+    # Share of quota per flow when queues are contended; tactical outranks command backfill
+    USER_TYPE_WEIGHTS = {
+        'tactical': 4.0,
+        'command': 1.0
+    }
+    DEFAULT_WEIGHT = 1.0
+
+    def __init__(self, quotas: Dict[str, Dict[str, float]], max_wait: float = 120.0):
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._buckets = {
+            model: (TokenBucket(limits['rpm']), TokenBucket(limits['tpm']))
+            for model, limits in quotas.items()
+        }
+        self._queues = {model: [] for model in quotas}
+        self._virtual_time = {model: 0.0 for model in quotas}
+        self._flow_finish = {}
+        self._sequence = itertools.count()
+        self._wait_stats = {}
+
+    def acquire(self, model: str, tokens: int, session_id: Optional[str] = None,
+                user_type: Optional[str] = None, weight: Optional[float] = None) -> float:
+        """Block until the call may proceed; returns the time spent waiting"""
+        if model not in self._buckets:
+            return 0.0
+
+        flow = (session_id or 'anonymous', user_type or 'unknown')
+        if weight is None:
+            weight = self.USER_TYPE_WEIGHTS.get(user_type, self.DEFAULT_WEIGHT)
+        enqueued_at = time.monotonic()
+
+        with self._cond:
+            queue = self._queues[model]
+            start_tag = max(self._virtual_time[model], self._flow_finish.get((model, flow), 0.0))
+            ticket = _Ticket(start_tag + 1.0 / weight, next(self._sequence), start_tag, flow, tokens)
+            self._flow_finish[(model, flow)] = ticket.finish_tag
+            heapq.heappush(queue, ticket)
+
+            try:
+                while True:
+                    waited = time.monotonic() - enqueued_at
+                    if waited > self.max_wait:
+                        raise QuotaTimeoutError(model, waited)
+
+                    if queue[0] is ticket:
+                        delay = self._time_until_available(model, tokens)
+                        if delay <= 0:
+                            break
+                        self._cond.wait(timeout=min(delay, self.max_wait - waited))
+                    else:
+                        self._cond.wait(timeout=self.max_wait - waited)
+            except QuotaTimeoutError:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                self._cond.notify_all()
+                raise
+
+            heapq.heappop(queue)
+            request_bucket, token_bucket = self._buckets[model]
+            request_bucket.consume(1)
+            token_bucket.consume(tokens)
+            self._advance_virtual_time(model, ticket.start_tag)
+            self._cond.notify_all()
+
+        wait_time = time.monotonic() - enqueued_at
+        self._record_wait(model, user_type or 'unknown', wait_time)
+        return wait_time
+
+    def settle(self, model: str, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token bucket once the response reports actual usage"""
+        if model not in self._buckets or not actual_tokens:
+            return
+
+        with self._cond:
+            self._buckets[model][1].consume(actual_tokens - estimated_tokens)
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth, bucket levels and wait-time metrics"""
+        with self._cond:
+            models = {
+                model: {
+                    'queue_depth': len(self._queues[model]),
+                    'requests_available': round(self._buckets[model][0].level, 2),
+                    'tokens_available': round(self._buckets[model][1].level, 2)
+                }
+                for model in self._buckets
+            }
+            waits = {
+                key: self._summarize_waits(stats)
+                for key, stats in self._wait_stats.items()
+            }
+
+        return {'models': models, 'wait_times': waits}
+
+    def _time_until_available(self, model: str, tokens: int) -> float:
+        """Seconds until both the request and token buckets can admit the call"""
+        now = time.monotonic()
+        request_bucket, token_bucket = self._buckets[model]
+        return max(request_bucket.time_until(1, now), token_bucket.time_until(tokens, now))
+
+    def _advance_virtual_time(self, model: str, start_tag: float):
+        """Advance the model's virtual clock and forget flows that have caught up"""
+        self._virtual_time[model] = max(self._virtual_time[model], start_tag)
+        stale = [
+            key for key, finish in self._flow_finish.items()
+            if key[0] == model and finish <= self._virtual_time[model]
+        ]
+        for key in stale:
+            del self._flow_finish[key]
+
+    def _record_wait(self, model: str, user_type: str, wait_time: float):
+        """Record queueing delay per model and user type"""
+        with self._cond:
+            stats = self._wait_stats.setdefault(f"{model}:{user_type}", {
+                'count': 0,
+                'total_wait': 0.0,
+                'max_wait': 0.0,
+                'recent': deque(maxlen=500)
+            })
+            stats['count'] += 1
+            stats['total_wait'] += wait_time
+            stats['max_wait'] = max(stats['max_wait'], wait_time)
+            stats['recent'].append(wait_time)
+
+    def _summarize_waits(self, stats: Dict[str, Any]) -> Dict[str, float]:
+        """Summarize wait-time samples"""
+        recent: List[float] = sorted(stats['recent'])
+        p95 = recent[min(int(len(recent) * 0.95), len(recent) - 1)] if recent else 0.0
+        return {
+            'count': stats['count'],
+            'mean_wait': stats['total_wait'] / stats['count'] if stats['count'] else 0.0,
+            'p95_wait': p95,
+            'max_wait': stats['max_wait']
+        }
+
+# Global quota scheduler instance
+quota_scheduler = QuotaScheduler(
+    quotas={
+        PRO_MODEL: {
+            'rpm': float(os.environ.get("GEMINI_PRO_RPM", "150")),
+            'tpm': float(os.environ.get("GEMINI_PRO_TPM", "2000000"))
+        },
+        FLASH_MODEL: {
+            'rpm': float(os.environ.get("GEMINI_FLASH_RPM", "1000")),
+            'tpm': float(os.environ.get("GEMINI_FLASH_TPM", "1000000"))
+        }
+    },
+    max_wait=float(os.environ.get("GEMINI_QUOTA_MAX_WAIT", "120"))
+)
@@ -0,0 +1,193 @@
+"""
+Offline Re-scoring Service
+Replays agent extraction and scoring over stored model text without calling Gemini
+"""
+
+import logging
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agents.base_agent import AgentResult
+from agents.registry import agent_registry
+from models import AgentRawOutput, SceneAnalysis, db
+from services.batch_scoring import HAZARD_THRESHOLDS, rescore_stored_results
+
+logger = logging.getLogger(__name__)
+
+# Agent instances of a worker process
+_worker_agents = {}
+
+def _init_worker():
+    """Build one set of registered agents per worker process"""
+    _worker_agents.update(agent_registry.create_agents())
+
+def _score_job(job: Tuple[int, List[Tuple[str, str, Dict[str, Any], Optional[str]]]]) -> Tuple[int, Dict[str, Any]]:
+    """Score one analysis' raw agent outputs in a worker process"""
+    analysis_id, outputs = job
+    scored = {}
+
+    for agent_name, raw_text, scoring_context, model in outputs:
+        agent = _worker_agents.get(agent_name)
+        if agent is None or raw_text is None:
+            continue
+        try:
+            scored[agent_name] = agent.score(raw_text, scoring_context or {}, model).to_dict()
+        except Exception as e:
+            logger.error(f"Re-scoring {agent_name} for analysis {analysis_id} failed: {str(e)}")
+
+    return analysis_id, scored
+
+class RescoringService:
+    """Service for re-scoring historical analyses after indicator or scoring changes"""
+
+    def __init__(self, analysis_service, processes: Optional[int] = None, chunk_size: int = 500):
+        self.analysis_service = analysis_service
+        self.processes = processes or os.cpu_count()
+        self.chunk_size = chunk_size
+
+    def rescore(self, analysis_ids: Optional[List[int]] = None, stale_only: bool = True,
+                progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Re-score stored analyses in parallel processes and stamp them with current agent versions
+
+        With stale_only, only agents whose stored version differs from the current one are replayed.
+        """
+        versions = self.analysis_service.coordinator.get_agent_versions()
+
+        query = db.session.query(AgentRawOutput.analysis_id).distinct()
+        if analysis_ids:
+            query = query.filter(AgentRawOutput.analysis_id.in_(analysis_ids))
+        ids = sorted(row[0] for row in query)
+
+        stats = {'total': len(ids), 'rescored': 0, 'skipped': 0, 'failed': 0, 'agent_versions': versions}
+        start_time = time.time()
+
+        with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker) as pool:
+            for offset in range(0, len(ids), self.chunk_size):
+                chunk_ids = ids[offset:offset + self.chunk_size]
+                analyses = {
+                    analysis.id: analysis
+                    for analysis in SceneAnalysis.query.filter(SceneAnalysis.id.in_(chunk_ids))
+                }
+                jobs = self._build_jobs(analyses, versions, stale_only)
+                stats['skipped'] += len(chunk_ids) - len(jobs)
+
+                for analysis_id, scored in pool.map(_score_job, jobs, chunksize=max(1, len(jobs) // (self.processes * 4))):
+                    if scored and self._apply_scores(analyses[analysis_id], scored, versions):
+                        stats['rescored'] += 1
+                    else:
+                        stats['failed'] += 1
+
+                try:
+                    db.session.commit()
+                except Exception as e:
+                    logger.error(f"Error saving re-scored analyses: {str(e)}")
+                    db.session.rollback()
+                    raise
+
+                if progress_callback:
+                    progress_callback(dict(stats, elapsed=time.time() - start_time))
+
+        stats['elapsed'] = time.time() - start_time
+        logger.info(f"Re-scored {stats['rescored']} of {stats['total']} analyses in {stats['elapsed']:.1f}s")
+        return stats
+
+    def what_if(self, hazard_thresholds: Optional[Dict[str, Tuple[float, int]]] = None,
+                analysis_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Hazard levels stored analyses would get under other thresholds, computed in bulk and not saved
+
+        hazard_thresholds maps level to (minimum confidence, risk factors must exceed), as in
+        batch_scoring.HAZARD_THRESHOLDS; levels left out keep their current thresholds.
+        """
+        thresholds = None
+        if hazard_thresholds:
+            thresholds = {**HAZARD_THRESHOLDS, **{level: tuple(value) for level, value in hazard_thresholds.items()}}
+
+        query = db.session.query(SceneAnalysis.id)
+        if analysis_ids:
+            query = query.filter(SceneAnalysis.id.in_(analysis_ids))
+        ids = sorted(row[0] for row in query)
+
+        report = {'total': 0, 'changed': 0, 'before': Counter(), 'after': Counter(), 'changes': []}
+        start_time = time.time()
+
+        for offset in range(0, len(ids), self.chunk_size):
+            analyses = [
+                analysis for analysis in
+                SceneAnalysis.query.filter(SceneAnalysis.id.in_(ids[offset:offset + self.chunk_size]))
+                if 'hazard_detector' in (analysis.agent_outputs or {}).get('agent_results', {})
+            ]
+            if not analyses:
+                continue
+
+            agent_results = [analysis.agent_outputs['agent_results'] for analysis in analyses]
+            scores = rescore_stored_results(agent_results, thresholds)
+
+            for analysis, results, level in zip(analyses, agent_results, scores['hazard_level'].tolist()):
+                if not level:
+                    continue
+                stored_level = results['hazard_detector'].get('hazard_level')
+                report['total'] += 1
+                report['before'][stored_level] += 1
+                report['after'][level] += 1
+                if level != stored_level:
+                    report['changed'] += 1
+                    report['changes'].append({'analysis_id': analysis.id, 'before': stored_level, 'after': level})
+
+        report['before'] = dict(report['before'])
+        report['after'] = dict(report['after'])
+        report['elapsed'] = time.time() - start_time
+        return report
+
+    def _build_jobs(self, analyses: Dict[int, SceneAnalysis], versions: Dict[str, str],
+                    stale_only: bool) -> List[Tuple[int, List[Tuple[str, str, Dict[str, Any], Optional[str]]]]]:
+        """Collect the raw outputs to replay for each analysis"""
+        outputs = defaultdict(list)
+        for raw_output in AgentRawOutput.query.filter(AgentRawOutput.analysis_id.in_(list(analyses))):
+            analysis = analyses.get(raw_output.analysis_id)
+            if analysis is None or raw_output.agent_name not in versions:
+                continue
+
+            stored_versions = (analysis.agent_outputs or {}).get('coordination_metadata', {}).get('agent_versions', {})
+            if stale_only and stored_versions.get(raw_output.agent_name) == versions[raw_output.agent_name]:
+                continue
+
+            outputs[raw_output.analysis_id].append((
+                raw_output.agent_name, raw_output.raw_text, raw_output.scoring_context, raw_output.model
+            ))
+
+        return list(outputs.items())
+
+    def _apply_scores(self, analysis: SceneAnalysis, scored: Dict[str, Any], versions: Dict[str, str]) -> bool:
+        """Merge re-scored agent results into an analysis and recompute everything derived from them"""
+        try:
+            agent_outputs = dict(analysis.agent_outputs or {})
+            agent_data = dict(agent_outputs.get('agent_results', {}))
+            agent_data.update(scored)
+
+            agent_results = {name: AgentResult.from_dict(data) for name, data in agent_data.items()}
+            agent_outputs.update(self.analysis_service.coordinator.aggregate_results(agent_results))
+            agent_outputs['agent_results'] = agent_data
+
+            # Version stamp: the agent versions each stored result was scored with
+            metadata = dict(agent_outputs.get('coordination_metadata', {}))
+            metadata['agent_versions'] = {
+                **metadata.get('agent_versions', {}),
+                **{name: versions[name] for name in scored}
+            }
+            metadata['rescored_at'] = time.time()
+            agent_outputs['coordination_metadata'] = metadata
+
+            # Reassign so SQLAlchemy detects the JSON column changes
+            analysis.agent_outputs = agent_outputs
+            analysis.analysis_results = self.analysis_service.refresh_derived_results(
+                analysis.analysis_results or {}, agent_outputs
+            )
+            analysis.confidence_scores = analysis.analysis_results.get('confidence_metrics', {})
+            return True
+
+        except Exception as e:
+            logger.error(f"Error applying re-scored results to analysis {analysis.id}: {str(e)}")
+            return False
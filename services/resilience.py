@@ -0,0 +1,238 @@
+"""
+Gemini Call Resilience
+Error classification, jittered retries, request hedging and per-model circuit breakers
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class GeminiError(Exception):
+    """A Gemini call failed after resilience handling"""
+
+    def __init__(self, message: str, kind: str = 'permanent', model: Optional[str] = None):
+        super().__init__(message)
+        self.kind = kind  # 'transient', 'permanent', 'circuit_open'
+        self.model = model
+
+class CircuitOpenError(GeminiError):
+    """The circuit breaker for a model is open and the call was not attempted"""
+
+    def __init__(self, model: str):
+        super().__init__(f"Circuit open for {model}", kind='circuit_open', model=model)
+
+def classify_error(error: Exception) -> str:
+    """Classify an exception as 'transient' or 'permanent'"""
+    if isinstance(error, GeminiError):
+        return error.kind
+
+    # google.genai APIError carries the HTTP status in .code
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    if isinstance(code, int):
+        return 'transient' if code in TRANSIENT_STATUS_CODES else 'permanent'
+
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return 'transient'
+
+    # httpx transport errors (ReadTimeout, ConnectError, ...)
+    error_name = type(error).__name__.lower()
+    if 'timeout' in error_name or 'connect' in error_name:
+        return 'transient'
+
+    return 'permanent'
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for a single model"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'  # 'closed', 'open', 'half_open'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Check whether a call may proceed; admits one probe after the reset timeout"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                return True
+            return False
+
+    def record_success(self):
+        """Close the breaker after a successful call"""
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        """Count a transient failure and open the breaker at the threshold"""
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.time()
+
+class ResilientCaller:
+    """Wraps Gemini calls with retries, optional hedging and per-model circuit breakers"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 hedge_enabled: bool = False, hedge_percentile: float = 0.95,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._breakers = {}
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gemini-hedge")
+
+    def call(self, model: str, fn: Callable[[], Any], hedge: bool = True) -> Any:
+        """Run fn with retries; raises GeminiError when all attempts fail"""
+        breaker = self._get_breaker(model)
+        last_error = None
+
+        for attempt in range(1, self.max_attempts + 1):
+            if not breaker.allow_request():
+                raise CircuitOpenError(model)
+
+            try:
+                start_time = time.time()
+                if hedge and self.hedge_enabled:
+                    result = self._call_hedged(model, fn)
+                else:
+                    result = fn()
+                self._record_latency(model, time.time() - start_time)
+                breaker.record_success()
+                return result
+
+            except Exception as e:
+                kind = classify_error(e)
+                last_error = e
+
+                if kind != 'transient':
+                    # The service answered, so a bad request still counts as healthy
+                    if kind == 'permanent':
+                        breaker.record_success()
+                    raise GeminiError(f"{model} call failed: {str(e)}", kind=kind, model=model) from e
+
+                breaker.record_failure()
+                logger.warning(f"Transient error from {model} (attempt {attempt}/{self.max_attempts}): {str(e)}")
+
+                if attempt < self.max_attempts:
+                    time.sleep(self._backoff_delay(attempt))
+
+        raise GeminiError(
+            f"{model} call failed after {self.max_attempts} attempts: {str(last_error)}",
+            kind='transient', model=model
+        ) from last_error
+
+    def call_once(self, model: str, fn: Callable[[], Any]) -> Any:
+        """Run fn once behind the circuit breaker; for calls that cannot be replayed, like streams"""
+        breaker = self._get_breaker(model)
+        if not breaker.allow_request():
+            raise CircuitOpenError(model)
+
+        try:
+            result = fn()
+            breaker.record_success()
+            return result
+
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == 'transient':
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise GeminiError(f"{model} call failed: {str(e)}", kind=kind, model=model) from e
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get breaker state and hedge threshold per model"""
+        with self._lock:
+            models = list(self._breakers.keys())
+
+        return {
+            model: {
+                'circuit_state': self._breakers[model].state,
+                'consecutive_failures': self._breakers[model].failures,
+                'hedge_delay': self._hedge_delay(model)
+            }
+            for model in models
+        }
+
+    def _call_hedged(self, model: str, fn: Callable[[], Any]) -> Any:
+        """Issue a duplicate request if the first is slower than the latency percentile"""
+        hedge_delay = self._hedge_delay(model)
+        if hedge_delay is None:
+            return fn()
+
+        primary = self._hedge_executor.submit(fn)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        logger.info(f"Hedging {model} call after {hedge_delay:.1f}s")
+        hedge = self._hedge_executor.submit(fn)
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        winner = done.pop()
+
+        try:
+            return winner.result()
+        except Exception:
+            # Fall back to whichever request is still outstanding
+            other = hedge if winner is primary else primary
+            return other.result()
+
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        """Latency percentile after which a hedge request is sent"""
+        with self._lock:
+            samples = sorted(self._latencies.get(model, []))
+
+        # Too few samples for a meaningful percentile
+        if len(samples) < 20:
+            return None
+
+        index = min(int(len(samples) * self.hedge_percentile), len(samples) - 1)
+        return samples[index]
+
+    def _record_latency(self, model: str, seconds: float):
+        """Record a successful call latency"""
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=200)).append(seconds)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def _get_breaker(self, model: str) -> CircuitBreaker:
+        """Get or create the circuit breaker for a model"""
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[model]
+
+# Global resilient caller instance
+resilient_caller = ResilientCaller(
+    max_attempts=int(os.environ.get("GEMINI_MAX_ATTEMPTS", "3")),
+    hedge_enabled=os.environ.get("GEMINI_HEDGE_ENABLED", "false").lower() == "true",
+    failure_threshold=int(os.environ.get("GEMINI_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.environ.get("GEMINI_BREAKER_RESET_SECONDS", "30"))
+)
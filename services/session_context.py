@@ -0,0 +1,186 @@
+"""
+Session Context
+Rolling per-session context so related frames are analyzed as deltas instead of cold
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from models import SessionContext, db
+
+logger = logging.getLogger(__name__)
+
+# Analyze frames against the session context unless the request says otherwise
+INCREMENTAL_ANALYSIS = os.environ.get("INCREMENTAL_ANALYSIS", "false").lower() == "true"
+# Frames whose 64-bit perceptual hashes differ by at most this many bits count as unchanged
+FRAME_CHANGE_BITS = int(os.environ.get("FRAME_CHANGE_BITS", "6"))
+# Findings kept in the rolling summary
+SUMMARY_MAX_FINDINGS = int(os.environ.get("SESSION_SUMMARY_MAX_FINDINGS", "20"))
+# Fixed pool of session update locks; unrelated sessions rarely share one
+SESSION_LOCK_STRIPES = 64
+
+def frame_hash(image_data: Optional[bytes]) -> Optional[str]:
+    """64-bit difference hash of a frame as 16 hex digits, or None if it cannot be decoded"""
+    if not image_data:
+        return None
+
+    try:
+        image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if image is None:
+            return None
+        small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+    except Exception as e:
+        logger.warning(f"Error hashing frame: {e}")
+        return None
+
+def scene_hash(images: List[bytes]) -> Optional[str]:
+    """Frame hashes of every photo of a scene, comma-separated in photo order; None if any cannot be hashed"""
+    hashes = [frame_hash(image_data) for image_data in images]
+    if not hashes or not all(hashes):
+        return None
+    return ",".join(hashes)
+
+def frame_distance(first: Optional[str], second: Optional[str]) -> Optional[int]:
+    """Differing bits between two frame or scene hashes, the most of any photo; None if not comparable"""
+    if not first or not second:
+        return None
+    first_hashes, second_hashes = first.split(','), second.split(',')
+    if len(first_hashes) != len(second_hashes):
+        return None
+    return max(bin(int(a, 16) ^ int(b, 16)).count('1') for a, b in zip(first_hashes, second_hashes))
+
+def frame_changed(first: Optional[str], second: Optional[str]) -> bool:
+    """Whether two frames, or any photo of two scenes, differ materially"""
+    distance = frame_distance(first, second)
+    return distance is None or distance > FRAME_CHANGE_BITS
+
+class SessionContextStore:
+    """Database-backed rolling context per session: latest agent results, running assessment and summary"""
+
+    def __init__(self, max_findings: int = SUMMARY_MAX_FINDINGS):
+        self.max_findings = max_findings
+        self._locks: List[threading.Lock] = [threading.Lock() for _ in range(SESSION_LOCK_STRIPES)]
+
+    def load(self, session_id: str) -> Dict[str, Any]:
+        """Get a session's context; empty for a session with no analyzed frames"""
+        entry = SessionContext.query.filter_by(session_id=session_id).first()
+        if entry is None:
+            return {
+                'summary': None,
+                'frame_count': 0,
+                'last_frame_hash': None,
+                'agent_state': {},
+                'assessment_state': None,
+                'key_findings': []
+            }
+
+        return {
+            'summary': entry.summary,
+            'frame_count': entry.frame_count or 0,
+            'last_frame_hash': entry.last_frame_hash,
+            'agent_state': entry.agent_state or {},
+            'assessment_state': entry.assessment_state,
+            'key_findings': entry.key_findings or []
+        }
+
+    def update(self, session_id: str, current_frame_hash: Optional[str], agent_results: Dict[str, Dict[str, Any]],
+               update_assessment: Callable[[Optional[Dict[str, Any]]], Tuple[Dict[str, Any], Dict[str, Any]]]
+               ) -> Dict[str, Any]:
+        """Fold one analyzed frame into the session context
+
+        update_assessment maps the previous running assessment state to (assessment, new state).
+        Only agents that actually ran on this frame replace their stored result.
+        """
+        with self._get_lock(session_id):
+            entry = SessionContext.query.filter_by(session_id=session_id).first()
+            if entry is None:
+                entry = SessionContext(session_id=session_id, frame_count=0)
+                db.session.add(entry)
+
+            fresh_results = {
+                agent_name: result for agent_name, result in agent_results.items()
+                if not result.get('metadata', {}).get('error') and not result.get('metadata', {}).get('reused')
+            }
+            frame_number = (entry.frame_count or 0) + 1
+
+            assessment, assessment_state = update_assessment(entry.assessment_state)
+            key_findings = self._merge_findings(entry.key_findings or [], fresh_results, frame_number)
+
+            # Reassign so SQLAlchemy detects the JSON column changes
+            entry.agent_state = {**(entry.agent_state or {}), **fresh_results}
+            entry.assessment_state = assessment_state
+            entry.key_findings = key_findings
+            entry.frame_count = frame_number
+            entry.last_frame_hash = current_frame_hash or entry.last_frame_hash
+            entry.summary = self._build_summary(frame_number, assessment, key_findings)
+
+            try:
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Error saving session context: {str(e)}")
+                db.session.rollback()
+
+            return {
+                'frame': frame_number,
+                'session_assessment': assessment,
+                'summary': entry.summary,
+                'rerun_agents': list(fresh_results),
+                'reused_agents': [
+                    agent_name for agent_name, result in agent_results.items()
+                    if result.get('metadata', {}).get('reused')
+                ]
+            }
+
+    def reset(self, session_id: str) -> bool:
+        """Forget a session's context; returns whether there was one"""
+        with self._get_lock(session_id):
+            try:
+                deleted = SessionContext.query.filter_by(session_id=session_id).delete()
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Error resetting session context: {str(e)}")
+                db.session.rollback()
+                return False
+        return deleted > 0
+
+    def _merge_findings(self, key_findings: List[Dict[str, Any]], fresh_results: Dict[str, Dict[str, Any]],
+                        frame_number: int) -> List[Dict[str, Any]]:
+        """Add findings not seen before, keeping the most recent max_findings"""
+        known = {item['finding'] for item in key_findings}
+        merged = list(key_findings)
+
+        for agent_name, result in fresh_results.items():
+            for finding in result.get('findings', []):
+                if finding not in known:
+                    known.add(finding)
+                    merged.append({'finding': finding, 'agent': agent_name, 'frame': frame_number})
+
+        return merged[-self.max_findings:]
+
+    def _build_summary(self, frame_count: int, assessment: Dict[str, Any],
+                       key_findings: List[Dict[str, Any]]) -> str:
+        """Compact text summary of what the session has established so far"""
+        lines = [
+            f"Frames analyzed: {frame_count}",
+            f"Session threat level: {assessment.get('threat_level', 'UNKNOWN')}",
+            f"Operation type: {assessment.get('operation_type', 'UNKNOWN')}"
+        ]
+        if key_findings:
+            lines.append("Established findings:")
+            lines.extend(f"- {item['finding']} (frame {item['frame']})" for item in key_findings)
+        return "\n".join(lines)
+
+    def _get_lock(self, session_id: str) -> threading.Lock:
+        """Lock serializing context updates of one session"""
+        return self._locks[hash(session_id) % len(self._locks)]
+
+# Global session context store instance
+session_contexts = SessionContextStore()
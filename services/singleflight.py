@@ -0,0 +1,88 @@
+"""
+Request Coalescing
+Shares one in-flight computation among concurrent callers with the same key
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    """A single in-flight computation and its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.completed_at = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesces concurrent calls by key; optionally keeps results for result_ttl seconds"""
+
+    def __init__(self, result_ttl: float = 0.0):
+        self.result_ttl = result_ttl
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn once per key; concurrent and (within the TTL) later callers get its result"""
+        with self._lock:
+            self._evict_expired()
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            logger.info(f"Attaching to in-flight computation {key}")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            flight.completed_at = time.time()
+            with self._lock:
+                # Failures are never cached, so a retry runs again
+                if flight.error is not None or self.result_ttl <= 0:
+                    self._flights.pop(key, None)
+            flight.done.set()
+
+        return flight.result
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a completed, unexpired result without starting a computation"""
+        with self._lock:
+            self._evict_expired()
+            flight = self._flights.get(key)
+            if flight and flight.done.is_set() and flight.error is None:
+                return flight.result
+            return None
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Check whether a computation for key is currently running"""
+        with self._lock:
+            flight = self._flights.get(key)
+            return flight is not None and not flight.done.is_set()
+
+    def _evict_expired(self):
+        """Drop completed results older than the TTL (caller holds the lock)"""
+        now = time.time()
+        expired = [
+            key for key, flight in self._flights.items()
+            if flight.completed_at is not None and now - flight.completed_at > self.result_ttl
+        ]
+        for key in expired:
+            del self._flights[key]
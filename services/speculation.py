@@ -0,0 +1,150 @@
+"""
+Speculative Analysis
+Starts work before it is requested and hands it to the first caller that claims it
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Speculative work running on this thread, if any
+_current_speculation = contextvars.ContextVar('current_speculation', default=None)
+
+class SpeculationCancelledError(Exception):
+    """Speculative work was abandoned because nobody claimed it within its window"""
+
+class _Speculation:
+    """A unit of speculative work and its outcome"""
+
+    def __init__(self, key: Hashable, window: float):
+        self.key = key
+        self.started_at = time.time()
+        self.expires_at = self.started_at + window
+        self.claimed = False
+        self.claimed_event = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self) -> Any:
+        """Block until the work finishes and return its result"""
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class SpeculativeRunner:
+    """Runs speculative work in the background until it is claimed or its window expires"""
+
+    def __init__(self, window: float = 60.0, max_workers: int = 2):
+        self.window = window
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._speculations: Dict[Hashable, _Speculation] = {}
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def start(self, key: Hashable, fn: Callable[[], Any]) -> bool:
+        """Run fn in the background under key; returns False if key is already speculated"""
+        with self._lock:
+            self._evict_expired()
+            if key in self._speculations:
+                return False
+            speculation = _Speculation(key, self.window)
+            self._speculations[key] = speculation
+            self._stats['started'] += 1
+
+        self._executor.submit(self._run, speculation, fn)
+        return True
+
+    def claim(self, key: Hashable) -> Optional[_Speculation]:
+        """Take over speculative work for key, if any was started within the window"""
+        with self._lock:
+            self._evict_expired()
+            speculation = self._speculations.pop(key, None)
+            if speculation is None:
+                return None
+            speculation.claimed = True
+            speculation.claimed_event.set()
+            self._stats['claimed'] += 1
+
+        logger.info(f"Claimed speculative work {key}")
+        return speculation
+
+    def check(self):
+        """Raise SpeculationCancelledError if the current thread's speculative work expired unclaimed"""
+        speculation = _current_speculation.get()
+        if speculation is None:
+            return
+
+        with self._lock:
+            expired = not speculation.claimed and time.time() > speculation.expires_at
+        if expired:
+            raise SpeculationCancelledError("Speculative work was not claimed within its window")
+
+    def pending(self) -> bool:
+        """Whether the current thread runs speculative work nobody has claimed yet"""
+        speculation = _current_speculation.get()
+        return speculation is not None and not speculation.claimed
+
+    def await_claim(self):
+        """Block speculative work until it is claimed; raise SpeculationCancelledError if its window passes first
+
+        Called before results are persisted, so work nobody asked for leaves no trace.
+        """
+        speculation = _current_speculation.get()
+        if speculation is None:
+            return
+
+        while True:
+            with self._lock:
+                if speculation.claimed:
+                    return
+                if time.time() > speculation.expires_at:
+                    # Unclaimable from here on, even if eviction has not run yet
+                    if self._speculations.get(speculation.key) is speculation:
+                        del self._speculations[speculation.key]
+                    raise SpeculationCancelledError("Speculative work was not claimed within its window")
+            speculation.claimed_event.wait(max(speculation.expires_at - time.time(), 0.0) + 0.01)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get started, claimed and cancelled counts"""
+        with self._lock:
+            self._evict_expired()
+            return {**self._stats, 'pending': len(self._speculations)}
+
+    def _run(self, speculation: _Speculation, fn: Callable[[], Any]):
+        """Run fn with the speculation bound to the worker thread"""
+        token = _current_speculation.set(speculation)
+        try:
+            speculation.result = fn()
+        except SpeculationCancelledError as e:
+            speculation.error = e
+            with self._lock:
+                self._stats['cancelled'] += 1
+            logger.info("Cancelled unclaimed speculative work")
+        except Exception as e:
+            speculation.error = e
+            logger.error(f"Speculative work failed: {str(e)}")
+        finally:
+            _current_speculation.reset(token)
+            speculation.done.set()
+
+    def _evict_expired(self):
+        """Forget work whose window has passed (caller holds the lock)"""
+        now = time.time()
+        expired = [key for key, speculation in self._speculations.items() if now > speculation.expires_at]
+        for key in expired:
+            del self._speculations[key]
+
+# Global speculative runner instance
+speculative_runner = SpeculativeRunner(
+    window=float(os.environ.get("SPECULATION_WINDOW_SECONDS", "60")),
+    max_workers=int(os.environ.get("SPECULATION_MAX_WORKERS", "2"))
+)
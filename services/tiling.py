@@ -0,0 +1,288 @@
+"""
+Tiled Image Analysis
+Splits high-resolution images into overlapping tiles, scans them concurrently and merges the findings
+"""
+
+import contextvars
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from services.model_router import model_router
+from services.priority import Priority, agent_executor
+from services.quota_scheduler import get_request_context
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = int(os.environ.get("TILE_SIZE", "1024"))
+TILE_OVERLAP = int(os.environ.get("TILE_OVERLAP", "128"))
+TILE_MAX_TILES = int(os.environ.get("TILE_MAX_TILES", "16"))
+# Images whose longer side exceeds this are tiled unless the request opts out
+TILING_MIN_SIDE = int(os.environ.get("TILING_MIN_SIDE", "3000"))
+# Seconds tile scans may take when the request sets no latency budget
+TILE_SCAN_TIMEOUT = float(os.environ.get("TILE_SCAN_TIMEOUT", "120"))
+
+# Findings from neighbouring tiles are merged when this much of the smaller box overlaps the other
+DUPLICATE_OVERLAP = 0.6
+
+@dataclass
+class Tile:
+    """One tile of an image, in the pixel coordinates of the original"""
+    x: int
+    y: int
+    width: int
+    height: int
+    digest: str
+    data: bytes = field(repr=False)
+
+class TileCache:
+    """In-process LRU of tile findings keyed by tile pixels and model"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def get(self, key: Tuple[str, str]) -> Optional[List[Dict[str, Any]]]:
+        """Get a tile's findings, or None on a miss"""
+        with self._lock:
+            findings = self._entries.get(key)
+            if findings is not None:
+                self._entries.move_to_end(key)
+            self._stats['hits' if findings is not None else 'misses'] += 1
+            return findings
+
+    def put(self, key: Tuple[str, str], findings: List[Dict[str, Any]]):
+        """Store a tile's findings, evicting the least recently used"""
+        with self._lock:
+            self._entries[key] = findings
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get size, hit/miss counts and hit rate"""
+        with self._lock:
+            hits, misses = self._stats['hits'], self._stats['misses']
+            size = len(self._entries)
+        return {
+            'entries': size,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0
+        }
+
+class TileJob:
+    """Tile scans in flight for one image"""
+
+    def __init__(self, tiles: List[Tile], results: Dict[str, Any], futures: Dict[Any, Tile],
+                 image_size: Tuple[int, int], scale: float, tile_size: int, overlap: int):
+        self.tiles = tiles
+        self.image_size = image_size
+        self.scale = scale
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self._results = results
+        self._futures = futures
+
+    def result(self, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Wait until deadline (epoch seconds) for the tile scans and return merged findings in original image coordinates
+
+        Tiles still scanning at the deadline are cancelled and counted as failed.
+        """
+        cached_tiles = len(self._results)
+        failed_tiles = 0
+
+        for future, tile in self._futures.items():
+            try:
+                timeout = None if deadline is None else max(deadline - time.time(), 0.0)
+                self._results[tile.digest] = future.result(timeout=timeout)
+            except TimeoutError:
+                future.cancel()
+                failed_tiles += 1
+                logger.warning(f"Tile at ({tile.x}, {tile.y}) missed the latency budget")
+            except Exception as e:
+                future.cancel()
+                failed_tiles += 1
+                logger.warning(f"Tile at ({tile.x}, {tile.y}) failed: {str(e)}")
+
+        findings = []
+        for tile in self.tiles:
+            for finding in self._results.get(tile.digest, []):
+                findings.append(self._to_image_coordinates(finding, tile))
+
+        return {
+            'image_size': list(self.image_size),
+            'tile_size': self.tile_size,
+            'overlap': self.overlap,
+            'scale': round(self.scale, 3),
+            'tiles': len(self.tiles),
+            'cached_tiles': cached_tiles,
+            'failed_tiles': failed_tiles,
+            'findings': merge_tile_findings(findings)
+        }
+
+    def _to_image_coordinates(self, finding: Dict[str, Any], tile: Tile) -> Dict[str, Any]:
+        """Map a tile-relative box to pixels of the original image"""
+        box = (list(finding.get('box') or []) + [0.0, 0.0, 1.0, 1.0])[:4]
+        x0, y0, x1, y1 = [min(max(float(value), 0.0), 1.0) for value in box]
+        return {
+            'description': finding.get('description', ''),
+            'category': finding.get('category', 'unknown'),
+            'confidence': finding.get('confidence', 0.0),
+            'box': [
+                round(tile.x + x0 * tile.width), round(tile.y + y0 * tile.height),
+                round(tile.x + x1 * tile.width), round(tile.y + y1 * tile.height)
+            ],
+            'tile': [tile.x, tile.y, tile.width, tile.height]
+        }
+
+def merge_tile_findings(findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop duplicates of the same object reported by overlapping tiles, keeping the most confident"""
+    merged = []
+    for finding in sorted(findings, key=lambda finding: finding['confidence'], reverse=True):
+        if not any(
+            kept['category'] == finding['category'] and _box_overlap(kept['box'], finding['box']) >= DUPLICATE_OVERLAP
+            for kept in merged
+        ):
+            merged.append(finding)
+    return merged
+
+def _box_overlap(a: List[int], b: List[int]) -> float:
+    """Intersection area over the smaller box's area"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return width * height / smaller if smaller > 0 else 0.0
+
+class TiledImageAnalyzer:
+    """Scans overlapping full-resolution tiles of large images through the shared agent executor"""
+
+    def __init__(self, gemini_service, cache: TileCache, tile_size: int = TILE_SIZE,
+                 overlap: int = TILE_OVERLAP, max_tiles: int = TILE_MAX_TILES,
+                 min_side: int = TILING_MIN_SIDE):
+        self.gemini_service = gemini_service
+        self.cache = cache
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_tiles = max_tiles
+        self.min_side = min_side
+
+    def should_tile(self, image_data: Optional[bytes], requested: Optional[bool] = None) -> bool:
+        """Tile when requested and larger than a tile, or automatically for very large images"""
+        if not image_data or requested is False:
+            return False
+
+        try:
+            # Reads only the header
+            longer_side = max(Image.open(io.BytesIO(image_data)).size)
+        except Exception:
+            return False
+
+        return longer_side > (self.tile_size if requested else self.min_side)
+
+    def start(self, image_data: bytes) -> TileJob:
+        """Split an image and submit scans for the tiles not already cached"""
+        tiles, image_size, scale = self.split(image_data)
+        model = model_router.select_model('tile_scanner')
+        priority = get_request_context().get('priority', Priority.COMMAND)
+
+        results = {}
+        futures = {}
+        for tile in tiles:
+            if tile.digest in results or any(submitted.digest == tile.digest for submitted in futures.values()):
+                continue
+            cached = self.cache.get((tile.digest, model))
+            if cached is not None:
+                results[tile.digest] = cached
+                continue
+            # Carry the caller's quota scheduling context into the worker thread
+            future = agent_executor.submit(
+                priority, contextvars.copy_context().run, self._scan_tile, tile, model
+            )
+            futures[future] = tile
+
+        logger.info(f"Tiled {image_size[0]}x{image_size[1]} image into {len(tiles)} tiles "
+                    f"({len(results)} cached, {len(futures)} to scan)")
+        return TileJob(tiles, results, futures, image_size, scale, self.tile_size, self.overlap)
+
+    def split(self, image_data: bytes) -> Tuple[List[Tile], Tuple[int, int], float]:
+        """Cut an image into overlapping tiles on a fixed grid, downscaling them if there would be more than max_tiles
+
+        The grid starts at the top-left pixel with a stride fixed at original resolution, and the
+        downscale is a power of two chosen from the image size. Each tile is cut before it is
+        downscaled. So a region that is unchanged between two versions of an image, e.g. after an
+        edge crop or a small resize of the canvas, yields identical tile pixels and hits the cache.
+        """
+        image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image for tiling")
+
+        height, width = image.shape[:2]
+        factor = self._downscale_factor(width, height)
+        span = self.tile_size * factor
+
+        tiles = []
+        for y in self._tile_offsets(height, factor):
+            for x in self._tile_offsets(width, factor):
+                crop = image[y:y + span, x:x + span]
+                # Whole factor-sized blocks only, so INTER_AREA averages the same pixels in every version
+                crop = crop[:crop.shape[0] - crop.shape[0] % factor, :crop.shape[1] - crop.shape[1] % factor]
+                if crop.size == 0:
+                    continue
+                if factor > 1:
+                    crop = cv2.resize(crop, (crop.shape[1] // factor, crop.shape[0] // factor),
+                                      interpolation=cv2.INTER_AREA)
+                # Keyed by pixels so an unchanged region hits the cache regardless of the file around it
+                digest = hashlib.sha256(str(crop.shape).encode() + crop.tobytes()).hexdigest()
+                encoded, buffer = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, 90])
+                if not encoded:
+                    raise ValueError("Could not encode image tile")
+                tiles.append(Tile(
+                    x=x, y=y, width=crop.shape[1] * factor, height=crop.shape[0] * factor,
+                    digest=digest, data=buffer.tobytes()
+                ))
+
+        return tiles, (width, height), 1.0 / factor
+
+    def _tile_offsets(self, length: int, factor: int = 1) -> List[int]:
+        """Tile start offsets in original pixels along one axis; the last tile may be cut short by the edge"""
+        span = self.tile_size * factor
+        stride = (self.tile_size - self.overlap) * factor
+        offsets = [0]
+        while offsets[-1] + span < length:
+            offsets.append(offsets[-1] + stride)
+        return offsets
+
+    def _tile_count(self, width: int, height: int, factor: int = 1) -> int:
+        """Number of tiles an image of this size splits into at a downscale factor"""
+        return len(self._tile_offsets(width, factor)) * len(self._tile_offsets(height, factor))
+
+    def _downscale_factor(self, width: int, height: int) -> int:
+        """Smallest power-of-two downscale that keeps the tile count within max_tiles"""
+        factor = 1
+        while self._tile_count(width, height, factor) > self.max_tiles:
+            factor *= 2
+        return factor
+
+    def _scan_tile(self, tile: Tile, model: str) -> List[Dict[str, Any]]:
+        """Scan one tile and cache its findings"""
+        findings = self.gemini_service.analyze_image_tile(tile.data, model)
+        self.cache.put((tile.digest, model), findings)
+        return findings
+
+# Global tile findings cache instance
+tile_cache = TileCache(max_entries=int(os.environ.get("TILE_CACHE_SIZE", "512")))
@@ -0,0 +1,160 @@
+"""
+Frame Triage
+Cheap local image checks that keep blank, blurry or unusable frames away from remote model calls
+"""
+
+import logging
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Triage decisions, from least to most analysis
+REJECT = 'reject'
+DOWNGRADE = 'downgrade'
+FULL = 'full'
+
+class FrameTriage:
+    """Scores a frame's blur, exposure, entropy and edge density and decides how much analysis it deserves"""
+
+    def __init__(self, enabled: bool = True, blur_min: float = 15.0, entropy_min: float = 2.5,
+                 edge_density_min: float = 0.005, clipped_max: float = 0.9,
+                 classifier_path: Optional[str] = None, relevance_min: float = 0.2):
+        self.enabled = enabled
+        # Variance of the Laplacian; lower is blurrier
+        self.blur_min = blur_min
+        # Shannon entropy of the grayscale histogram in bits (0 - 8); blank frames sit near 0
+        self.entropy_min = entropy_min
+        # Fraction of Canny edge pixels
+        self.edge_density_min = edge_density_min
+        # Fraction of pixels crushed to black or blown to white
+        self.clipped_max = clipped_max
+        self.classifier_path = classifier_path
+        self.relevance_min = relevance_min
+        self._classifier = None
+        self._classifier_failed = False
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def assess(self, image_data: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        """Triage one encoded frame; returns the decision, reasons and metrics, or None if not triaged"""
+        if not self.enabled or not image_data:
+            return None
+
+        try:
+            buffer = np.frombuffer(image_data, dtype=np.uint8)
+            # Decode at 1/2 resolution; the metrics only need coarse structure
+            image = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+            if image is None:
+                return None
+
+            metrics = self.measure(image)
+            relevance = self._classify(image)
+            if relevance is not None:
+                metrics['relevance'] = relevance
+
+        except Exception as e:
+            logger.warning(f"Error triaging frame: {e}")
+            return None
+
+        decision, reasons = self.decide(metrics)
+        with self._lock:
+            self._stats[decision] += 1
+
+        return {'decision': decision, 'reasons': reasons, 'metrics': metrics}
+
+    def measure(self, image: np.ndarray) -> Dict[str, float]:
+        """Blur, exposure, entropy and edge density of a grayscale image"""
+        histogram = np.bincount(image.ravel(), minlength=256).astype(np.float64)
+        probabilities = histogram / histogram.sum()
+        nonzero = probabilities[probabilities > 0]
+
+        edges = cv2.Canny(image, 100, 200)
+
+        return {
+            'blur': round(float(cv2.Laplacian(image, cv2.CV_64F).var()), 2),
+            'brightness': round(float(image.mean()) / 255.0, 3),
+            'clipped_fraction': round(float(probabilities[:6].sum() + probabilities[250:].sum()), 3),
+            'entropy': round(float((nonzero * np.log2(1.0 / nonzero)).sum()), 3),
+            'edge_density': round(float(np.count_nonzero(edges)) / edges.size, 4)
+        }
+
+    def decide(self, metrics: Dict[str, float]) -> Tuple[str, List[str]]:
+        """Map metrics to a decision: reject frames with no usable content, downgrade marginal ones"""
+        reject_reasons = []
+        if metrics['entropy'] < self.entropy_min:
+            reject_reasons.append(f"Near-uniform frame (entropy {metrics['entropy']:.2f} bits)")
+        if metrics['clipped_fraction'] > self.clipped_max:
+            reject_reasons.append(f"Frame over- or under-exposed ({metrics['clipped_fraction']:.0%} clipped)")
+        if metrics['blur'] < self.blur_min and metrics['edge_density'] < self.edge_density_min:
+            reject_reasons.append(f"Frame too blurred to resolve detail (blur {metrics['blur']:.1f})")
+        if 'relevance' in metrics and metrics['relevance'] < self.relevance_min / 2:
+            reject_reasons.append(f"Classifier found no relevant content ({metrics['relevance']:.2f})")
+        if reject_reasons:
+            return REJECT, reject_reasons
+
+        downgrade_reasons = []
+        if metrics['blur'] < self.blur_min:
+            downgrade_reasons.append(f"Blurred frame (blur {metrics['blur']:.1f})")
+        if metrics['edge_density'] < self.edge_density_min:
+            downgrade_reasons.append(f"Little visible structure (edge density {metrics['edge_density']:.4f})")
+        if 'relevance' in metrics and metrics['relevance'] < self.relevance_min:
+            downgrade_reasons.append(f"Low classifier relevance ({metrics['relevance']:.2f})")
+        if downgrade_reasons:
+            return DOWNGRADE, downgrade_reasons
+
+        return FULL, []
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get decision counts"""
+        with self._lock:
+            counts = dict(self._stats)
+        return {
+            'enabled': self.enabled,
+            'classifier': self.classifier_path if self._classifier is not None else None,
+            'decisions': {decision: counts.get(decision, 0) for decision in (REJECT, DOWNGRADE, FULL)}
+        }
+
+    def _classify(self, image: np.ndarray) -> Optional[float]:
+        """Relevance probability from the optional ONNX classifier, or None if none is configured"""
+        classifier = self._get_classifier()
+        if classifier is None:
+            return None
+
+        # Single-channel 64x64 input scaled to 0 - 1; the model outputs one relevance logit
+        blob = cv2.dnn.blobFromImage(cv2.resize(image, (64, 64)), scalefactor=1.0 / 255.0)
+        with self._lock:
+            classifier.setInput(blob)
+            logit = float(classifier.forward().ravel()[0])
+        return round(1.0 / (1.0 + np.exp(-logit)), 3)
+
+    def _get_classifier(self):
+        """Load the classifier on first use"""
+        if not self.classifier_path or self._classifier_failed:
+            return None
+
+        with self._lock:
+            if self._classifier is None and not self._classifier_failed:
+                try:
+                    self._classifier = cv2.dnn.readNetFromONNX(self.classifier_path)
+                    logger.info(f"Loaded triage classifier from {self.classifier_path}")
+                except Exception as e:
+                    logger.warning(f"Triage classifier unavailable, using image metrics only: {e}")
+                    self._classifier_failed = True
+            return self._classifier
+
+# Global frame triage instance
+frame_triage = FrameTriage(
+    enabled=os.environ.get("TRIAGE_ENABLED", "true").lower() == "true",
+    blur_min=float(os.environ.get("TRIAGE_BLUR_MIN", "15")),
+    entropy_min=float(os.environ.get("TRIAGE_ENTROPY_MIN", "2.5")),
+    edge_density_min=float(os.environ.get("TRIAGE_EDGE_DENSITY_MIN", "0.005")),
+    clipped_max=float(os.environ.get("TRIAGE_CLIPPED_MAX", "0.9")),
+    classifier_path=os.environ.get("TRIAGE_CLASSIFIER_PATH") or None,
+    relevance_min=float(os.environ.get("TRIAGE_RELEVANCE_MIN", "0.2"))
+)
@@ -1,10 +1,16 @@
 import logging
 import os
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
 import chromadb
 from chromadb.config import Settings
 import json
 
+from services.embedding_cache import embedding_cache, normalize_query
+from services.embedding_server import connect_embedding_server
+from services.onnx_encoder import load_onnx_encoder
+
 # Try to import sentence transformers, use fallback if not available
 try:
     from sentence_transformers import SentenceTransformer
@@ -12,6 +18,72 @@ try:
 except ImportError:
     HAS_SENTENCE_TRANSFORMERS = False
 
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+# 'sentence_transformers' (PyTorch) or 'onnx' (int8 ONNX Runtime export, see embedding_cli.py)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "sentence_transformers").lower()
+
+# Texts per encoder forward pass during bulk writes
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+# Rows per collection write; ChromaDB rejects writes above its maximum batch size
+WRITE_BATCH_SIZE = int(os.environ.get("VECTOR_WRITE_BATCH_SIZE", "1000"))
+
+# Collection holding each knowledge category; other categories go to chemvio_knowledge
+CATEGORY_COLLECTIONS = {
+    'chemical_hazards': 'chemvio_knowledge',
+    'drug_precursors': 'chemvio_knowledge',
+    'synthesis_detection': 'chemvio_knowledge',
+    'tactical_procedures': 'tactical_procedures',
+    'evidence_collection': 'tactical_procedures',
+    'protective_equipment': 'hazmat_database',
+    'detection_equipment': 'hazmat_database',
+    'biosafety': 'hazmat_database'
+}
+
+# Fixed retrieval queries of each agent's domain
+AGENT_QUERIES = {
+    'hazard_detector': [
+        'chemical hazards detection',
+        'biological hazards identification',
+        'toxic exposure symptoms',
+        'contamination assessment'
+    ],
+    'synthesis_analyzer': [
+        'chemical synthesis processes',
+        'drug precursor identification',
+        'clandestine laboratory indicators',
+        'illicit manufacturing methods'
+    ],
+    'mopp_recommender': [
+        'protective equipment guidelines',
+        'MOPP level recommendations',
+        'chemical exposure protection',
+        'decontamination procedures'
+    ],
+    'sampling_strategist': [
+        'evidence collection procedures',
+        'sampling protocols',
+        'chain of custody requirements',
+        'analytical methods'
+    ]
+}
+AGENT_QUERY_LIMIT = 3
+
+# How often precomputed results re-check collection sizes for writes made by other processes
+STATIC_CONTEXT_RECHECK_SECONDS = float(os.environ.get("STATIC_CONTEXT_RECHECK_SECONDS", "30"))
+# File every knowledge write touches, so processes sharing the store see each other's upserts
+KNOWLEDGE_VERSION_FILE = os.environ.get("KNOWLEDGE_VERSION_FILE", "./chroma_db/knowledge_version")
+
+def load_local_encoder() -> Tuple[Any, Optional[str]]:
+    """Encoder selected by EMBEDDING_BACKEND and its backend name; (None, None) if no encoder is available"""
+    # Fall back to sentence transformers if the ONNX export is missing
+    if EMBEDDING_BACKEND == 'onnx':
+        encoder = load_onnx_encoder()
+        if encoder is not None:
+            return encoder, 'onnx-int8'
+    if HAS_SENTENCE_TRANSFORMERS:
+        return SentenceTransformer(EMBEDDING_MODEL), 'sentence-transformers'
+    return None, None
+
 class VectorDatabase:
     """Vector database service for RAG capabilities"""
     
@@ -25,21 +97,43 @@ class VectorDatabase:
             persist_directory="./chroma_db"
         ))
         
-        # Initialize sentence transformer for embeddings
-        if HAS_SENTENCE_TRANSFORMERS:
-            self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
+        # Initialize encoder for embeddings, preferring the host's shared embedding server
+        self.encoder = connect_embedding_server()
+        if self.encoder is not None:
+            self.encoder_backend = self.encoder.backend
         else:
-            self.encoder = None
+            self.encoder, self.encoder_backend = load_local_encoder()
+        if self.encoder is None:
             self.logger.warning("Sentence transformers not available, using basic text matching")
+            
+        # Query embeddings are cached per encoder identity; case folding is safe only for uncased tokenizers
+        self.embedding_cache = embedding_cache
+        self.encoder_id = self._encoder_identity()
+        self._lowercase_queries = bool(getattr(getattr(self.encoder, 'tokenizer', None), 'do_lower_case', False))
         
         # Initialize collections
         self.chemvio_collection = self._get_or_create_collection('chemvio_knowledge')
         self.tactical_collection = self._get_or_create_collection('tactical_procedures')
         self.hazmat_collection = self._get_or_create_collection('hazmat_database')
         
+        # Precomputed results of static queries, valid for one knowledge stamp
+        self._static_lock = threading.Lock()
+        self._static_queries = {}
+        self._static_results = {}
+        self._static_stamp = None
+        self._static_refreshing = False
+        self._static_stats = {'hits': 0, 'misses': 0, 'refreshes': 0}
+        self._knowledge_version = 0
+        self._collection_counts = None
+        self._counts_checked_at = 0.0
+        
         # Initialize knowledge base
         self._initialize_knowledge_base()
         
+        # Precompute agent domain retrieval
+        static_agent_queries = [query for queries in AGENT_QUERIES.values() for query in queries]
+        self.register_static_queries(static_agent_queries + ['general knowledge'], limit=AGENT_QUERY_LIMIT)
+        
     def _get_or_create_collection(self, name: str):
         """Get or create a ChromaDB collection"""
         try:
@@ -147,170 +241,333 @@ class VectorDatabase:
         # Add all knowledge to the database
         all_knowledge = chemical_knowledge + biological_knowledge + mopp_knowledge + tactical_knowledge
         
-        for knowledge in all_knowledge:
-            self.add_knowledge(knowledge)
+        try:
+            self.add_knowledge_batch(all_knowledge)
+        except Exception as e:
+            self.logger.error(f"Error initializing knowledge base: {str(e)}")
+            return
             
         self.logger.info(f"Initialized knowledge base with {len(all_knowledge)} entries")
         
     def add_knowledge(self, knowledge: Dict[str, Any]) -> bool:
         """Add knowledge entry to the vector database"""
         try:
-            # Create embedding
-            if self.encoder:
-                embedding = self.encoder.encode(knowledge['content']).tolist()
-            else:
-                # Use basic text hash as fallback
-                embedding = [hash(knowledge['content']) % 1000 / 1000.0] * 384
-            
-            # Add to appropriate collection
-            if knowledge['category'] in ['chemical_hazards', 'drug_precursors', 'synthesis_detection']:
-                collection = self.chemvio_collection
-            elif knowledge['category'] in ['tactical_procedures', 'evidence_collection']:
-                collection = self.tactical_collection
-            elif knowledge['category'] in ['protective_equipment', 'detection_equipment', 'biosafety']:
-                collection = self.hazmat_collection
-            else:
-                collection = self.chemvio_collection  # Default
-                
-            # Add to collection
-            collection.add(
-                ids=[knowledge['id']],
-                embeddings=[embedding],
-                metadatas=[{
-                    'title': knowledge['title'],
-                    'category': knowledge['category'],
-                    'tags': json.dumps(knowledge['tags']),
-                    'source': knowledge['source']
-                }],
-                documents=[knowledge['content']]
-            )
-            
+            self.add_knowledge_batch([knowledge])
             return True
             
         except Exception as e:
             self.logger.error(f"Error adding knowledge: {str(e)}")
             return False
             
+    def add_knowledge_batch(self, entries: List[Dict[str, Any]], batch_size: Optional[int] = None,
+                            upsert: bool = False) -> int:
+        """Embed entries in batched encoder calls and write them with one call per collection
+        
+        Returns the number of rows written; raises on failure so callers can retry or resume.
+        upsert overwrites entries with the same id, making repeated ingestion idempotent.
+        """
+        if not entries:
+            return 0
+            
+        embeddings = self._encode_batch([entry['content'] for entry in entries], batch_size)
+        
+        # Group rows by target collection
+        grouped = {}
+        for entry, embedding in zip(entries, embeddings):
+            collection = self._collection_for_category(entry.get('category')) or self.chemvio_collection
+            grouped.setdefault(collection.name, (collection, []))[1].append((entry, embedding))
+            
+        written = 0
+        for collection, rows in grouped.values():
+            write = collection.upsert if upsert else collection.add
+            for start in range(0, len(rows), WRITE_BATCH_SIZE):
+                chunk = rows[start:start + WRITE_BATCH_SIZE]
+                write(
+                    ids=[entry['id'] for entry, _ in chunk],
+                    embeddings=[embedding for _, embedding in chunk],
+                    metadatas=[self._entry_metadata(entry) for entry, _ in chunk],
+                    documents=[entry['content'] for entry, _ in chunk]
+                )
+                written += len(chunk)
+                
+        # Invalidate precomputed static results, here and in other processes
+        with self._static_lock:
+            self._knowledge_version += 1
+            self._collection_counts = None
+        self._touch_knowledge_version_file()
+            
+        return written
+        
+    def _touch_knowledge_version_file(self):
+        """Bump the modification time of the shared knowledge version file"""
+        try:
+            directory = os.path.dirname(KNOWLEDGE_VERSION_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(KNOWLEDGE_VERSION_FILE, 'a'):
+                os.utime(KNOWLEDGE_VERSION_FILE, None)
+        except OSError as e:
+            self.logger.warning(f"Could not update knowledge version file: {str(e)}")
+        
+    def _encode_batch(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """Embed several texts, letting the encoder batch its forward passes"""
+        if self.encoder:
+            return self.encoder.encode(
+                texts, batch_size=batch_size or EMBEDDING_BATCH_SIZE, show_progress_bar=False
+            ).tolist()
+        # Use basic text hash as fallback
+        return [[hash(text) % 1000 / 1000.0] * 384 for text in texts]
+        
+    def _encode_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed search queries through the embedding cache, encoding only distinct misses"""
+        if not self.encoder:
+            return self._encode_batch(queries)
+            
+        normalized = [normalize_query(query, self._lowercase_queries) for query in queries]
+        embeddings = self.embedding_cache.get_many(self.encoder_id, normalized)
+        
+        missing = list(dict.fromkeys(text for text, embedding in zip(normalized, embeddings) if embedding is None))
+        if missing:
+            encoded = dict(zip(missing, self._encode_batch(missing)))
+            self.embedding_cache.put_many(self.encoder_id, missing, [encoded[text] for text in missing])
+            embeddings = [embedding if embedding is not None else encoded[text]
+                          for text, embedding in zip(normalized, embeddings)]
+            
+        return embeddings
+        
+    def _encoder_identity(self) -> Optional[str]:
+        """Model, backend and output size of the encoder; cached embeddings of any other encoder are never used"""
+        if not self.encoder:
+            return None
+        model_name = getattr(self.encoder, 'model_name', EMBEDDING_MODEL)
+        return f"{model_name}:{self.encoder_backend}:{self.encoder.get_sentence_embedding_dimension()}"
+        
+    def _entry_metadata(self, knowledge: Dict[str, Any]) -> Dict[str, Any]:
+        """Collection metadata of a knowledge entry"""
+        metadata = {
+            'title': knowledge.get('title', knowledge['id']),
+            'category': knowledge.get('category', 'general'),
+            'tags': json.dumps(knowledge.get('tags', [])),
+            'source': knowledge.get('source', '')
+        }
+        # Chunks of longer documents point back at their document
+        for key in ('document_id', 'chunk', 'chunks'):
+            if key in knowledge:
+                metadata[key] = knowledge[key]
+        return metadata
+        
+    def _collection_for_category(self, category: Optional[str]):
+        """Collection holding a knowledge category, or None if the category has no dedicated collection"""
+        return {
+            'chemvio_knowledge': self.chemvio_collection,
+            'tactical_procedures': self.tactical_collection,
+            'hazmat_database': self.hazmat_collection
+        }.get(CATEGORY_COLLECTIONS.get(category))
+            
     def search_knowledge(self, query: str, category: Optional[str] = None, 
                         limit: int = 5) -> List[Dict[str, Any]]:
         """Search for relevant knowledge based on query"""
+        return self.search_knowledge_batch([query], category, limit)[0]
+        
+    def search_knowledge_batch(self, queries: List[str], category: Optional[str] = None,
+                               limit: int = 5) -> List[List[Dict[str, Any]]]:
+        """Search for several queries with one encoder call and one query per collection
+        
+        Returns each query's results sorted by distance, in query order.
+        """
+        if not queries:
+            return []
+            
         try:
-            # Create query embedding
-            if self.encoder:
-                query_embedding = self.encoder.encode(query).tolist()
-            else:
-                # Use basic text hash as fallback
-                query_embedding = [hash(query) % 1000 / 1000.0] * 384
+            # Static queries are served from memory; only the rest reach the encoder and Chroma
+            all_results = self._lookup_static(queries, category, limit)
+            dynamic = [index for index, results in enumerate(all_results) if results is None]
+            if dynamic:
+                searched = self._search_collections([queries[index] for index in dynamic], category, limit)
+                for index, results in zip(dynamic, searched):
+                    all_results[index] = results
+            return all_results
             
-            # Determine which collections to search
-            collections = []
-            if category:
-                if category in ['chemical_hazards', 'drug_precursors', 'synthesis_detection']:
-                    collections = [self.chemvio_collection]
-                elif category in ['tactical_procedures', 'evidence_collection']:
-                    collections = [self.tactical_collection]
-                elif category in ['protective_equipment', 'detection_equipment', 'biosafety']:
-                    collections = [self.hazmat_collection]
+        except Exception as e:
+            self.logger.error(f"Error searching knowledge: {str(e)}")
+            return [[] for _ in queries]
+            
+    def register_static_queries(self, queries: List[str], category: Optional[str] = None, limit: int = 5):
+        """Precompute results of queries that recur unchanged, serving them from memory until the knowledge changes"""
+        with self._static_lock:
+            for query in queries:
+                key = (query, category)
+                self._static_queries[key] = max(limit, self._static_queries.get(key, 0))
+                if self._static_results.get(key, (0, None))[0] < limit:
+                    self._static_results.pop(key, None)
+        try:
+            self._refresh_static()
+        except Exception as e:
+            self.logger.error(f"Error precomputing static knowledge context: {str(e)}")
+                
+    def get_static_context_stats(self) -> Dict[str, Any]:
+        """Get precomputed query counts and how often searches were served from them"""
+        with self._static_lock:
+            return {
+                'static_queries': len(self._static_queries),
+                'precomputed': len(self._static_results),
+                'knowledge_version': self._knowledge_version,
+                **self._static_stats
+            }
+            
+    def _lookup_static(self, queries: List[str], category: Optional[str],
+                       limit: int) -> List[Optional[List[Dict[str, Any]]]]:
+        """Precomputed results of each query, or None for queries that must be searched"""
+        with self._static_lock:
+            if not any((query, category) in self._static_queries for query in queries):
+                self._static_stats['misses'] += len(queries)
+                return [None] * len(queries)
+                
+        try:
+            self._refresh_static()
+        except Exception as e:
+            self.logger.error(f"Error refreshing static knowledge context: {str(e)}")
+            
+        with self._static_lock:
+            found = []
+            for query in queries:
+                stored_limit, results = self._static_results.get((query, category), (0, None))
+                # The top results of a larger search are the results of a smaller one
+                if results is not None and stored_limit >= limit:
+                    found.append([dict(knowledge) for knowledge in results[:limit]])
+                    self._static_stats['hits'] += 1
                 else:
-                    collections = [self.chemvio_collection, self.tactical_collection, self.hazmat_collection]
-            else:
-                collections = [self.chemvio_collection, self.tactical_collection, self.hazmat_collection]
+                    found.append(None)
+                    self._static_stats['misses'] += 1
+            return found
+            
+    def _refresh_static(self):
+        """Recompute static results after the knowledge changed, and compute new ones; call without _static_lock
+        
+        Searches run outside the lock, so concurrent lookups are not blocked: queries without fresh
+        results are searched directly until the refresh swaps its results in. Only one refresh runs
+        at a time, and results computed against knowledge that changed meanwhile are discarded.
+        """
+        with self._static_lock:
+            if self._static_refreshing:
+                return
+            stamp = self._knowledge_stamp()
+            if stamp != self._static_stamp:
+                self._static_results = {}
+                self._static_stamp = stamp
                 
-            # Search collections
-            all_results = []
-            for collection in collections:
-                results = collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=limit
-                )
+            # Group missing queries so each (category, limit) pair costs one batched search
+            missing = {}
+            for (query, category), limit in self._static_queries.items():
+                if (query, category) not in self._static_results:
+                    missing.setdefault((category, limit), []).append(query)
+            if not missing:
+                return
+            self._static_refreshing = True
+            
+        try:
+            fresh = {}
+            for (category, limit), queries in missing.items():
+                for query, results in zip(queries, self._search_collections(queries, category, limit)):
+                    fresh[(query, category)] = (limit, results)
+        finally:
+            with self._static_lock:
+                self._static_refreshing = False
                 
-                if results['documents'] and results['documents'][0]:
-                    for i, doc in enumerate(results['documents'][0]):
-                        all_results.append({
-                            'content': doc,
-                            'metadata': results['metadatas'][0][i],
-                            'distance': results['distances'][0][i],
-                            'id': results['ids'][0][i]
-                        })
-                        
-            # Sort by distance (similarity) and return top results
-            all_results.sort(key=lambda x: x['distance'])
-            return all_results[:limit]
+        with self._static_lock:
+            if self._knowledge_stamp() != stamp:
+                return
+            for key, (limit, results) in fresh.items():
+                # A query re-registered with a larger limit meanwhile needs a larger search
+                if self._static_queries.get(key) == limit:
+                    self._static_results[key] = (limit, results)
+            self._static_stats['refreshes'] += 1
+        self.logger.info(f"Precomputed knowledge context for {sum(map(len, missing.values()))} static queries")
+        
+    def _knowledge_stamp(self):
+        """Version of the knowledge base: local writes, the shared version file and collection sizes
+        
+        The version file catches writes by other processes such as ingest_cli.py, including same-id
+        upserts; periodically checked sizes catch writers that do not touch it. Call with _static_lock held.
+        """
+        now = time.time()
+        if self._collection_counts is None or now - self._counts_checked_at >= STATIC_CONTEXT_RECHECK_SECONDS:
+            self._collection_counts = (
+                self.chemvio_collection.count(),
+                self.tactical_collection.count(),
+                self.hazmat_collection.count()
+            )
+            self._counts_checked_at = now
+        try:
+            shared_version = os.stat(KNOWLEDGE_VERSION_FILE).st_mtime_ns
+        except OSError:
+            shared_version = None
+        return (self._knowledge_version, shared_version, self._collection_counts)
+        
+    def _search_collections(self, queries: List[str], category: Optional[str],
+                            limit: int) -> List[List[Dict[str, Any]]]:
+        """Embed queries in one batch and query each collection once with all of them"""
+        query_embeddings = self._encode_queries(queries)
+        
+        # Determine which collections to search
+        collection = self._collection_for_category(category)
+        if collection is not None:
+            collections = [collection]
+        else:
+            collections = [self.chemvio_collection, self.tactical_collection, self.hazmat_collection]
             
-        except Exception as e:
-            self.logger.error(f"Error searching knowledge: {str(e)}")
-            return []
+        # Search collections, each answering every query in one round trip
+        all_results = [[] for _ in queries]
+        for collection in collections:
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=limit
+            )
+            
+            for query_index, documents in enumerate(results['documents'] or []):
+                for i, doc in enumerate(documents or []):
+                    all_results[query_index].append({
+                        'content': doc,
+                        'metadata': results['metadatas'][query_index][i],
+                        'distance': results['distances'][query_index][i],
+                        'id': results['ids'][query_index][i]
+                    })
+                    
+        # Sort by distance (similarity) and return top results
+        for query_results in all_results:
+            query_results.sort(key=lambda x: x['distance'])
+        return [query_results[:limit] for query_results in all_results]
             
     def get_contextual_knowledge(self, findings: List[str], 
                                agent_type: str = 'general') -> List[Dict[str, Any]]:
         """Get contextual knowledge based on agent findings"""
-        context_knowledge = []
-        
-        for finding in findings:
-            # Search for relevant knowledge
-            results = self.search_knowledge(finding, limit=2)
-            context_knowledge.extend(results)
-            
-        # Remove duplicates
-        unique_knowledge = []
-        seen_ids = set()
-        for knowledge in context_knowledge:
-            if knowledge['id'] not in seen_ids:
-                unique_knowledge.append(knowledge)
-                seen_ids.add(knowledge['id'])
-                
-        return unique_knowledge[:10]  # Limit to top 10 results
+        results = self.search_knowledge_batch(findings, limit=2)
+        return self._merge_unique(results, 10)  # Limit to top 10 results
         
     def get_agent_specific_knowledge(self, agent_name: str, 
                                    context: str) -> List[Dict[str, Any]]:
         """Get knowledge specific to an agent's domain"""
-        agent_queries = {
-            'hazard_detector': [
-                'chemical hazards detection',
-                'biological hazards identification',
-                'toxic exposure symptoms',
-                'contamination assessment'
-            ],
-            'synthesis_analyzer': [
-                'chemical synthesis processes',
-                'drug precursor identification',
-                'clandestine laboratory indicators',
-                'illicit manufacturing methods'
-            ],
-            'mopp_recommender': [
-                'protective equipment guidelines',
-                'MOPP level recommendations',
-                'chemical exposure protection',
-                'decontamination procedures'
-            ],
-            'sampling_strategist': [
-                'evidence collection procedures',
-                'sampling protocols',
-                'chain of custody requirements',
-                'analytical methods'
-            ]
-        }
-        
-        queries = agent_queries.get(agent_name, ['general knowledge'])
+        queries = list(AGENT_QUERIES.get(agent_name, ['general knowledge']))
         
         # Add context to queries
         if context:
             queries.append(context)
             
-        all_knowledge = []
-        for query in queries:
-            results = self.search_knowledge(query, limit=3)
-            all_knowledge.extend(results)
-            
-        # Remove duplicates and return
+        results = self.search_knowledge_batch(queries, limit=AGENT_QUERY_LIMIT)
+        return self._merge_unique(results, 8)  # Limit to top 8 results
+        
+    def _merge_unique(self, result_lists: List[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+        """Concatenate per-query results in query order, dropping repeated ids, up to limit"""
         unique_knowledge = []
         seen_ids = set()
-        for knowledge in all_knowledge:
-            if knowledge['id'] not in seen_ids:
-                unique_knowledge.append(knowledge)
-                seen_ids.add(knowledge['id'])
-                
-        return unique_knowledge[:8]  # Limit to top 8 results
+        for results in result_lists:
+            for knowledge in results:
+                if knowledge['id'] not in seen_ids:
+                    unique_knowledge.append(knowledge)
+                    seen_ids.add(knowledge['id'])
+                    if len(unique_knowledge) == limit:
+                        return unique_knowledge
+        return unique_knowledge
         
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the knowledge collections"""
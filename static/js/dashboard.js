@@ -144,6 +144,11 @@ function setupGlobalEventHandlers() {
         updateAnalysisDisplay(data.analysis_results);
     };
     
+    // Streamed tactical summary / command briefing chunks
+    window.handleSummaryDelta = function(data) {
+        appendSummaryDelta(data);
+    };
+    
     // Global sensor update handler
     window.handleSensorUpdate = function(data) {
         console.log('Received sensor update:', data);
@@ -845,6 +850,48 @@ function updateSceneSummary(analysisResults) {
     sceneSummaryContent.innerHTML = summaryHtml;
 }
 
+const SUMMARY_ARTIFACT_TITLES = {
+    'tactical_summary': 'Tactical Summary',
+    'command_briefing': 'Command Briefing'
+};
+
+function appendSummaryDelta(data) {
+    const sceneSummary = document.getElementById('sceneSummary');
+    const sceneSummaryContent = document.getElementById('sceneSummaryContent');
+    const sceneSummaryEmpty = document.getElementById('sceneSummaryEmpty');
+    
+    if (!sceneSummaryContent || !data.delta) {
+        return;
+    }
+    
+    if (sceneSummaryEmpty) sceneSummaryEmpty.style.display = 'none';
+    sceneSummary.style.display = 'block';
+    
+    // One block per artifact; the full analysis update replaces it when generation finishes
+    const streamId = 'summaryStream-' + data.artifact;
+    let block = document.getElementById(streamId);
+    const analysisKey = String(data.analysis_id ?? '');
+    
+    if (!block || block.dataset.analysisId !== analysisKey) {
+        if (block) block.remove();
+        block = document.createElement('div');
+        block.id = streamId;
+        block.className = 'mb-2';
+        block.dataset.analysisId = analysisKey;
+        
+        const title = document.createElement('div');
+        title.innerHTML = `<strong>${SUMMARY_ARTIFACT_TITLES[data.artifact] || data.artifact}:</strong>`;
+        const text = document.createElement('div');
+        text.className = 'ms-3 summary-stream-text';
+        
+        block.appendChild(title);
+        block.appendChild(text);
+        sceneSummaryContent.appendChild(block);
+    }
+    
+    block.querySelector('.summary-stream-text').textContent += data.delta;
+}
+
 function getThreatBadge(threatLevel) {
     const badges = {
         'CRITICAL': '<span class="badge bg-danger">CRITICAL</span>',
@@ -0,0 +1,58 @@
+"""
+Agent dependency ordering and the gates that skip agents
+"""
+
+import pytest
+
+from agents.base_agent import AgentResult
+from agents.registry import AgentRegistry, AgentSpec, agent_registry, hazard_signal_present
+
+def registry_of(**dependencies):
+    registry = AgentRegistry()
+    for name, depends_on in dependencies.items():
+        registry.register(AgentSpec(name, object, depends_on=tuple(depends_on)))
+    return registry
+
+def hazard_result(confidence, error=False):
+    return AgentResult('hazard_detector', confidence, [], [], 'LOW', {'error': 'failed'} if error else {}, '')
+
+def test_dependencies_come_first():
+    registry = registry_of(report=['synthesis', 'hazard'], synthesis=['hazard'], hazard=[], sampling=['hazard'])
+
+    order = registry.topological_order()
+
+    assert sorted(order) == sorted(registry.names())
+    for name in order:
+        for dependency in registry.get(name).depends_on:
+            assert order.index(dependency) < order.index(name)
+
+def test_order_is_stable_for_independent_agents():
+    assert registry_of(c=[], a=[], b=[]).topological_order() == ['c', 'a', 'b']
+
+def test_cycles_are_rejected():
+    with pytest.raises(ValueError, match='cycle: a -> b -> c -> a'):
+        registry_of(a=['b'], b=['c'], c=['a']).topological_order()
+
+def test_unknown_dependencies_are_rejected():
+    with pytest.raises(ValueError, match='sampling depends on unknown agent lab'):
+        registry_of(sampling=['lab']).topological_order()
+
+def test_unregistering_a_dependency_breaks_the_graph():
+    registry = registry_of(hazard=[], sampling=['hazard'])
+    registry.unregister('hazard')
+
+    with pytest.raises(ValueError):
+        registry.create_agents()
+
+def test_default_registry():
+    order = agent_registry.topological_order()
+
+    assert order.index('hazard_detector') < order.index('sampling_strategist')
+    assert agent_registry.confidence_weights()['hazard_detector'] == 1.5
+
+def test_sampling_gate_skips_only_clean_empty_hazard_results():
+    assert hazard_signal_present({'hazard_detector': hazard_result(0.0)}) is not None
+    assert hazard_signal_present({'hazard_detector': hazard_result(0.4)}) is None
+    # A failed detector proves nothing, and neither does a missing one
+    assert hazard_signal_present({'hazard_detector': hazard_result(0.0, error=True)}) is None
+    assert hazard_signal_present({}) is None
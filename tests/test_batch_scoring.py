@@ -0,0 +1,126 @@
+"""
+Equivalence of the vectorized batch scoring rules with the agents' scalar scoring
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from agents.base_agent import AgentResult
+from agents.coordinator import AgentCoordinator
+from agents.hazard_agent import HazardDetectionAgent
+from agents.mopp_agent import MOPPRecommendationAgent
+from agents.registry import agent_registry
+from services.analysis_service import AnalysisService
+from services import batch_scoring
+from services.batch_scoring import HAZARD_THRESHOLDS, rescore_stored_results
+
+# Phrases the hazard and MOPP agents extract indicators from, plus filler
+VOCABULARY = [
+    'chemical containers', 'laboratory glassware', 'fume hoods', 'chemical storage', 'reaction vessels',
+    'distillation equipment', 'precursor chemicals', 'bioreactors', 'cell cultures', 'biosafety cabinets',
+    'explosive', 'toxic', 'corrosive', 'flammable', 'oxidizer', 'infectious', 'pathogen', 'containment',
+    'chemical leak', 'gas release', 'vapor cloud', 'spill', 'aerosol', 'active reaction', 'fire', 'breach',
+    'tank', 'reactor', 'synthesis', 'hazardous material', 'empty room', 'office furniture'
+]
+METADATA_VARIANTS = [{}, {'location': 'indoor warehouse'}, {'location': 'outdoor lot'},
+                     {'environment': 'indoor, ventilation running'}]
+
+@pytest.fixture(scope='module')
+def agents():
+    return HazardDetectionAgent(), MOPPRecommendationAgent()
+
+def random_scenes(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        (". ".join(rng.sample(VOCABULARY, rng.randint(0, 12))), {'metadata': rng.choice(METADATA_VARIANTS)})
+        for _ in range(count)
+    ]
+
+def test_batch_confidence_matches_calculate_confidence(agents):
+    hazard_agent, _ = agents
+    rng = random.Random(3)
+    indicator_lists = [
+        [{'confidence': rng.choice([0.7, 0.9, rng.random()]), 'weight': rng.choice([0.0, 1.0, 2.0, rng.random() * 3])}
+         for _ in range(rng.randint(0, 20))]
+        for _ in range(500)
+    ]
+
+    confidences = batch_scoring.batch_confidence(*batch_scoring.indicator_matrices(indicator_lists))
+
+    assert confidences.tolist() == [hazard_agent.calculate_confidence(indicators) for indicators in indicator_lists]
+
+def test_batch_hazard_level_matches_determine_hazard_level(agents):
+    hazard_agent, _ = agents
+    rng = random.Random(5)
+    confidence = np.array([rng.choice([0.4, 0.6, 0.8, rng.random()]) for _ in range(500)])
+    risk_factor_counts = np.array([rng.randint(0, 5) for _ in range(500)])
+
+    levels = batch_scoring.batch_hazard_level(confidence, risk_factor_counts)
+
+    assert levels.tolist() == [
+        hazard_agent.determine_hazard_level(float(value), ['risk'] * int(count))
+        for value, count in zip(confidence, risk_factor_counts)
+    ]
+
+def test_stored_results_rescore_like_score(agents):
+    hazard_agent, mopp_agent = agents
+    scenes = random_scenes(300)
+    hazard_results = [hazard_agent.score(text, scene_data) for text, scene_data in scenes]
+    mopp_results = [mopp_agent.score(text, scene_data) for text, scene_data in scenes]
+    stored = [
+        {'hazard_detector': hazard.to_dict(), 'mopp_recommender': mopp.to_dict()}
+        for hazard, mopp in zip(hazard_results, mopp_results)
+    ]
+
+    scores = rescore_stored_results(stored)
+
+    assert scores['hazard_confidence'].tolist() == [result.confidence for result in hazard_results]
+    assert scores['hazard_level'].tolist() == [result.hazard_level for result in hazard_results]
+    assert scores['mopp_level'].tolist() == [result.metadata['mopp_level'] for result in mopp_results]
+    assert scores['mopp_hazard_level'].tolist() == [result.hazard_level for result in mopp_results]
+
+def test_overall_confidence_and_consensus_match_scalar_aggregation():
+    rng = random.Random(13)
+    agent_names = agent_registry.names()
+    stored = []
+    for _ in range(500):
+        # Completion order varies from scene to scene, and so does the set of agents that reported
+        names = rng.sample(agent_names, rng.randint(1, len(agent_names)))
+        stored.append({
+            name: AgentResult(name, rng.choice([0.1, 0.7, rng.random()]), [], [], 'LOW', {}, '').to_dict()
+            for name in names
+        })
+    coordinator = AgentCoordinator()
+    analysis_service = AnalysisService.__new__(AnalysisService)
+
+    scores = rescore_stored_results(stored)
+
+    assert scores['overall_confidence'].tolist() == [
+        coordinator._calculate_overall_assessment(
+            {name: AgentResult.from_dict(data) for name, data in results.items()}
+        )['overall_confidence']
+        for results in stored
+    ]
+    assert scores['consensus_score'].tolist() == [
+        analysis_service._calculate_confidence_metrics({'agent_results': results})['consensus_score']
+        for results in stored
+    ]
+
+def test_what_if_thresholds_change_levels(agents):
+    hazard_agent, _ = agents
+    stored = [{'hazard_detector': hazard_agent.score(text, scene_data).to_dict()}
+              for text, scene_data in random_scenes(100, seed=11)]
+
+    unchanged = rescore_stored_results(stored, HAZARD_THRESHOLDS)
+    lenient = rescore_stored_results(stored, {**HAZARD_THRESHOLDS, 'CRITICAL': (0.0, -1)})
+
+    assert unchanged['hazard_level'].tolist() == [result['hazard_detector']['hazard_level'] for result in stored]
+    assert set(lenient['hazard_level'].tolist()) == {'CRITICAL'}
+
+def test_missing_agents_are_marked():
+    scores = rescore_stored_results([{}, {'sampling_strategist': {'confidence': 0.5}}])
+
+    assert scores['hazard_level'].tolist() == ['', '']
+    assert scores['mopp_level'].tolist() == [-1, -1]
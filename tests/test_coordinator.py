@@ -0,0 +1,128 @@
+"""
+Dependency-ordered agent execution, gates, deadlines, session reuse and cache keys in the coordinator
+"""
+
+import time
+
+from agents.base_agent import AgentResult, BaseAgent
+from agents.coordinator import AgentCoordinator
+from agents.registry import AgentRegistry, AgentSpec
+
+class FakeAgent(BaseAgent):
+    """Records when it ran and what it was given, after an optional delay"""
+
+    def __init__(self, name, log, delay=0.0, confidence=0.5):
+        super().__init__(name)
+        self.log = log
+        self.delay = delay
+        self.confidence = confidence
+        self.analysis_prompt = f"prompt of {name}"
+
+    def analyze(self, scene_data):
+        self.log.append(('start', self.name, sorted(scene_data['upstream_results'])))
+        time.sleep(self.delay)
+        self.log.append(('end', self.name))
+        return self.score('', scene_data)
+
+    def score(self, analysis_text, scene_data, model=None):
+        return AgentResult(self.name, self.confidence, [f"finding of {self.name}"], [], 'LOW', {}, '')
+
+def coordinator_for(specs):
+    registry = AgentRegistry()
+    for spec in specs:
+        registry.register(spec)
+    return AgentCoordinator(registry)
+
+def test_agents_run_after_their_dependencies_and_receive_their_results():
+    log = []
+    coordinator = coordinator_for([
+        AgentSpec('sampling', lambda: FakeAgent('sampling', log), inputs=(), depends_on=('hazard',)),
+        AgentSpec('hazard', lambda: FakeAgent('hazard', log, delay=0.1), inputs=()),
+        AgentSpec('mopp', lambda: FakeAgent('mopp', log, delay=0.1), inputs=())
+    ])
+
+    results, skipped = coordinator._run_agents_parallel({})
+
+    assert sorted(results) == ['hazard', 'mopp', 'sampling']
+    assert not skipped
+    assert log.index(('end', 'hazard')) < log.index(('start', 'sampling', ['hazard']))
+    # Independent agents run concurrently
+    assert log.index(('start', 'mopp', [])) < log.index(('end', 'hazard'))
+
+def test_gates_and_missing_inputs_skip_agents():
+    log = []
+    coordinator = coordinator_for([
+        AgentSpec('hazard', lambda: FakeAgent('hazard', log, confidence=0.0), inputs=()),
+        AgentSpec('sampling', lambda: FakeAgent('sampling', log), inputs=(), depends_on=('hazard',),
+                  gate=lambda upstream: 'nothing found' if upstream['hazard'].confidence == 0 else None),
+        AgentSpec('video', lambda: FakeAgent('video', log), inputs=('video_data',)),
+        AgentSpec('broken_gate', lambda: FakeAgent('broken_gate', log), inputs=(), gate=lambda upstream: 1 / 0)
+    ])
+
+    results, skipped = coordinator._run_agents_parallel({})
+
+    assert sorted(results) == ['broken_gate', 'hazard']
+    assert skipped == {'sampling': 'nothing found', 'video': 'Missing inputs: video_data'}
+
+def test_deadline_fails_stragglers_and_their_dependents():
+    log = []
+    coordinator = coordinator_for([
+        AgentSpec('slow', lambda: FakeAgent('slow', log, delay=1.0), inputs=()),
+        AgentSpec('fast', lambda: FakeAgent('fast', log), inputs=()),
+        AgentSpec('dependent', lambda: FakeAgent('dependent', log), inputs=(), depends_on=('slow',))
+    ])
+
+    start_time = time.time()
+    results, _ = coordinator._run_agents_parallel({}, deadline=time.time() + 0.2)
+
+    assert time.time() - start_time < 0.8
+    assert not results['fast'].metadata.get('error')
+    assert results['slow'].metadata['error'] == 'Deadline exceeded'
+    assert results['dependent'].metadata['error'] == 'Deadline exceeded'
+
+def test_subset_runs_take_dependencies_from_upstream():
+    log = []
+    coordinator = coordinator_for([
+        AgentSpec('hazard', lambda: FakeAgent('hazard', log), inputs=()),
+        AgentSpec('sampling', lambda: FakeAgent('sampling', log), inputs=(), depends_on=('hazard',))
+    ])
+    upstream = {'hazard': AgentResult('hazard', 0.9, [], [], 'HIGH', {}, '')}
+
+    results, _ = coordinator._run_agents_parallel({}, ['sampling'], upstream=upstream)
+
+    assert list(results) == ['sampling']
+    assert log[0] == ('start', 'sampling', ['hazard'])
+
+def test_unchanged_frames_reuse_previous_results():
+    log = []
+    coordinator = coordinator_for([AgentSpec('hazard', lambda: FakeAgent('hazard', log), inputs=())])
+    first, _ = coordinator._run_agents_parallel({'frame_hash': 'ffff0000ffff0000'})
+    previous = {name: result.to_dict() for name, result in first.items()}
+
+    # Two bits differ: the same scene
+    similar, _ = coordinator._run_agents_parallel({'frame_hash': 'ffff0000ffff0003'}, previous=previous)
+    changed, _ = coordinator._run_agents_parallel({'frame_hash': '0000ffff0000ffff'}, previous=previous)
+
+    assert similar['hazard'].metadata.get('reused')
+    assert not changed['hazard'].metadata.get('reused')
+    assert [entry for entry in log if entry[0] == 'start'] == [('start', 'hazard', [])] * 2
+
+def test_cache_signature_tracks_model_and_upstream_findings():
+    coordinator = coordinator_for([AgentSpec('hazard', lambda: FakeAgent('hazard', []), inputs=())])
+    upstream = {'mopp': AgentResult('mopp', 0.5, ['a'], [], 'LOW', {}, '')}
+    changed_upstream = {'mopp': AgentResult('mopp', 0.5, ['a', 'b'], [], 'LOW', {}, '')}
+
+    signature = coordinator._cache_signature('hazard', {'upstream_results': upstream}, 'flash')
+
+    assert signature == coordinator._cache_signature('hazard', {'upstream_results': dict(upstream)}, 'flash')
+    assert signature != coordinator._cache_signature('hazard', {'upstream_results': upstream}, 'pro')
+    assert signature != coordinator._cache_signature('hazard', {'upstream_results': changed_upstream}, 'flash')
+
+def test_agent_version_tracks_its_prompt():
+    agent = FakeAgent('hazard', [])
+    version = agent.version
+
+    agent.analysis_prompt += ' Also report labels.'
+
+    assert agent.version != version
+    assert FakeAgent('hazard', []).version == version
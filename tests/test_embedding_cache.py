@@ -0,0 +1,89 @@
+"""
+Query normalization, LRU eviction and the on-disk tier of the embedding cache
+"""
+
+import pytest
+
+from services.embedding_cache import EmbeddingCache, normalize_query
+
+def test_normalize_query():
+    assert normalize_query('  chlorine\t gas \n leak ') == 'chlorine gas leak'
+    # Compatibility forms fold to one key: full-width letters and ligatures
+    assert normalize_query('ＮＦＰＡ ﬁre diamond') == 'NFPA fire diamond'
+    assert normalize_query('Sarin Precursor') == 'Sarin Precursor'
+    assert normalize_query('Sarin Precursor', lowercase=True) == 'sarin precursor'
+
+def test_hits_and_misses():
+    cache = EmbeddingCache(max_entries=10)
+    cache.put_many('encoder', ['a', 'b'], [[1.0, 2.0], [3.0, 4.0]])
+
+    assert cache.get_many('encoder', ['a', 'c', 'b']) == [[1.0, 2.0], None, [3.0, 4.0]]
+    assert cache.get_many('other-encoder', ['a']) == [None]
+    stats = cache.get_stats()
+    assert (stats['memory_hits'], stats['misses']) == (2, 2)
+    assert stats['hit_rate'] == 0.5
+
+def test_least_recently_used_entries_are_evicted():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put_many('encoder', ['a', 'b'], [[1.0], [2.0]])
+    # Reading a makes b the least recently used
+    cache.get_many('encoder', ['a'])
+    cache.put_many('encoder', ['c'], [[3.0]])
+
+    assert cache.get_many('encoder', ['a', 'b', 'c']) == [[1.0], None, [3.0]]
+    assert cache.get_stats()['entries'] == 2
+
+def test_returned_vectors_are_copies():
+    cache = EmbeddingCache()
+    cache.put_many('encoder', ['a'], [[1.0]])
+
+    cache.get_many('encoder', ['a'])[0].append(2.0)
+
+    assert cache.get_many('encoder', ['a']) == [[1.0]]
+
+def test_disk_tier_survives_restarts(tmp_path):
+    path = str(tmp_path / 'embeddings.sqlite')
+    EmbeddingCache(disk_path=path).put_many('encoder', ['a'], [[0.5, 0.25]])
+
+    cache = EmbeddingCache(disk_path=path)
+
+    assert cache.get_many('encoder', ['a']) == [[0.5, 0.25]]
+    assert cache.get_stats()['disk_hits'] == 1
+    # Promoted to memory after the first disk hit
+    assert cache.get_many('encoder', ['a']) == [[0.5, 0.25]]
+    assert cache.get_stats()['memory_hits'] == 1
+
+def test_disk_entries_of_other_encoders_are_dropped(tmp_path):
+    path = str(tmp_path / 'embeddings.sqlite')
+    EmbeddingCache(disk_path=path).put_many('old-encoder', ['a'], [[1.0]])
+
+    EmbeddingCache(disk_path=path).get_many('new-encoder', ['a'])
+
+    assert EmbeddingCache(disk_path=path).get_many('old-encoder', ['a']) == [None]
+
+def test_clear_drops_both_tiers(tmp_path):
+    cache = EmbeddingCache(disk_path=str(tmp_path / 'embeddings.sqlite'))
+    cache.put_many('encoder', ['a'], [[1.0]])
+
+    cache.clear()
+
+    assert cache.get_many('encoder', ['a']) == [None]
+
+def test_unusable_disk_path_falls_back_to_memory(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+
+    cache = EmbeddingCache(disk_path=str(blocker / 'embeddings.sqlite'))
+    cache.put_many('encoder', ['a'], [[1.0]])
+
+    assert not cache.get_stats()['disk_enabled']
+    assert cache.get_many('encoder', ['a']) == [[1.0]]
+
+@pytest.mark.parametrize('lowercase', [False, True])
+def test_normalized_variants_share_an_entry(lowercase):
+    cache = EmbeddingCache()
+    cache.put_many('encoder', [normalize_query('Chlorine  Gas', lowercase)], [[1.0]])
+
+    found = cache.get_many('encoder', [normalize_query(' Chlorine Gas ', lowercase)])
+
+    assert found == [[1.0]]
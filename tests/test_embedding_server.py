@@ -0,0 +1,129 @@
+"""
+Socket framing, micro-batching and the client/server round trip of the shared embedding server
+"""
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services.embedding_server import EmbeddingClient, EmbeddingServer, MicroBatcher, _receive, _send
+
+class FakeEncoder:
+    """Embeds a text as [length, code of its first character, call number]"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return 3
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        if 'fail' in texts:
+            raise ValueError('cannot encode')
+        return [[len(text), ord(text[0]) if text else 0, len(self.calls)] for text in texts]
+
+def expected(texts):
+    return [[len(text), ord(text[0]) if text else 0] for text in texts]
+
+def test_frames_round_trip():
+    first, second = socket.socketpair()
+    payload = np.arange(300000, dtype=np.float32).tobytes()
+
+    # Larger than the socket buffer, so the frame arrives in several reads
+    sender = threading.Thread(target=lambda: (
+        _send(first, {'op': 'encode', 'texts': ['chlorine', 'ünïcode']}, payload), _send(first, {'op': 'info'})
+    ))
+    sender.start()
+    header, received = _receive(second)
+    sender.join()
+
+    assert header == {'op': 'encode', 'texts': ['chlorine', 'ünïcode']}
+    assert received == payload
+    assert _receive(second) == ({'op': 'info'}, b'')
+    first.close()
+    with pytest.raises(ConnectionError):
+        _receive(second)
+    second.close()
+
+def test_concurrent_requests_share_a_batch_and_get_their_own_rows():
+    encoder = FakeEncoder()
+    batcher = MicroBatcher(encoder.encode, max_batch=64, window_ms=100)
+    requests = [['a', 'bb'], ['ccc'], [], ['dddd', 'e', 'ff']]
+
+    futures = [batcher.submit(texts) for texts in requests]
+    results = [future.result(5) for future in futures]
+
+    assert len(encoder.calls) == 1
+    for texts, rows in zip(requests, results):
+        assert rows.dtype == np.float32
+        assert rows.shape == (len(texts), 3)
+        assert rows[:, :2].tolist() == expected(texts)
+    assert batcher.get_stats() == {'requests': 4, 'batches': 1, 'texts': 6, 'mean_batch_texts': 6.0}
+
+def test_batches_close_at_max_batch():
+    encoder = FakeEncoder(delay=0.05)
+    batcher = MicroBatcher(encoder.encode, max_batch=4, window_ms=50)
+
+    futures = [batcher.submit(['ab', 'cd']) for _ in range(4)]
+    for future in futures:
+        future.result(5)
+
+    assert [len(call) for call in encoder.calls] == [4, 4]
+
+def test_encoder_errors_fail_only_their_batch():
+    encoder = FakeEncoder()
+    batcher = MicroBatcher(encoder.encode, window_ms=0)
+
+    with pytest.raises(ValueError):
+        batcher.submit(['fail']).result(5)
+    assert batcher.submit(['ok']).result(5)[:, :2].tolist() == expected(['ok'])
+
+@pytest.fixture
+def server_socket():
+    # Unix socket paths are limited to about 100 characters
+    directory = tempfile.mkdtemp(prefix='emb')
+    socket_path = os.path.join(directory, 's')
+    server = EmbeddingServer(FakeEncoder(), 'fake', 'fake-minilm', socket_path, window_ms=20)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+    yield socket_path
+    shutil.rmtree(directory, ignore_errors=True)
+
+def test_client_round_trip(server_socket):
+    client = EmbeddingClient(server_socket)
+    texts = [f"query {index}" for index in range(10)]
+
+    embeddings = client.encode(texts, batch_size=4)
+
+    assert (client.model_name, client.backend, client.get_sentence_embedding_dimension()) == ('fake-minilm', 'fake', 3)
+    assert embeddings[:, :2].tolist() == expected(texts)
+    assert client.encode('single')[:2].tolist() == expected(['single'])[0]
+    assert client.encode([]).shape == (0, 3)
+    with pytest.raises(RuntimeError, match='cannot encode'):
+        client.encode(['fail'])
+
+def test_clients_on_many_threads_are_batched_together(server_socket):
+    client = EmbeddingClient(server_socket)
+    results = {}
+
+    def encode(index):
+        results[index] = client.encode([f"text {index}"])
+
+    threads = [threading.Thread(target=encode, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(results[index][0, :2].tolist() == expected([f"text {index}"])[0] for index in range(8))
+    assert client.get_stats()['batches'] < 8
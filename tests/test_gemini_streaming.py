@@ -0,0 +1,77 @@
+"""
+Streamed text generation: chunk forwarding, listener isolation and quota settlement from the stream's usage
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from services import gemini_service
+from services.gemini_service import GeminiService
+
+class FakeQuotaScheduler:
+    def __init__(self):
+        self.settled = []
+
+    def acquire(self, model, tokens, session_id=None, user_type=None, weight=None):
+        return 0.0
+
+    def settle(self, model, estimated_tokens, actual_tokens):
+        self.settled.append((model, actual_tokens))
+
+class FakeModels:
+    """Streams the given chunks, optionally failing after them"""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    def generate_content_stream(self, model, contents):
+        yield from self.chunks
+        if self.error:
+            raise self.error
+
+def chunk(text, total_tokens=None):
+    usage = SimpleNamespace(total_token_count=total_tokens) if total_tokens else None
+    return SimpleNamespace(text=text, usage_metadata=usage)
+
+@pytest.fixture
+def quota(monkeypatch):
+    scheduler = FakeQuotaScheduler()
+    monkeypatch.setattr(gemini_service, 'quota_scheduler', scheduler)
+    monkeypatch.setattr(gemini_service.model_router, 'record_latency', lambda model, seconds: None)
+    return scheduler
+
+def service(models):
+    gemini = GeminiService.__new__(GeminiService)
+    gemini.logger = gemini_service.logging.getLogger('test_gemini_streaming')
+    gemini.client = SimpleNamespace(models=models)
+    return gemini
+
+def test_chunks_are_forwarded_and_joined(quota):
+    deltas = []
+    gemini = service(FakeModels([chunk('Evacuate '), chunk(''), chunk('the block.', total_tokens=42)]))
+
+    text = gemini._generate_text('stream-model', 'summarize', on_delta=deltas.append)
+
+    assert text == 'Evacuate the block.'
+    assert deltas == ['Evacuate ', 'the block.']
+    assert quota.settled == [('stream-model', 42)]
+
+def test_a_failing_listener_does_not_abort_the_stream(quota):
+    def on_delta(text):
+        raise RuntimeError('socket closed')
+
+    gemini = service(FakeModels([chunk('one '), chunk('two', total_tokens=7)]))
+
+    assert gemini._generate_text('stream-model', 'summarize', on_delta=on_delta) == 'one two'
+
+def test_usage_is_settled_when_the_stream_fails(quota):
+    deltas = []
+    gemini = service(FakeModels([chunk('partial', total_tokens=9)], error=ValueError('bad request')))
+
+    with pytest.raises(Exception):
+        gemini._generate_text('failing-stream-model', 'summarize', on_delta=deltas.append)
+
+    assert deltas == ['partial']
+    assert quota.settled == [('failing-stream-model', 9)]
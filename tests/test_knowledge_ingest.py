@@ -0,0 +1,132 @@
+"""
+Chunking of knowledge documents and checkpointed, resumable ingestion
+"""
+
+import json
+import random
+
+import pytest
+
+from services.knowledge_ingest import KnowledgeIngestor, chunk_document, chunk_text
+
+class FakeVectorDatabase:
+    """Records written entries; fails once after fail_after batches"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.batches = []
+
+    def add_knowledge_batch(self, entries, upsert=False):
+        if self.fail_after is not None and len(self.batches) >= self.fail_after:
+            self.fail_after = None
+            raise RuntimeError('connection lost')
+        self.batches.append([entry['id'] for entry in entries])
+        return len(entries)
+
+def random_text(words, seed=1):
+    rng = random.Random(seed)
+    vocabulary = ['chlorine', 'reactor', 'precursor', 'glassware', 'ventilation', 'respirator', 'decon', 'a']
+    paragraphs = []
+    for _ in range(words // 40):
+        paragraphs.append(" ".join(rng.choice(vocabulary) for _ in range(40)))
+    return "\n\n".join(paragraphs)
+
+def test_short_text_is_one_chunk():
+    assert chunk_text('  short note  ', chunk_size=100) == ['short note']
+    assert chunk_text('   ', chunk_size=100) == []
+
+def test_chunks_are_bounded_and_cover_the_text():
+    text = random_text(2000)
+
+    chunks = chunk_text(text, chunk_size=500, overlap=100)
+
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert chunks[0] == text[:len(chunks[0])]
+    assert chunks[-1] == text[-len(chunks[-1]):]
+    # Every word survives, and no chunk starts or ends mid-word
+    words = text.split()
+    assert set(word for chunk in chunks for word in chunk.split()) == set(words)
+    for chunk in chunks:
+        assert chunk.split()[0] in words and chunk.split()[-1] in words
+
+def test_consecutive_chunks_overlap():
+    text = random_text(2000, seed=2)
+
+    chunks = chunk_text(text, chunk_size=500, overlap=100)
+
+    for first, second in zip(chunks, chunks[1:]):
+        assert second.split()[0] in first.split()[-25:]
+
+def test_text_without_separators_is_still_chunked():
+    chunks = chunk_text('x' * 1050, chunk_size=500, overlap=50)
+
+    assert [len(chunk) for chunk in chunks] == [500, 500, 150]
+
+def test_chunk_document_ids():
+    document = {'id': 'guide', 'title': 'Guide', 'content': random_text(1000), 'category': 'general', 'tags': []}
+
+    entries = chunk_document(document, chunk_size=500, overlap=50)
+    single = chunk_document({**document, 'content': 'short'}, chunk_size=500, overlap=50)
+
+    assert [entry['id'] for entry in entries] == [f"guide#{index}" for index in range(len(entries))]
+    assert all(entry['document_id'] == 'guide' and entry['chunks'] == len(entries) for entry in entries)
+    assert [entry['id'] for entry in single] == ['guide']
+
+def write_records(path, count):
+    with open(path, 'w') as f:
+        for index in range(count):
+            f.write(json.dumps({'id': f"doc{index}", 'content': f"record {index}"}) + "\n")
+        f.write("not json\n")
+
+def test_interrupted_ingestion_resumes_after_the_last_written_batch(tmp_path):
+    source = tmp_path / 'knowledge.jsonl'
+    write_records(source, 10)
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    failing = FakeVectorDatabase(fail_after=2)
+
+    with pytest.raises(RuntimeError):
+        KnowledgeIngestor(failing, batch_size=3, checkpoint_dir=checkpoint_dir).ingest(str(source))
+    database = FakeVectorDatabase()
+    progress = KnowledgeIngestor(database, batch_size=3, checkpoint_dir=checkpoint_dir).ingest(str(source))
+
+    assert failing.batches == [['doc0', 'doc1', 'doc2'], ['doc3', 'doc4', 'doc5']]
+    assert database.batches == [['doc6', 'doc7', 'doc8'], ['doc9']]
+    assert (progress['documents'], progress['chunks'], progress['resumed_from']) == (10, 10, 6)
+    assert progress['invalid_records'] == 1
+
+def test_changed_source_starts_over(tmp_path):
+    source = tmp_path / 'knowledge.jsonl'
+    write_records(source, 10)
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+
+    with pytest.raises(RuntimeError):
+        KnowledgeIngestor(FakeVectorDatabase(fail_after=1), batch_size=3, checkpoint_dir=checkpoint_dir).ingest(str(source))
+    write_records(source, 12)
+    database = FakeVectorDatabase()
+    progress = KnowledgeIngestor(database, batch_size=3, checkpoint_dir=checkpoint_dir).ingest(str(source))
+
+    assert database.batches[0] == ['doc0', 'doc1', 'doc2']
+    assert (progress['documents'], progress['resumed_from']) == (12, 0)
+
+def test_finished_ingestion_clears_its_checkpoint(tmp_path):
+    source = tmp_path / 'knowledge.jsonl'
+    write_records(source, 4)
+    checkpoint_dir = tmp_path / 'checkpoints'
+
+    KnowledgeIngestor(FakeVectorDatabase(), batch_size=3, checkpoint_dir=str(checkpoint_dir)).ingest(str(source))
+    database = FakeVectorDatabase()
+    KnowledgeIngestor(database, batch_size=3, checkpoint_dir=str(checkpoint_dir)).ingest(str(source))
+
+    assert list(checkpoint_dir.iterdir()) == []
+    assert database.batches == [['doc0', 'doc1', 'doc2'], ['doc3']]
+
+def test_directory_documents_take_their_category(tmp_path):
+    (tmp_path / 'protective_equipment').mkdir()
+    (tmp_path / 'protective_equipment' / 'mopp_levels.md').write_text('MOPP 4 means full gear')
+    (tmp_path / 'notes.txt').write_text('general note')
+
+    documents = list(KnowledgeIngestor(FakeVectorDatabase()).iter_documents(str(tmp_path)))
+
+    assert [(document['title'], document['category']) for document in documents] == [
+        ('notes', 'general'), ('mopp levels', 'protective_equipment')
+    ]
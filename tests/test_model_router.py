@@ -0,0 +1,67 @@
+"""
+Model tier selection by agent, complexity and latency budget, and escalation of uncertain results
+"""
+
+import cv2
+import numpy as np
+
+from services.model_router import FLASH_MODEL, PRO_MODEL, ModelRouter
+
+def encode(image):
+    return cv2.imencode('.png', image)[1].tobytes()
+
+def test_agents_default_to_their_tier():
+    router = ModelRouter()
+
+    assert router.select_model('hazard_detector') == FLASH_MODEL
+    assert router.select_model('synthesis_analyzer') == PRO_MODEL
+    assert router.select_model('unknown_agent') == PRO_MODEL
+
+def test_complexity_thresholds():
+    router = ModelRouter()
+
+    assert router.select_model('hazard_detector', complexity=ModelRouter.HIGH_COMPLEXITY) == PRO_MODEL
+    assert router.select_model('synthesis_analyzer', complexity=0.19) == FLASH_MODEL
+    assert router.select_model('synthesis_analyzer', complexity=ModelRouter.LOW_COMPLEXITY) == PRO_MODEL
+    assert router.select_model('hazard_detector', complexity=0.59) == FLASH_MODEL
+
+def test_tight_latency_budget_drops_to_flash():
+    router = ModelRouter()
+
+    assert router.select_model('synthesis_analyzer', latency_budget=10.0) == FLASH_MODEL
+    assert router.select_model('synthesis_analyzer', latency_budget=20.0) == PRO_MODEL
+    # The budget overrides a complexity upgrade too
+    assert router.select_model('hazard_detector', latency_budget=10.0, complexity=0.9) == FLASH_MODEL
+
+def test_budget_follows_observed_latency():
+    router = ModelRouter()
+    for _ in range(30):
+        router.record_latency(PRO_MODEL, 5.0)
+
+    assert router.expected_latency(PRO_MODEL) < 6.0
+    assert router.select_model('synthesis_analyzer', latency_budget=10.0) == PRO_MODEL
+
+def test_latency_moving_average():
+    router = ModelRouter()
+
+    router.record_latency(FLASH_MODEL, 9.0)
+
+    assert router.expected_latency(FLASH_MODEL) == ModelRouter.LATENCY_ALPHA * 9.0 + \
+        (1 - ModelRouter.LATENCY_ALPHA) * ModelRouter.DEFAULT_LATENCY[FLASH_MODEL]
+
+def test_only_uncertain_flash_results_escalate():
+    router = ModelRouter()
+
+    assert router.should_escalate(FLASH_MODEL, 0.2)
+    assert not router.should_escalate(FLASH_MODEL, 0.0)
+    assert not router.should_escalate(FLASH_MODEL, ModelRouter.ESCALATION_CONFIDENCE)
+    assert not router.should_escalate(PRO_MODEL, 0.2)
+
+def test_image_complexity_orders_blank_and_busy_scenes():
+    router = ModelRouter()
+    blank = np.full((480, 640), 128, dtype=np.uint8)
+    busy = np.random.default_rng(0).integers(0, 256, (480, 640), dtype=np.uint8)
+
+    assert router.image_complexity(encode(blank)) < ModelRouter.LOW_COMPLEXITY
+    assert router.image_complexity(encode(busy)) >= ModelRouter.HIGH_COMPLEXITY
+    assert router.image_complexity(b'not an image') is None
@@ -0,0 +1,56 @@
+"""
+Splitting multi-image answers into per-photo sections and attributing findings to photos
+"""
+
+from services.multi_image import MULTI_IMAGE_INSTRUCTIONS, attribute_findings, split_image_sections
+
+ANSWER = """
+**IMAGE 1:**
+A fume hood with laboratory glassware and a round-bottom flask.
+
+## Image 2:
+Drums of precursor chemicals by the door. More glassware on a shelf.
+
+IMAGE 1: (continued)
+A respirator on the bench.
+
+ACROSS IMAGES:
+The glassware in both photos appears to be the same set.
+"""
+
+def test_sections_are_keyed_by_image_number():
+    sections = split_image_sections(ANSWER)
+
+    assert sorted(sections) == [1, 2]
+    assert 'fume hood' in sections[1] and 'respirator' in sections[1]
+    assert 'precursor chemicals' in sections[2]
+    # The cross-image section belongs to no single photo
+    assert not any('same set' in text for text in sections.values())
+
+def test_single_image_answers_have_no_sections():
+    assert split_image_sections('A fume hood with laboratory glassware.') == {}
+    assert attribute_findings('A fume hood with glassware.', ['Equipment: glassware']) == {}
+
+def test_findings_are_attributed_by_their_indicator_term():
+    findings = [
+        'Laboratory equipment detected: glassware',
+        'Chemical indicator detected: Precursor Chemicals',
+        'Equipment detected: respirator',
+        'Indicators found: 3',
+        'Scene appears hazardous',
+        'Equipment detected: centrifuge'
+    ]
+
+    attribution = attribute_findings(ANSWER, findings)
+
+    assert attribution == {
+        'Laboratory equipment detected: glassware': [1, 2],
+        'Chemical indicator detected: Precursor Chemicals': [2],
+        'Equipment detected: respirator': [1]
+    }
+
+def test_instructions_name_every_image():
+    instructions = MULTI_IMAGE_INSTRUCTIONS.format(count=3)
+
+    assert 'Image 1 to Image 3' in instructions
+    assert 'IMAGE N:' in instructions and 'ACROSS IMAGES:' in instructions
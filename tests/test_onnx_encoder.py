@@ -0,0 +1,74 @@
+"""
+Masked mean pooling, normalization and order restoration of the ONNX embedding encoder
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from services.onnx_encoder import OnnxEmbeddingEncoder
+
+class FakeTokenizer:
+    """One token per character, padded with id 0 to the longest text of the batch"""
+
+    def __init__(self):
+        self.batches = []
+
+    def encode_batch(self, texts):
+        self.batches.append(list(texts))
+        length = max(len(text) for text in texts)
+        return [
+            SimpleNamespace(
+                ids=[ord(char) for char in text] + [0] * (length - len(text)),
+                attention_mask=[1] * len(text) + [0] * (length - len(text)),
+                type_ids=[0] * length
+            )
+            for text in texts
+        ]
+
+class FakeSession:
+    """Hidden state of each token: its id and a constant 1"""
+
+    def run(self, output_names, feeds):
+        ids = feeds['input_ids'].astype(np.float32)
+        return [np.stack([ids, np.ones_like(ids)], axis=-1)]
+
+def encoder(normalize=False):
+    onnx_encoder = OnnxEmbeddingEncoder.__new__(OnnxEmbeddingEncoder)
+    onnx_encoder.config = {'dimension': 2, 'normalize': normalize}
+    onnx_encoder.session = FakeSession()
+    onnx_encoder._input_names = {'input_ids', 'attention_mask'}
+    onnx_encoder._tokenizer = FakeTokenizer()
+    return onnx_encoder
+
+def mean_code(text):
+    return sum(ord(char) for char in text) / len(text)
+
+def test_padding_is_excluded_from_the_mean():
+    texts = ['a', 'abcdefgh', 'zz']
+
+    embeddings = encoder().encode(texts)
+
+    assert embeddings.dtype == np.float32
+    np.testing.assert_allclose(embeddings, [[mean_code(text), 1.0] for text in texts], rtol=1e-6)
+
+def test_rows_follow_input_order_across_length_sorted_batches():
+    onnx_encoder = encoder()
+    texts = ['bb', 'a', 'dddd', 'ccc', 'eeeee', 'f']
+
+    embeddings = onnx_encoder.encode(texts, batch_size=2)
+
+    # Batches group texts of similar length, longest first
+    assert onnx_encoder._tokenizer.batches == [['eeeee', 'dddd'], ['ccc', 'bb'], ['a', 'f']]
+    np.testing.assert_allclose(embeddings[:, 0], [mean_code(text) for text in texts], rtol=1e-6)
+
+def test_normalized_embeddings_have_unit_length():
+    embeddings = encoder(normalize=True).encode(['chlorine', 'x'])
+
+    np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), [1.0, 1.0], rtol=1e-6)
+
+def test_single_text_gives_one_vector():
+    embedding = encoder().encode('ab')
+
+    assert embedding.shape == (2,)
+    np.testing.assert_allclose(embedding, [mean_code('ab'), 1.0], rtol=1e-6)
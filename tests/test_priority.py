@@ -0,0 +1,96 @@
+"""
+Priority resolution, aged priority scheduling and stage-boundary yielding
+"""
+
+import threading
+import time
+
+from services.priority import Priority, PriorityExecutor, StageGate, resolve_priority
+
+def test_resolve_priority():
+    assert resolve_priority('tactical') == Priority.TACTICAL_UPLOAD
+    assert resolve_priority('tactical', live=True) == Priority.TACTICAL_LIVE
+    assert resolve_priority('command', live=True) == Priority.COMMAND
+    assert resolve_priority(None) == Priority.COMMAND
+    assert resolve_priority('batch') == Priority.BATCH
+
+def test_requested_class_may_only_lower_priority():
+    assert resolve_priority('tactical', 'batch') == Priority.BATCH
+    assert resolve_priority('command', 'tactical_live') == Priority.COMMAND
+    assert resolve_priority('tactical', 'no_such_class') == Priority.TACTICAL_UPLOAD
+
+def blocked_executor(aging_seconds):
+    """A single-worker executor held busy until the returned event is set"""
+    executor = PriorityExecutor(max_workers=1, aging_seconds=aging_seconds)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    executor.submit(Priority.TACTICAL_LIVE, block)
+    started.wait(5)
+    return executor, release
+
+def test_higher_priority_runs_first():
+    executor, release = blocked_executor(aging_seconds=60.0)
+    order = []
+    futures = [
+        executor.submit(priority, order.append, priority.name)
+        for priority in [Priority.BATCH, Priority.COMMAND, Priority.TACTICAL_LIVE, Priority.COMMAND]
+    ]
+
+    assert executor.queue_depth() == {'batch': 1, 'command': 2, 'tactical_live': 1}
+    release.set()
+    for future in futures:
+        future.result(5)
+
+    assert order == ['TACTICAL_LIVE', 'COMMAND', 'COMMAND', 'BATCH']
+
+def test_waiting_tasks_age_past_newer_higher_priority_ones():
+    executor, release = blocked_executor(aging_seconds=0.05)
+    order = []
+    futures = [executor.submit(Priority.BATCH, order.append, 'batch')]
+    # Three aging intervals lift the batch task above a fresh tactical one
+    time.sleep(0.2)
+    futures.append(executor.submit(Priority.TACTICAL_LIVE, order.append, 'live'))
+
+    release.set()
+    for future in futures:
+        future.result(5)
+
+    assert order == ['batch', 'live']
+
+def test_task_errors_reach_the_future():
+    executor = PriorityExecutor(max_workers=1)
+
+    future = executor.submit(Priority.COMMAND, int, 'x')
+
+    assert isinstance(future.exception(5), ValueError)
+
+def test_checkpoint_waits_for_higher_priority_analyses():
+    gate = StageGate(max_defer=5.0)
+    waited = []
+
+    with gate.track(Priority.TACTICAL_LIVE):
+        assert gate.get_active() == {'tactical_live': 1}
+        # Equal and higher classes pass straight through
+        assert gate.checkpoint(Priority.TACTICAL_LIVE, 'agents') < 0.1
+        thread = threading.Thread(target=lambda: waited.append(gate.checkpoint(Priority.BATCH, 'agents')))
+        thread.start()
+        time.sleep(0.1)
+        assert not waited
+    thread.join(5)
+
+    assert waited[0] >= 0.1
+    assert gate.get_active() == {}
+
+def test_checkpoint_defers_at_most_max_defer():
+    gate = StageGate(max_defer=0.1)
+
+    with gate.track(Priority.TACTICAL_LIVE):
+        waited = gate.checkpoint(Priority.COMMAND, 'synthesis')
+
+    assert 0.1 <= waited < 1.0
+    assert gate.checkpoint(None, 'synthesis') == 0.0
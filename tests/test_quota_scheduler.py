@@ -0,0 +1,111 @@
+"""
+Token estimation, usage settlement and weighted fair queuing of Gemini quota
+"""
+
+import threading
+import time
+
+import pytest
+
+from services.quota_scheduler import (
+    EXPECTED_OUTPUT_TOKENS, IMAGE_TOKENS, QuotaScheduler, QuotaTimeoutError, estimate_tokens,
+    get_request_context, request_context
+)
+
+class InlineData:
+    def __init__(self, mime_type, data):
+        self.mime_type = mime_type
+        self.data = data
+
+class Part:
+    def __init__(self, mime_type, data=b''):
+        self.inline_data = InlineData(mime_type, data)
+
+def test_estimate_tokens():
+    assert estimate_tokens('x' * 400) == EXPECTED_OUTPUT_TOKENS + 100
+    assert estimate_tokens([Part('image/jpeg'), Part('image/png'), 'x' * 40]) == \
+        EXPECTED_OUTPUT_TOKENS + 2 * IMAGE_TOKENS + 10
+    assert estimate_tokens([Part('video/mp4', b'\0' * 2 * 1024 * 1024)]) > estimate_tokens([Part('video/mp4')])
+
+def test_request_context_nests_and_resets():
+    with request_context(session_id='s1', user_type='tactical'):
+        with request_context(user_type='command'):
+            assert get_request_context() == {'session_id': 's1', 'user_type': 'command'}
+        assert get_request_context() == {'session_id': 's1', 'user_type': 'tactical'}
+    assert get_request_context() == {}
+
+def test_settle_corrects_the_token_bucket():
+    scheduler = QuotaScheduler({'model': {'rpm': 600, 'tpm': 100000}})
+    scheduler.acquire('model', 5000)
+    tokens_bucket = scheduler._buckets['model'][1]
+    level = tokens_bucket.level
+
+    scheduler.settle('model', 5000, 2000)
+    assert tokens_bucket.level == pytest.approx(level + 3000)
+    scheduler.settle('model', 1000, 4000)
+    assert tokens_bucket.level == pytest.approx(level)
+
+    # Unknown usage keeps the estimate
+    scheduler.settle('model', 5000, None)
+    assert tokens_bucket.level == pytest.approx(level)
+
+def test_unknown_models_are_not_limited():
+    scheduler = QuotaScheduler({'model': {'rpm': 1, 'tpm': 1}})
+
+    assert scheduler.acquire('other', 10 ** 9) == 0.0
+
+def test_wait_beyond_max_wait_times_out():
+    scheduler = QuotaScheduler({'model': {'rpm': 60, 'tpm': 100000}}, max_wait=0.1)
+    scheduler._buckets['model'][0].level = 0
+
+    with pytest.raises(QuotaTimeoutError):
+        scheduler.acquire('model', 100)
+
+    assert scheduler.get_stats()['models']['model']['queue_depth'] == 0
+
+def test_higher_weight_flow_overtakes_a_backlog():
+    # 600 RPM admits one request per 100ms once the bucket is drained
+    scheduler = QuotaScheduler({'model': {'rpm': 600, 'tpm': 10 ** 9}})
+    request_bucket = scheduler._buckets['model'][0]
+    request_bucket.level = -1
+    request_bucket.updated = time.monotonic()
+    admitted = []
+
+    def call(session_id, user_type):
+        scheduler.acquire('model', 100, session_id=session_id, user_type=user_type)
+        admitted.append(session_id)
+
+    threads = []
+    for session_id, user_type in [('backfill', 'command')] * 3 + [('live', 'tactical')]:
+        thread = threading.Thread(target=call, args=(session_id, user_type))
+        thread.start()
+        threads.append(thread)
+        while scheduler.get_stats()['models']['model']['queue_depth'] < len(threads):
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+
+    assert admitted == ['live', 'backfill', 'backfill', 'backfill']
+
+def test_flows_of_equal_weight_alternate():
+    scheduler = QuotaScheduler({'model': {'rpm': 600, 'tpm': 10 ** 9}})
+    request_bucket = scheduler._buckets['model'][0]
+    request_bucket.level = -1
+    request_bucket.updated = time.monotonic()
+    admitted = []
+
+    def call(session_id):
+        scheduler.acquire('model', 100, session_id=session_id, user_type='command')
+        admitted.append(session_id)
+
+    threads = []
+    for session_id in ['a', 'a', 'a', 'b', 'b']:
+        thread = threading.Thread(target=call, args=(session_id,))
+        thread.start()
+        threads.append(thread)
+        while scheduler.get_stats()['models']['model']['queue_depth'] < len(threads):
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+
+    assert admitted == ['a', 'b', 'a', 'b', 'a']
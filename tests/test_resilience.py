@@ -0,0 +1,170 @@
+"""
+Error classification, retries, hedging and circuit breaking of Gemini calls
+"""
+
+import threading
+import time
+
+import pytest
+
+from services.resilience import CircuitBreaker, CircuitOpenError, GeminiError, ResilientCaller, classify_error
+
+class StatusError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+class ReadTimeout(Exception):
+    pass
+
+def flaky(failures, error=None):
+    """A call that fails the given number of times, then returns the attempt count"""
+    attempts = []
+    def fn():
+        attempts.append(1)
+        if len(attempts) <= failures:
+            raise error or StatusError(503)
+        return len(attempts)
+    return fn, attempts
+
+def test_classify_error():
+    assert classify_error(StatusError(429)) == 'transient'
+    assert classify_error(StatusError(503)) == 'transient'
+    assert classify_error(StatusError(400)) == 'permanent'
+    assert classify_error(TimeoutError()) == 'transient'
+    assert classify_error(ReadTimeout()) == 'transient'
+    assert classify_error(ValueError('bad schema')) == 'permanent'
+    assert classify_error(GeminiError('quota', kind='quota_timeout')) == 'quota_timeout'
+
+def test_transient_errors_are_retried():
+    caller = ResilientCaller(max_attempts=3, base_delay=0.0)
+    fn, attempts = flaky(2)
+
+    assert caller.call('model', fn) == 3
+    assert caller.get_stats()['model']['circuit_state'] == 'closed'
+
+def test_retries_are_bounded():
+    caller = ResilientCaller(max_attempts=3, base_delay=0.0)
+    fn, attempts = flaky(10)
+
+    with pytest.raises(GeminiError) as error:
+        caller.call('model', fn)
+
+    assert error.value.kind == 'transient'
+    assert len(attempts) == 3
+
+def test_permanent_errors_are_not_retried():
+    caller = ResilientCaller(max_attempts=3, base_delay=0.0)
+    fn, attempts = flaky(10, error=StatusError(400))
+
+    with pytest.raises(GeminiError) as error:
+        caller.call('model', fn)
+
+    assert error.value.kind == 'permanent'
+    assert len(attempts) == 1
+    assert caller.get_stats()['model']['consecutive_failures'] == 0
+
+def test_backoff_is_jittered_within_the_cap():
+    caller = ResilientCaller(base_delay=0.5, max_delay=2.0)
+
+    delays = [caller._backoff_delay(attempt) for attempt in range(1, 6) for _ in range(50)]
+
+    assert all(0.0 <= delay <= 2.0 for delay in delays)
+    assert all(caller._backoff_delay(1) <= 0.5 for _ in range(50))
+
+def test_breaker_opens_at_threshold_and_probes_after_reset():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert breaker.state == 'half_open'
+    # Only one probe is admitted, and its failure reopens the breaker
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+def test_open_circuit_fails_fast():
+    caller = ResilientCaller(max_attempts=1, failure_threshold=1, reset_timeout=60.0)
+    fn, attempts = flaky(10)
+
+    with pytest.raises(GeminiError):
+        caller.call('model', fn)
+    with pytest.raises(CircuitOpenError):
+        caller.call('model', fn)
+    with pytest.raises(CircuitOpenError):
+        caller.call_once('model', fn)
+
+    assert len(attempts) == 1
+
+def test_call_once_does_not_retry():
+    caller = ResilientCaller(max_attempts=3, base_delay=0.0)
+    fn, attempts = flaky(1)
+
+    with pytest.raises(GeminiError) as error:
+        caller.call_once('model', fn)
+
+    assert error.value.kind == 'transient'
+    assert len(attempts) == 1
+
+def test_no_hedging_without_enough_latency_samples():
+    caller = ResilientCaller(hedge_enabled=True)
+    for _ in range(19):
+        caller._record_latency('model', 0.01)
+
+    assert caller._hedge_delay('model') is None
+
+def test_hedge_delay_is_the_latency_percentile():
+    caller = ResilientCaller(hedge_enabled=True, hedge_percentile=0.95)
+    for index in range(100):
+        caller._record_latency('model', index / 100)
+
+    assert caller._hedge_delay('model') == 0.95
+
+def test_slow_call_is_hedged_and_the_faster_request_wins():
+    caller = ResilientCaller(hedge_enabled=True, hedge_percentile=0.5)
+    for _ in range(20):
+        caller._record_latency('model', 0.02)
+    calls = []
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            calls.append(1)
+            first = len(calls) == 1
+        # The primary stalls; the hedge answers quickly
+        time.sleep(1.0 if first else 0.0)
+        return 'primary' if first else 'hedge'
+
+    start_time = time.time()
+    assert caller.call('model', fn) == 'hedge'
+    assert time.time() - start_time < 0.5
+    assert len(calls) == 2
+
+def test_failed_hedge_falls_back_to_the_other_request():
+    caller = ResilientCaller(hedge_enabled=True, hedge_percentile=0.5)
+    for _ in range(20):
+        caller._record_latency('model', 0.02)
+    calls = []
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            calls.append(1)
+            first = len(calls) == 1
+        if not first:
+            raise StatusError(503)
+        time.sleep(0.1)
+        return 'primary'
+
+    assert caller.call('model', fn) == 'primary'
@@ -0,0 +1,69 @@
+"""
+Perceptual frame hashing, change detection and the rolling session summary
+"""
+
+import cv2
+import numpy as np
+
+from services.session_context import (
+    FRAME_CHANGE_BITS, SessionContextStore, frame_changed, frame_distance, frame_hash, scene_hash
+)
+
+def photo(seed=0, width=640, height=480):
+    image = np.random.default_rng(seed).integers(0, 256, (height // 32, width // 32), dtype=np.uint8)
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_CUBIC)
+
+def encode(image, extension='.png', params=()):
+    return cv2.imencode(extension, image, list(params))[1].tobytes()
+
+def test_hash_is_64_bits_of_hex():
+    digest = frame_hash(encode(photo()))
+
+    assert len(digest) == 16
+    int(digest, 16)
+    assert frame_hash(None) is None
+    assert frame_hash(b'not an image') is None
+
+def test_recompressed_rescaled_and_brightened_frames_are_unchanged():
+    image = photo()
+    original = frame_hash(encode(image))
+    variants = [
+        encode(image, '.jpg', [cv2.IMWRITE_JPEG_QUALITY, 60]),
+        encode(cv2.resize(image, (320, 240), interpolation=cv2.INTER_AREA)),
+        encode(cv2.convertScaleAbs(image, alpha=1.0, beta=20))
+    ]
+
+    for variant in variants:
+        assert frame_distance(original, frame_hash(variant)) <= FRAME_CHANGE_BITS
+        assert not frame_changed(original, frame_hash(variant))
+
+def test_different_scenes_are_changed():
+    assert frame_changed(frame_hash(encode(photo(1))), frame_hash(encode(photo(2))))
+
+def test_frames_without_a_hash_count_as_changed():
+    assert frame_changed(None, frame_hash(encode(photo())))
+    assert frame_distance(None, None) is None
+
+def test_scene_hashes_compare_photo_by_photo():
+    first, second, other = encode(photo(1)), encode(photo(2)), encode(photo(3))
+
+    assert not frame_changed(scene_hash([first, second]), scene_hash([first, second]))
+    # One changed photo changes the scene, as does a different number of photos
+    assert frame_changed(scene_hash([first, second]), scene_hash([first, other]))
+    assert frame_changed(scene_hash([first, second]), scene_hash([first]))
+    assert scene_hash([first, b'not an image']) is None
+
+def test_summary_keeps_the_latest_new_findings():
+    store = SessionContextStore(max_findings=3)
+    key_findings = store._merge_findings([], {'hazard_detector': {'findings': ['drums', 'glassware']}}, 1)
+    key_findings = store._merge_findings(key_findings, {
+        'hazard_detector': {'findings': ['glassware', 'vapor']},
+        'mopp_recommender': {'findings': ['respirators']}
+    }, 2)
+
+    assert [(item['finding'], item['frame']) for item in key_findings] == [
+        ('glassware', 1), ('vapor', 2), ('respirators', 2)
+    ]
+    summary = store._build_summary(2, {'threat_level': 'HIGH'}, key_findings)
+    assert 'Frames analyzed: 2' in summary and 'Session threat level: HIGH' in summary
+    assert '- vapor (frame 2)' in summary
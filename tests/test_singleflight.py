@@ -0,0 +1,95 @@
+"""
+Coalescing of concurrent calls and short-lived result reuse
+"""
+
+import threading
+import time
+
+import pytest
+
+from services.singleflight import SingleFlight
+
+def run_concurrently(flights, key, fn, count):
+    """Call flights.do from count threads once the first call is in flight"""
+    results = []
+    errors = []
+
+    def call():
+        try:
+            results.append(flights.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    while not flights.in_flight(key):
+        time.sleep(0.001)
+    followers = [threading.Thread(target=call) for _ in range(count - 1)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader] + followers:
+        thread.join()
+    return results, errors
+
+def test_concurrent_callers_share_one_computation():
+    flights = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'result'
+
+    results, errors = run_concurrently(flights, 'scene', fn, 5)
+
+    assert results == ['result'] * 5
+    assert not errors
+    assert len(calls) == 1
+    assert not flights.in_flight('scene')
+
+def test_errors_reach_every_caller_and_are_not_cached():
+    flights = SingleFlight(result_ttl=60.0)
+
+    def fn():
+        time.sleep(0.1)
+        raise RuntimeError('analysis failed')
+
+    results, errors = run_concurrently(flights, 'scene', fn, 3)
+
+    assert not results
+    assert [str(error) for error in errors] == ['analysis failed'] * 3
+    assert flights.get('scene') is None
+    assert flights.do('scene', lambda: 'retried') == 'retried'
+
+def test_results_are_reused_within_the_ttl():
+    flights = SingleFlight(result_ttl=0.1)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return len(calls)
+
+    assert flights.do('scene', fn) == 1
+    assert flights.do('scene', fn) == 1
+    assert flights.get('scene') == 1
+
+    time.sleep(0.15)
+    assert flights.get('scene') is None
+    assert flights.do('scene', fn) == 2
+
+def test_without_ttl_results_are_not_kept():
+    flights = SingleFlight()
+
+    assert flights.do('scene', lambda: 1) == 1
+    assert flights.get('scene') is None
+    assert flights.do('scene', lambda: 2) == 2
+
+def test_keys_are_independent():
+    flights = SingleFlight(result_ttl=60.0)
+
+    assert flights.do(('session', 'a'), lambda: 'a') == 'a'
+    assert flights.do(('session', 'b'), lambda: 'b') == 'b'
+
+    with pytest.raises(ValueError):
+        flights.do(('session', 'c'), lambda: int('x'))
+    assert flights.get(('session', 'a')) == 'a'
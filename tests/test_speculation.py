@@ -0,0 +1,110 @@
+"""
+Claiming, expiry and cancellation of speculative work
+"""
+
+import threading
+import time
+
+import pytest
+
+from services.speculation import SpeculationCancelledError, SpeculativeRunner
+
+def test_claimed_work_hands_over_its_result():
+    runner = SpeculativeRunner(window=5.0)
+    release = threading.Event()
+
+    assert runner.start('scene', lambda: release.wait(5) and 'result')
+    assert not runner.start('scene', lambda: 'duplicate')
+
+    speculation = runner.claim('scene')
+    release.set()
+
+    assert speculation.wait() == 'result'
+    assert runner.claim('scene') is None
+    assert runner.get_stats() == {'started': 1, 'claimed': 1, 'pending': 0}
+
+def test_errors_reach_the_claimer():
+    runner = SpeculativeRunner(window=5.0)
+    runner.start('scene', lambda: int('x'))
+
+    with pytest.raises(ValueError):
+        runner.claim('scene').wait()
+
+def test_expired_work_cannot_be_claimed():
+    runner = SpeculativeRunner(window=0.05)
+    runner.start('scene', lambda: 'result')
+
+    time.sleep(0.1)
+
+    assert runner.claim('scene') is None
+    assert runner.get_stats()['pending'] == 0
+
+def test_pending_until_claimed():
+    runner = SpeculativeRunner(window=5.0)
+    observed = []
+    claimed = threading.Event()
+
+    def work():
+        observed.append(runner.pending())
+        claimed.wait(5)
+        observed.append(runner.pending())
+
+    assert not runner.pending()
+    runner.start('scene', work)
+    while not observed:
+        time.sleep(0.001)
+    speculation = runner.claim('scene')
+    claimed.set()
+    speculation.wait()
+
+    assert observed == [True, False]
+
+def test_await_claim_returns_once_claimed():
+    runner = SpeculativeRunner(window=5.0)
+
+    def work():
+        runner.await_claim()
+        return 'stored'
+
+    runner.start('scene', work)
+    time.sleep(0.05)
+    start_time = time.time()
+
+    assert runner.claim('scene').wait() == 'stored'
+    assert time.time() - start_time < 1.0
+
+def test_await_claim_cancels_unclaimed_work_at_expiry():
+    runner = SpeculativeRunner(window=0.1)
+    stored = []
+
+    def work():
+        runner.await_claim()
+        stored.append(1)
+
+    runner.start('scene', work)
+    time.sleep(0.3)
+
+    assert not stored
+    assert runner.claim('scene') is None
+    assert runner.get_stats()['cancelled'] == 1
+
+def test_check_cancels_only_expired_unclaimed_work():
+    runner = SpeculativeRunner(window=0.05)
+    outcomes = []
+
+    def work():
+        runner.check()
+        time.sleep(0.1)
+        try:
+            runner.check()
+        except SpeculationCancelledError:
+            outcomes.append('cancelled')
+            raise
+
+    runner.start('scene', work)
+    time.sleep(0.3)
+
+    assert outcomes == ['cancelled']
+    # Outside speculative work there is nothing to cancel or await
+    runner.check()
+    runner.await_claim()
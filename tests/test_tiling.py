@@ -0,0 +1,112 @@
+"""
+Tile grid, cache reuse across edited images, coordinate mapping, duplicate merging and the scan deadline
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from services.tiling import TileCache, TiledImageAnalyzer, merge_tile_findings
+
+class FakeGeminiService:
+    """Reports one finding in the middle of every tile, optionally after a delay"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.scanned = 0
+        self._lock = threading.Lock()
+
+    def analyze_image_tile(self, tile_data, model):
+        with self._lock:
+            self.scanned += 1
+        time.sleep(self.delay)
+        return [{'description': 'drum', 'category': 'container', 'box': [0.25, 0.25, 0.75, 0.75], 'confidence': 0.8}]
+
+def photo(width, height, seed=0):
+    image = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(image, (0, 0), 2)
+
+def encode(image):
+    return cv2.imencode('.png', image)[1].tobytes()
+
+def finding(category, box, confidence):
+    return {'description': category, 'category': category, 'box': box, 'confidence': confidence}
+
+def test_tile_offsets_cover_the_axis():
+    analyzer = TiledImageAnalyzer(FakeGeminiService(), TileCache(), tile_size=1024, overlap=128)
+
+    assert analyzer._tile_offsets(1024) == [0]
+    assert analyzer._tile_offsets(1025) == [0, 896]
+    assert analyzer._tile_offsets(3000) == [0, 896, 1792, 2688]
+    assert analyzer._tile_offsets(3000, factor=2) == [0, 1792]
+
+def test_downscale_keeps_the_tile_count_within_max_tiles():
+    analyzer = TiledImageAnalyzer(FakeGeminiService(), TileCache(), tile_size=256, overlap=32, max_tiles=4)
+
+    tiles, image_size, scale = analyzer.split(encode(photo(1200, 800)))
+
+    assert image_size == (1200, 800)
+    assert scale == 0.25
+    assert len(tiles) <= 4
+    # Tiles cover the whole image in original pixels
+    assert max(tile.x + tile.width for tile in tiles) == 1200
+    assert max(tile.y + tile.height for tile in tiles) == 800
+
+def test_unchanged_regions_hit_the_cache_after_an_edge_crop():
+    cache = TileCache()
+    gemini_service = FakeGeminiService()
+    analyzer = TiledImageAnalyzer(gemini_service, cache, tile_size=256, overlap=32, max_tiles=16)
+    image = photo(900, 700)
+
+    analyzer.start(encode(image)).result()
+    scanned = gemini_service.scanned
+    cropped = analyzer.start(encode(image[:, :-100])).result()
+
+    assert cropped['cached_tiles'] > 0
+    assert gemini_service.scanned - scanned == cropped['tiles'] - cropped['cached_tiles']
+
+def test_findings_map_to_original_coordinates():
+    analyzer = TiledImageAnalyzer(FakeGeminiService(), TileCache(), tile_size=256, overlap=0, max_tiles=16)
+
+    result = analyzer.start(encode(photo(512, 256))).result()
+
+    assert result['tiles'] == 2
+    assert sorted(finding['box'] for finding in result['findings']) == [[64, 64, 192, 192], [320, 64, 448, 192]]
+
+def test_merge_keeps_the_most_confident_duplicate():
+    findings = [
+        finding('container', [100, 100, 200, 200], 0.6),
+        finding('container', [110, 105, 205, 200], 0.9),
+        finding('label', [110, 105, 205, 200], 0.5),
+        finding('container', [300, 300, 400, 400], 0.4),
+        # A small box inside a larger one is the same object seen from a tile edge
+        finding('container', [120, 120, 150, 150], 0.3)
+    ]
+
+    merged = merge_tile_findings(findings)
+
+    assert [(item['category'], item['confidence']) for item in merged] == [
+        ('container', 0.9), ('label', 0.5), ('container', 0.4)
+    ]
+
+def test_tiles_missing_the_deadline_are_counted_as_failed():
+    analyzer = TiledImageAnalyzer(FakeGeminiService(delay=1.0), TileCache(), tile_size=256, overlap=0)
+
+    start_time = time.time()
+    result = analyzer.start(encode(photo(512, 256, seed=1))).result(deadline=time.time() + 0.1)
+
+    assert time.time() - start_time < 0.8
+    assert result['failed_tiles'] == 2
+    assert result['findings'] == []
+
+def test_should_tile():
+    analyzer = TiledImageAnalyzer(FakeGeminiService(), TileCache(), tile_size=256, min_side=1000)
+    small, large = encode(photo(600, 400)), encode(photo(1200, 400))
+
+    assert not analyzer.should_tile(small)
+    assert analyzer.should_tile(large)
+    assert analyzer.should_tile(small, requested=True)
+    assert not analyzer.should_tile(large, requested=False)
+    assert not analyzer.should_tile(b'not an image')
@@ -0,0 +1,61 @@
+"""
+Frame triage metrics and the reject / downgrade / full decision
+"""
+
+import cv2
+import numpy as np
+
+from services.triage import DOWNGRADE, FULL, REJECT, FrameTriage
+
+def encode(image):
+    return cv2.imencode('.png', image)[1].tobytes()
+
+def scene(seed=0):
+    """A synthetic frame with shapes, text and texture"""
+    rng = np.random.default_rng(seed)
+    image = rng.integers(60, 190, (480, 640), dtype=np.uint8)
+    for _ in range(20):
+        x, y = (int(value) for value in rng.integers(0, 600, 2))
+        cv2.rectangle(image, (x, y % 440), (x + 40, y % 440 + 40), int(rng.integers(0, 256)), 2)
+    cv2.putText(image, 'UN 1017 CHLORINE', (40, 240), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 255, 3)
+    return image
+
+METRICS = {'blur': 400.0, 'brightness': 0.5, 'clipped_fraction': 0.02, 'entropy': 7.0, 'edge_density': 0.08}
+
+def test_decide_thresholds():
+    triage = FrameTriage()
+
+    assert triage.decide(METRICS) == (FULL, [])
+    assert triage.decide({**METRICS, 'entropy': 1.0})[0] == REJECT
+    assert triage.decide({**METRICS, 'clipped_fraction': 0.95})[0] == REJECT
+    # Blur alone only downgrades; blur without any edges rejects
+    assert triage.decide({**METRICS, 'blur': 5.0})[0] == DOWNGRADE
+    assert triage.decide({**METRICS, 'blur': 5.0, 'edge_density': 0.001})[0] == REJECT
+    assert triage.decide({**METRICS, 'edge_density': 0.001})[0] == DOWNGRADE
+
+def test_classifier_relevance_thresholds():
+    triage = FrameTriage(relevance_min=0.2)
+
+    assert triage.decide({**METRICS, 'relevance': 0.5})[0] == FULL
+    assert triage.decide({**METRICS, 'relevance': 0.15})[0] == DOWNGRADE
+    assert triage.decide({**METRICS, 'relevance': 0.05})[0] == REJECT
+
+def test_every_reason_is_reported():
+    _, reasons = FrameTriage().decide({**METRICS, 'entropy': 1.0, 'clipped_fraction': 0.95})
+
+    assert len(reasons) == 2
+
+def test_assess_scores_real_frames():
+    triage = FrameTriage()
+    blank = np.zeros((480, 640), dtype=np.uint8)
+    blurred = cv2.GaussianBlur(scene(), (0, 0), 12)
+
+    assert triage.assess(encode(scene()))['decision'] == FULL
+    assert triage.assess(encode(blank))['decision'] == REJECT
+    assert triage.assess(encode(blurred))['decision'] == REJECT
+    assert triage.get_stats()['decisions'][FULL] == 1
+
+def test_frames_that_cannot_be_triaged_pass_through():
+    assert FrameTriage().assess(b'not an image') is None
+    assert FrameTriage().assess(None) is None
+    assert FrameTriage(enabled=False).assess(encode(scene())) is None
@@ -0,0 +1,180 @@
+"""
+Static query precomputation and its invalidation, and cached query embeddings in the vector database
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services import vector_db
+from services.embedding_cache import EmbeddingCache
+from services.vector_db import AGENT_QUERIES, VectorDatabase
+
+class FakeEncoder:
+    """Letter-frequency embeddings; counts the texts it encodes"""
+
+    model_name = 'fake-letters'
+    tokenizer = None
+
+    def __init__(self):
+        self.encoded = []
+
+    def get_sentence_embedding_dimension(self):
+        return 26
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.encoded.extend(texts)
+        vectors = np.zeros((len(texts), 26), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for char in text.lower():
+                if 'a' <= char <= 'z':
+                    vectors[row, ord(char) - ord('a')] += 1
+        return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+class FakeCollection:
+    """In-memory collection answering queries by Euclidean distance"""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = {}
+        self.queries = 0
+        self.query_hook = None
+
+    def count(self):
+        return len(self.rows)
+
+    def add(self, ids, embeddings, metadatas, documents):
+        for row in zip(ids, embeddings, metadatas, documents):
+            self.rows[row[0]] = row
+
+    upsert = add
+
+    def query(self, query_embeddings, n_results):
+        self.queries += 1
+        if self.query_hook:
+            self.query_hook()
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for embedding in query_embeddings:
+            nearest = sorted(
+                (float(np.linalg.norm(np.subtract(row[1], embedding))), row) for row in self.rows.values()
+            )[:n_results]
+            results['ids'].append([row[0] for _, row in nearest])
+            results['metadatas'].append([row[2] for _, row in nearest])
+            results['documents'].append([row[3] for _, row in nearest])
+            results['distances'].append([distance for distance, _ in nearest])
+        return results
+
+class FakeClient:
+    def __init__(self, settings=None):
+        self.collections = {}
+
+    def get_collection(self, name):
+        return self.collections[name]
+
+    def create_collection(self, name):
+        return self.collections.setdefault(name, FakeCollection(name))
+
+@pytest.fixture
+def database(monkeypatch, tmp_path):
+    monkeypatch.setattr(vector_db.chromadb, 'Client', FakeClient)
+    monkeypatch.setattr(vector_db, 'connect_embedding_server', lambda: None)
+    monkeypatch.setattr(vector_db, 'load_local_encoder', lambda: (FakeEncoder(), 'fake'))
+    monkeypatch.setattr(vector_db, 'embedding_cache', EmbeddingCache())
+    monkeypatch.setattr(vector_db, 'KNOWLEDGE_VERSION_FILE', str(tmp_path / 'knowledge_version'))
+    return VectorDatabase()
+
+def collections(database):
+    return [database.chemvio_collection, database.tactical_collection, database.hazmat_collection]
+
+def query_count(database):
+    return sum(collection.queries for collection in collections(database))
+
+STATIC_QUERY = AGENT_QUERIES['mopp_recommender'][0]
+
+def test_static_queries_are_served_from_memory(database):
+    queries = query_count(database)
+
+    results = database.search_knowledge(STATIC_QUERY, limit=2)
+
+    assert query_count(database) == queries
+    assert results == database._search_collections([STATIC_QUERY], None, 2)[0]
+    assert database.get_static_context_stats()['hits'] == 1
+
+def test_larger_limits_and_other_queries_are_searched(database):
+    queries = query_count(database)
+
+    database.search_knowledge(STATIC_QUERY, limit=10)
+    database.search_knowledge('vapor cloud near the loading dock', limit=2)
+
+    assert query_count(database) == queries + 6
+    assert database.get_static_context_stats()['hits'] == 0
+
+def test_local_writes_invalidate_static_results(database):
+    version = database.get_static_context_stats()['knowledge_version']
+    database.add_knowledge({'id': 'new', 'content': STATIC_QUERY, 'category': 'protective_equipment'})
+
+    results = database.search_knowledge(STATIC_QUERY, limit=2)
+
+    assert results[0]['id'] == 'new'
+    assert database.get_static_context_stats()['knowledge_version'] == version + 1
+
+def test_writes_by_other_processes_invalidate_static_results(database):
+    # Another process upserts an existing id, which leaves the collection sizes unchanged
+    entry_id, embedding, metadata, _ = next(iter(database.hazmat_collection.rows.values()))
+    database.hazmat_collection.upsert([entry_id], [database._encode_batch([STATIC_QUERY])[0]], [metadata],
+                                      ['rewritten'])
+    stat = os.stat(vector_db.KNOWLEDGE_VERSION_FILE)
+    os.utime(vector_db.KNOWLEDGE_VERSION_FILE, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    results = database.search_knowledge(STATIC_QUERY, limit=2)
+
+    assert results[0]['content'] == 'rewritten'
+
+def test_size_changes_are_noticed_at_the_recheck_interval(database, monkeypatch):
+    monkeypatch.setattr(vector_db, 'STATIC_CONTEXT_RECHECK_SECONDS', 0.0)
+    embedding = database._encode_batch([STATIC_QUERY])[0]
+    # A writer that does not touch the version file
+    database.hazmat_collection.add(['external'], [embedding], [{'title': 'external'}], ['external'])
+
+    results = database.search_knowledge(STATIC_QUERY, limit=2)
+
+    assert results[0]['id'] == 'external'
+
+def test_searches_do_not_wait_for_a_refresh(database):
+    refreshing = threading.Event()
+    release = threading.Event()
+    refresh_thread = []
+
+    def block_refresh():
+        if threading.current_thread() in refresh_thread:
+            refreshing.set()
+            release.wait(5)
+
+    for collection in collections(database):
+        collection.query_hook = block_refresh
+    database.add_knowledge({'id': 'new', 'content': 'fresh guidance', 'category': 'biosafety'})
+    thread = threading.Thread(target=database.search_knowledge, args=(STATIC_QUERY,))
+    refresh_thread.append(thread)
+    thread.start()
+    refreshing.wait(5)
+
+    start_time = time.time()
+    results = database.search_knowledge(STATIC_QUERY, limit=2)
+    elapsed = time.time() - start_time
+    release.set()
+    thread.join(5)
+
+    assert elapsed < 1.0
+    assert results == database._search_collections([STATIC_QUERY], None, 2)[0]
+
+def test_query_embeddings_are_cached_by_normalized_text(database):
+    database.encoder.encoded.clear()
+
+    database.search_knowledge_batch(['Chlorine  leak', ' Chlorine leak ', 'chlorine leak'], limit=1)
+    database.search_knowledge('Chlorine leak', limit=1)
+
+    # Case is kept for cased tokenizers
+    assert database.encoder.encoded == ['Chlorine leak', 'chlorine leak']